@@ -4,24 +4,35 @@ import pytest
 
 
 def pytest_addoption(parser):
-    """Add an argument to run the download and integrate tests."""
+    """Add arguments to run the download, integrate and benchmark tests."""
     parser.addoption("--runvcr", action="store_true", default=False, help="run VCR")
+    parser.addoption(
+        "--runbenchmark",
+        action="store_true",
+        default=False,
+        help="run benchmarks",
+    )
 
 
 def pytest_configure(config):
-    """Marker to tell VCR tests to run."""
+    """Markers to tell VCR and benchmark tests to run."""
     config.addinivalue_line("markers", "runvcr: mark test to run vcr")
+    config.addinivalue_line("markers", "benchmark: mark test as a benchmark")
 
 
 def pytest_collection_modifyitems(config, items):
-    """Ensure tests only run if --runvcr flag is supplied."""
-    if config.getoption("--runvcr"):
-        # --runvcr given in cli: will run vcr tests
-        return
-    run_vcr = pytest.mark.skip(reason="need --runvcr option to run")
+    """Ensure tests only run if their flag is supplied."""
+    skip_dict = {}
+    if not config.getoption("--runvcr"):
+        skip_dict["runvcr"] = pytest.mark.skip(reason="need --runvcr option to run")
+    if not config.getoption("--runbenchmark"):
+        skip_dict["benchmark"] = pytest.mark.skip(
+            reason="need --runbenchmark option to run"
+        )
     for item in items:
-        if "runvcr" in item.keywords:
-            item.add_marker(run_vcr)
+        for keyword, marker in skip_dict.items():
+            if keyword in item.keywords:
+                item.add_marker(marker)
 
 
 @pytest.fixture(scope="module")
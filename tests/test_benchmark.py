@@ -0,0 +1,185 @@
+import hashlib
+import json
+import random
+import time
+import tracemalloc
+from importlib import import_module
+from pathlib import Path
+
+import pytest
+
+from warn_transformer import benchmark, integrate
+from warn_transformer.schema import FastSchemaLoader, WarnNotice, WarnNoticeSchema
+
+RAW_DIR = Path(__file__).parent / "data" / "raw"
+
+
+def get_synthetic_rows(count: int, seed: int = 0) -> list[dict]:
+    """Create a list of fake integrated records spread across many sources."""
+    rng = random.Random(seed)
+    postal_code_list = [f"{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(50)]
+    return [
+        dict(
+            hash_id=hashlib.sha224(str(i).encode("utf-8")).hexdigest(),
+            postal_code=rng.choice(postal_code_list),
+            company=f"Company {i}",
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("count", [10_000, 100_000, 1_000_000])
+def test_get_changed_data(count):
+    """Benchmark change detection against a current dataset of the same size."""
+    current_list = get_synthetic_rows(count)
+    # Replace five percent of the records with new ones
+    new_list = current_list[: int(count * 0.95)] + get_synthetic_rows(
+        count - int(count * 0.95), seed=1
+    )
+    for i, row in enumerate(new_list[int(count * 0.95) :]):
+        row["hash_id"] = hashlib.sha224(f"new-{i}".encode("utf-8")).hexdigest()
+    current_by_source = integrate.regroup_by_source(current_list)
+    new_by_source = integrate.regroup_by_source(new_list)
+
+    start = time.perf_counter()
+    changed_by_source = integrate.get_changed_data(new_by_source, current_by_source)
+    elapsed = time.perf_counter() - start
+
+    changed_count = len(integrate.flatten_grouped_data(changed_by_source))
+    assert changed_count == count - int(count * 0.95)
+    print(f"get_changed_data: {count:,} rows in {elapsed:.3f}s")
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("source", ["ca", "il"])
+def test_field_getters(source):
+    """Benchmark pulling raw values with compiled getters against dynamic dispatch."""
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformer = module.Transformer(RAW_DIR)
+    row_list = transformer.prep_row_list(transformer.raw_data)
+
+    start = time.perf_counter()
+    dynamic_list = [
+        [transformer.get_raw_value(r, m) for m in transformer.fields.values()]
+        for r in row_list
+    ]
+    dynamic_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    getter_list = transformer._field_getters.values()
+    compiled_list = [[g(r) for g in getter_list] for r in row_list]
+    compiled_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for r in row_list:
+        transformer.transform_row(r)
+    transform_elapsed = time.perf_counter() - start
+
+    assert dynamic_list == compiled_list
+    print(
+        f"{source.upper()} field getters: {len(row_list):,} rows, "
+        f"dynamic {dynamic_elapsed:.4f}s, compiled {compiled_elapsed:.4f}s, "
+        f"transform_row {len(row_list) / transform_elapsed:,.0f} rows/s"
+    )
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("source", ["ca", "il"])
+def test_schema_load(source):
+    """Benchmark validating rows one schema at a time, in a batch and with the fast loader."""
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformer = module.Transformer(RAW_DIR)
+    row_list = [
+        transformer.transform_row(r)
+        for r in transformer.prep_row_list(transformer.raw_data)
+    ]
+
+    start = time.perf_counter()
+    per_row_list = [WarnNoticeSchema().load(r) for r in row_list]
+    per_row_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_list = WarnNoticeSchema(many=True).load(row_list)
+    batch_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_list = FastSchemaLoader(WarnNoticeSchema(), many=True).load(row_list)
+    fast_elapsed = time.perf_counter() - start
+
+    assert per_row_list == batch_list == fast_list
+    print(
+        f"{source.upper()} schema load: {len(row_list):,} rows, "
+        f"per row {per_row_elapsed:.4f}s, batch {batch_elapsed:.4f}s, "
+        f"fast {fast_elapsed:.4f}s"
+    )
+
+
+@pytest.mark.benchmark
+def test_warn_notice_memory():
+    """Benchmark the memory and speed of WarnNotice records against plain dictionaries."""
+    count = 1_000_000
+    row = dict(
+        hash_id="0" * 56,
+        postal_code="CA",
+        company="Company",
+        location="Location",
+        notice_date="2021-10-20",
+        effective_date="2021-10-20",
+        jobs=1,
+        is_temporary=None,
+        is_closure=None,
+        is_amendment=False,
+    )
+
+    result_dict = {}
+    for name, factory in [("dict", dict), ("WarnNotice", WarnNotice)]:
+        start = time.perf_counter()
+        row_list = [factory(**row) for _ in range(count)]
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for r in row_list:
+            r["hash_id"]
+        read_elapsed = time.perf_counter() - start
+        del row_list
+
+        # Measure memory on a separate pass, since tracing slows everything down
+        tracemalloc.start()
+        row_list = [factory(**row) for _ in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        result_dict[name] = size
+        print(
+            f"{name}: {count:,} records, {size / 1024 / 1024:,.1f} MiB, "
+            f"created in {elapsed:.3f}s, read in {read_elapsed:.3f}s"
+        )
+        del row_list
+
+    assert result_dict["WarnNotice"] < result_dict["dict"]
+
+
+def test_benchmark_runner(tmp_path):
+    """Test that the benchmark runner saves results that can be compared."""
+    output_path = benchmark.run(
+        tmp_path / "benchmark.json",
+        RAW_DIR,
+        scale=0.1,
+        source="ny",
+        integrate_counts=[100],
+        repeat=1,
+    )
+    result_list = json.loads(output_path.read_text())["results"]
+    assert {r["name"] for r in result_list} == {
+        "transform_date",
+        "transform_jobs",
+        "get_hash_id",
+        "schema_load",
+        "transform",
+        "transform_sources",
+        "get_changed_data",
+        "get_likely_ancestor",
+    }
+    comparison_list = benchmark.compare(output_path, output_path)
+    assert len(comparison_list) == len(result_list)
+    assert all(c["speedup"] == 1 for c in comparison_list)
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# The most time importing the command-line interface should take, in microseconds.
+# It takes about 50ms on a laptop. The budget leaves room for slow CI machines,
+# while still catching a heavy dependency being imported at startup again.
+IMPORT_TIME_BUDGET = 250_000
+
+# The dependencies that should only be loaded by the commands that need them
+HEAVY_MODULES = ("bln", "jellyfish", "marshmallow", "requests")
+
+
+def get_import_times(code: str, **env: str) -> dict:
+    """Run some code in a fresh interpreter and time every import it makes."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, **env},
+    )
+    time_dict = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            time_dict[name.strip()] = int(cumulative)
+    return time_dict
+
+
+def test_cli_import_time():
+    """Test that starting up the command-line interface is quick."""
+    time_dict = get_import_times("import warn_transformer.cli")
+    assert not [m for m in HEAVY_MODULES if m in time_dict]
+    assert time_dict["warn_transformer.cli"] < IMPORT_TIME_BUDGET
+
+
+def test_cli_consolidate_imports(tmp_path):
+    """Test that consolidate doesn't load the dependencies of the other commands."""
+    input_dir = Path(__file__).parent / "data" / "raw"
+    code = (
+        "from warn_transformer.cli import cli; "
+        f"cli(['consolidate', '--input-dir', {str(input_dir)!r}, '--source', 'ny', "
+        "'--no-cache', '-l', 'WARNING'], standalone_mode=False)"
+    )
+    time_dict = get_import_times(code, WARN_TRANSFORMER_OUTPUT_DIR=str(tmp_path))
+    assert "marshmallow" in time_dict
+    assert not [m for m in ("bln", "jellyfish", "requests") if m in time_dict]
+    assert (tmp_path / "processed" / "consolidated.csv").exists()
@@ -1,8 +1,11 @@
+import csv
+import json
 from pathlib import Path
 
 import pytest
 
-from warn_transformer import consolidate
+from warn_transformer import cache, consolidate, utils
+from warn_transformer.schema import BaseTransformer
 
 # from urllib3.connection import HTTPSConnection
 
@@ -13,3 +16,186 @@ def test_consolidate():
     this_dir = Path(__file__).parent
     input_dir = this_dir / "data" / "raw"
     consolidate.run(input_dir)
+
+
+def test_consolidate_jobs(tmp_path, monkeypatch):
+    """Test that a parallel consolidation matches a serial one."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+
+    # Run it serially
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "serial")
+    serial_path = consolidate.run(input_dir, "i")
+
+    # Run it in parallel
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "parallel")
+    parallel_path = consolidate.run(input_dir, "i", jobs=4)
+
+    # They should match byte for byte
+    assert serial_path.read_bytes() == parallel_path.read_bytes()
+
+
+def test_consolidate_cache(tmp_path, monkeypatch):
+    """Test that unchanged sources are pulled from the cache."""
+    this_dir = Path(__file__).parent
+    input_dir = tmp_path / "raw"
+    input_dir.mkdir()
+    for source in ["wa", "wi"]:
+        (input_dir / f"{source}.csv").write_bytes(
+            (this_dir / "data" / "raw" / f"{source}.csv").read_bytes()
+        )
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+
+    # Fill the cache
+    first_bytes = consolidate.run(input_dir, "w").read_bytes()
+
+    # Edit one of the raw files
+    with open(input_dir / "wa.csv", "a") as fh:
+        fh.write("\n")
+
+    # Only that source should be transformed again
+    transformed_list = []
+
+    def transform_source(source, input_dir, **kwargs):
+        transformed_list.append(source)
+        return transform_source_original(source, input_dir, **kwargs)
+
+    transform_source_original = consolidate.transform_source
+    monkeypatch.setattr(consolidate, "transform_source", transform_source)
+    second_bytes = consolidate.run(input_dir, "w").read_bytes()
+    assert transformed_list == ["wa"]
+    assert first_bytes == second_bytes
+
+    # Unless we ask for a rebuild
+    transformed_list.clear()
+    consolidate.run(input_dir, "w", rebuild=True)
+    assert transformed_list == ["wa", "wi"]
+
+
+def test_cache_key(tmp_path, monkeypatch):
+    """Test that the cache key covers every module a transformer imports and the marshmallow version."""
+    # A transformer that imports from a sibling that imports from a shared module
+    package_dir = tmp_path / "fakepkg"
+    (package_dir / "transformers").mkdir(parents=True)
+    (package_dir / "__init__.py").write_text("")
+    (package_dir / "shared.py").write_text("import os\n")
+    (package_dir / "transformers" / "__init__.py").write_text("")
+    (package_dir / "transformers" / "base.py").write_text("from ..shared import os\n")
+    (package_dir / "transformers" / "xx.py").write_text(
+        "import json\nfrom . import base\nfrom .base import os\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    path_list = cache.get_import_paths("fakepkg.transformers.xx")
+    assert [p.relative_to(package_dir).as_posix() for p in path_list] == [
+        "__init__.py",
+        "shared.py",
+        "transformers/__init__.py",
+        "transformers/base.py",
+        "transformers/xx.py",
+    ]
+
+    # Our own transformers pull in the shared utilities
+    path_list = cache.get_import_paths("warn_transformer.transformers.ca")
+    assert Path(utils.__file__) in path_list
+
+    # A new version of marshmallow changes every key
+    input_dir = Path(__file__).parent / "data" / "raw"
+    key = cache.get_key("ca", input_dir)
+    monkeypatch.setattr(cache.metadata, "version", lambda name: "0.0.0")
+    assert cache.get_key("ca", input_dir) != key
+
+
+def test_consolidate_stream(tmp_path, monkeypatch):
+    """Test that a streaming consolidation matches the default one."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+
+    default_bytes = consolidate.run(input_dir, "i", use_cache=False).read_bytes()
+    stream_bytes = consolidate.run(
+        input_dir, "i", use_cache=False, stream=True
+    ).read_bytes()
+    assert default_bytes == stream_bytes
+
+
+def test_consolidate_report(tmp_path, monkeypatch):
+    """Test that every way of consolidating reports the same metrics."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+
+    report_list = []
+    for kwargs in [
+        dict(),
+        dict(stream=True),
+        dict(jobs=2),
+        dict(jobs=2, executor="thread"),
+    ]:
+        output_dir = tmp_path / str(len(report_list))
+        monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", output_dir)
+        consolidated_path = consolidate.run(
+            input_dir, "i", use_cache=False, prometheus=True, **kwargs
+        )
+        report = json.loads(
+            (consolidated_path.parent / "consolidate-report.json").read_text()
+        )
+        assert list(report["stages"]) == ["cache", "transform", "write"]
+        for stage_metrics in report["stages"].values():
+            assert stage_metrics["end_rss_bytes"] > 0
+        assert (consolidated_path.parent / "consolidate-report.prom").exists()
+        for source_metrics in report["sources"].values():
+            source_metrics.pop("validation_seconds")
+        report_list.append(report["sources"])
+
+        # The rows written should add up to the rows in the file
+        with open(consolidated_path) as fh:
+            row_count = len(list(csv.DictReader(fh)))
+        assert row_count == sum(m["written_rows"] for m in report["sources"].values())
+
+    assert report_list[0] == report_list[1] == report_list[2] == report_list[3]
+    assert report_list[0]["in"]["raw_rows"] > report_list[0]["in"]["prepped_rows"]
+
+
+def test_consolidate_shards(tmp_path, monkeypatch):
+    """Test that splitting sources into shards keeps their rows in order."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+    # Split up even our small test files, including Wisconsin's,
+    # which looks for ancestors in the row before each amendment
+    monkeypatch.setattr(BaseTransformer, "shard_min_rows", 100)
+
+    report_list = []
+    for shards in [1, 3]:
+        monkeypatch.setattr(
+            utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / str(shards)
+        )
+        consolidated_path = consolidate.run(
+            input_dir, "w", shards=shards, use_cache=False
+        )
+        report = json.loads(
+            (consolidated_path.parent / "consolidate-report.json").read_text()
+        )
+        report_list.append((consolidated_path.read_bytes(), report["sources"]))
+
+    (serial_bytes, serial_sources), (sharded_bytes, sharded_sources) = report_list
+    assert serial_bytes == sharded_bytes
+    for source, source_metrics in serial_sources.items():
+        for key in ["raw_rows", "prepped_rows", "output_rows", "written_rows"]:
+            assert source_metrics[key] == sharded_sources[source][key]
+
+
+@pytest.mark.skipif(
+    consolidate.InterpreterPoolExecutor is None, reason="requires Python 3.14"
+)
+def test_consolidate_interpreter(tmp_path, monkeypatch):
+    """Test that consolidating in a pool of interpreters matches a serial run."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "serial")
+    serial_path = consolidate.run(input_dir, "i", use_cache=False)
+
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "interpreter")
+    interpreter_path = consolidate.run(
+        input_dir, "i", jobs=2, executor="interpreter", use_cache=False
+    )
+    assert serial_path.read_bytes() == interpreter_path.read_bytes()
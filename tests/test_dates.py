@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from warn_transformer.dates import DateParser, compile_format
+
+
+def test_compile_format():
+    """Test that compiled formats screen out strings strptime can't parse."""
+    pattern = compile_format("%m/%d/%Y")
+    assert pattern.fullmatch("1/2/2020")
+    assert pattern.fullmatch("01/02/2020")
+    assert not pattern.fullmatch("2020-01-02")
+    assert not pattern.fullmatch("01/02/20")
+    assert compile_format("%B %d, %Y").fullmatch("january 2,  2020")
+    assert compile_format("%j") is None
+
+
+def test_date_parser_precedence():
+    """Test which format wins when a string fits more than one."""
+    date_format = ("%m/%d/%y", "%d/%m/%y")
+    assert DateParser(date_format).parse("01/02/20") == datetime(2020, 2, 1)
+    assert DateParser(date_format, last_match_wins=False).parse("01/02/20") == datetime(
+        2020, 1, 2
+    )
+
+
+def test_date_parser_adapts():
+    """Test that the most common format moves to the front without changing results."""
+    parser = DateParser(["%m/%d/%y", "%Y-%m-%d", "%m/%d/%Y"])
+    for _ in range(3):
+        assert parser.parse("2020-01-02") == datetime(2020, 1, 2)
+    assert parser.order[0] == "%Y-%m-%d"
+    assert parser.parse("01/02/20") == datetime(2020, 1, 2)
+    assert parser.parse("01/02/2020") == datetime(2020, 1, 2)
+    assert parser.parse("not a date") is None
+    assert parser.hits["%Y-%m-%d"] == 3
+    assert parser.misses == 1
@@ -1,7 +1,10 @@
+import hashlib
 import tempfile
+import threading
 from pathlib import Path
 
 import pytest
+import requests
 
 from warn_transformer import download
 
@@ -13,3 +16,92 @@ from warn_transformer import download
 def test_download():
     """Test download."""
     download.run(Path(tempfile.gettempdir()))
+
+
+class FakeClient:
+    """Stand in for the biglocalnews.org client, failing where we tell it to."""
+
+    def __init__(self, file_dict, fail_dict=None):
+        """Create a client serving the provided files."""
+        self.file_dict = file_dict
+        self.fail_dict = fail_dict or {}
+        self.updated_dict = {}
+        self.call_list = []
+        self.lock = threading.Lock()
+
+    def get_project_by_name(self, name):
+        """Return a project with all of our files."""
+        return {
+            "files": [
+                dict(
+                    name=n,
+                    size=len(b),
+                    updatedAt=self.updated_dict.get(n, "2022-01-01T00:00:00Z"),
+                    md5=hashlib.md5(b).hexdigest(),
+                )
+                for n, b in self.file_dict.items()
+            ]
+        }
+
+    def download_file(self, project_id, file_name, output_dir=None):
+        """Write out a file, unless it's set to fail."""
+        with self.lock:
+            self.call_list.append(file_name)
+            if self.fail_dict.get(file_name, 0) > 0:
+                self.fail_dict[file_name] -= 1
+                raise requests.exceptions.ConnectionError(f"{file_name} failed")
+        output_path = Path(output_dir) / file_name
+        output_path.write_bytes(self.file_dict[file_name])
+        return str(output_path)
+
+
+def test_download_concurrency(tmp_path, monkeypatch):
+    """Test downloading files in parallel with retries."""
+    file_dict = {f"{s}.csv": s.encode("utf-8") * 10 for s in ["ca", "ia", "wa", "wi"]}
+    # One file fails once, another fails every time
+    client = FakeClient(file_dict, {"ia.csv": 1, "wa.csv": 99})
+    monkeypatch.setattr(download, "Client", lambda key: client)
+    monkeypatch.setattr(download, "RETRY_DELAY", 0)
+
+    summary = download.run(tmp_path, concurrency=3, tries=3)
+    assert summary["file_count"] == 4
+    assert summary["failure_list"] == ["wa.csv"]
+    assert summary["byte_count"] == 60
+    assert [r["name"] for r in summary["file_list"]] == sorted(file_dict)
+    assert client.call_list.count("ia.csv") == 2
+    assert client.call_list.count("wa.csv") == 3
+    assert (tmp_path / "wi.csv").read_bytes() == file_dict["wi.csv"]
+    assert not (tmp_path / "wa.csv").exists()
+
+
+def test_download_manifest(tmp_path, monkeypatch):
+    """Test that unchanged files are skipped."""
+    file_dict = {f"{s}.csv": s.encode("utf-8") * 10 for s in ["ca", "ia", "wa"]}
+    client = FakeClient(file_dict)
+    monkeypatch.setattr(download, "Client", lambda key: client)
+
+    # The first run downloads everything
+    summary = download.run(tmp_path)
+    assert summary["skipped_list"] == []
+    assert client.call_list == sorted(file_dict)
+
+    # The second skips everything
+    client.call_list.clear()
+    summary = download.run(tmp_path)
+    assert summary["skipped_list"] == sorted(file_dict)
+    assert client.call_list == []
+
+    # Unless something changes, in the listing or on disk
+    client.file_dict["ca.csv"] = b"new"
+    client.updated_dict["ia.csv"] = "2022-02-01T00:00:00Z"
+    (tmp_path / "wa.csv").write_bytes(b"edited")
+    summary = download.run(tmp_path)
+    assert client.call_list == ["ca.csv", "ia.csv", "wa.csv"]
+    assert (tmp_path / "ca.csv").read_bytes() == b"new"
+    assert (tmp_path / "wa.csv").read_bytes() == file_dict["wa.csv"]
+
+    # Or we force it
+    client.call_list.clear()
+    summary = download.run(tmp_path, "ca", force=True)
+    assert client.call_list == ["ca.csv"]
+    assert summary["skipped_list"] == []
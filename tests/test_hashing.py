@@ -0,0 +1,42 @@
+import hashlib
+import json
+from importlib import import_module
+from pathlib import Path
+
+import pytest
+
+from warn_transformer import hashing, utils
+
+RAW_DIR = Path(__file__).parent / "data" / "raw"
+
+
+@pytest.mark.parametrize("source", utils.get_all_transformers())
+def test_hash_id_equivalence(source):
+    """Test that the hashing engine reproduces our original hash_id for every record."""
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformer = module.Transformer(RAW_DIR)
+    for row in transformer.prep_row_list(transformer.raw_data):
+        data = transformer.transform_row(row)
+        hash_id = data.pop("hash_id")
+        assert hashing.encode_json(data) == json.dumps(data).encode("utf-8")
+        assert hash_id == hashlib.sha224(json.dumps(data).encode("utf-8")).hexdigest()
+
+
+def test_encode_json_fallback():
+    """Test that unusual values are serialized by json.dumps."""
+    data = dict(a=1.5, b=[1, 2])
+    assert hashing.encode_json(data) == json.dumps(data).encode("utf-8")
+    data = {1: "a", "b": "“quoted”"}
+    assert hashing.encode_json(data) == json.dumps(data).encode("utf-8")
+
+
+def test_hash_version_2():
+    """Test the compact hash version."""
+    data = dict(company="Acme", location=None, jobs=10, is_amendment=False)
+    hash_id = hashing.get_hash_id(data, version=2)
+    assert hash_id.startswith("v2-")
+    assert len(hash_id) == 59
+    assert hash_id != hashing.get_hash_id(dict(data, company="Acme "), version=2)
+    assert hash_id != hashing.get_hash_id(dict(data, jobs=None), version=2)
+    with pytest.raises(ValueError):
+        hashing.get_hash_id(data, version=3)
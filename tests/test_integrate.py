@@ -1,8 +1,18 @@
+import csv
+import hashlib
+import json
+import re
+import threading
+import typing
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from importlib import import_module
 from pathlib import Path
 
 import pytest
 
-from warn_transformer import integrate
+from warn_transformer import integrate, store, synthetic, utils
+from warn_transformer.schema import WarnNotice
 
 # from urllib3.connection import HTTPSConnection
 
@@ -14,3 +24,453 @@ def test_integrate():
     this_dir = Path(__file__).parent
     new_path = this_dir / "data" / "processed" / "consolidated.csv"
     integrate.run(new_path, init_current_data=True)
+
+
+def test_get_changed_data():
+    """Test that only rows missing from the current data are flagged."""
+    current_data = integrate.regroup_by_source(
+        [
+            dict(hash_id="a", postal_code="CA"),
+            dict(hash_id="b", postal_code="CA"),
+            dict(hash_id="c", postal_code="IL"),
+        ]
+    )
+    new_data = integrate.regroup_by_source(
+        [
+            dict(hash_id="a", postal_code="CA"),
+            dict(hash_id="d", postal_code="CA"),
+            dict(hash_id="c", postal_code="IL"),
+            dict(hash_id="a", postal_code="IL"),
+            dict(hash_id="e", postal_code="WI"),
+        ]
+    )
+    changed_data = integrate.get_changed_data(new_data, current_data)
+    assert {k: [r["hash_id"] for r in v] for k, v in changed_data.items()} == {
+        "CA": ["d"],
+        "IL": ["a"],
+        "WI": ["e"],
+    }
+
+
+@pytest.mark.parametrize("source", ["ca", "wi"])
+def test_get_likely_ancestor_index(source):
+    """Test that the indexed ancestor search matches an exhaustive one."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+    module = import_module(f"warn_transformer.transformers.{source}")
+
+    # Format the rows the way they come out of a CSV file
+    current_list = [
+        {k: "" if v is None else str(v) for k, v in r.items()}
+        for r in module.Transformer(input_dir).transform()
+    ]
+    ancestor_index = integrate.get_ancestor_index(current_list)
+
+    # Fake a sample of amended and brand new records
+    new_list = []
+    for row in current_list[::500]:
+        new_list.append(dict(row, jobs="1"))
+        new_list.append(dict(row, company=row["company"] + " Inc"))
+        new_list.append(dict(row, company="X" + row["company"][1:]))
+        new_list.append(dict(row, notice_date=row["notice_date"][:-1] + "0"))
+        new_list.append(dict(row, company="Brand New Company"))
+
+    for new_row in new_list:
+        assert integrate.get_likely_ancestor(
+            new_row, current_list, ancestor_index
+        ) is integrate.get_likely_ancestor(new_row, current_list)
+
+
+def test_get_ancestor_candidates():
+    """Test that the ancestor index only compares a small share of the current data."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+    module = import_module("warn_transformer.transformers.ca")
+    current_list = [
+        {k: "" if v is None else str(v) for k, v in r.items()}
+        for r in module.Transformer(input_dir).transform()
+    ]
+    ancestor_index = integrate.get_ancestor_index(current_list)
+
+    count_list = []
+    for row in current_list[::100]:
+        if not row["company"]:
+            continue
+        new_row = dict(row, company=row["company"] + " Inc")
+        candidate_list = integrate.get_ancestor_candidates(new_row, ancestor_index)
+        assert candidate_list is not None
+        count_list.append(len(candidate_list))
+
+    assert sum(count_list) / len(count_list) < len(current_list) * 0.05
+
+
+@pytest.fixture
+def current_data_dir(tmp_path):
+    """Create a small consolidated file to stand in for the published one."""
+    data_dir = tmp_path / "published"
+    data_dir.mkdir()
+    with open(data_dir / "consolidated.csv", "w", newline="") as fh:
+        writer = csv.DictWriter(fh, ["hash_id", "postal_code", "company", "jobs"])
+        writer.writeheader()
+        writer.writerow(dict(hash_id="a", postal_code="CA", company="Acme", jobs=1))
+        writer.writerow(
+            dict(hash_id="b", postal_code="IL", company="Bar, Inc.", jobs=2)
+        )
+    return data_dir
+
+
+@pytest.fixture
+def current_data_server(monkeypatch, current_data_dir):
+    """Serve our test data over HTTP the way the published files are, ETags and all."""
+    data_dir = current_data_dir
+    request_list = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = (data_dir / self.path.lstrip("/")).read_bytes()
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            request_list.append((self.path, self.headers.get("If-None-Match")))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        integrate, "CURRENT_DATA_BASE_URL", f"http://127.0.0.1:{server.server_port}/"
+    )
+    yield request_list
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_current_data_cache(tmp_path, monkeypatch, current_data_server):
+    """Test that the current data is only downloaded again when it changes."""
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+
+    # The first run downloads the file
+    first_list = integrate.get_current_data(init=True)
+    assert [r["company"] for r in first_list] == ["Acme", "Bar, Inc."]
+    assert current_data_server == [("/consolidated.csv", None)]
+
+    # The second revalidates it
+    second_list = integrate.get_current_data(init=True)
+    assert current_data_server[-1][1] is not None
+    assert [r["hash_id"] for r in second_list] == [r["hash_id"] for r in first_list]
+
+    # Unless we ask to skip the cache
+    integrate.get_current_data(init=True, use_cache=False)
+    assert current_data_server[-1] == ("/consolidated.csv", None)
+
+
+def test_get_current_data_path(
+    tmp_path, monkeypatch, current_data_dir, current_data_server
+):
+    """Test that a local copy of the current data can be used instead of downloading it."""
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+    current_path = current_data_dir / "consolidated.csv"
+    local_list = integrate.get_current_data(init=True, current_path=current_path)
+    assert current_data_server == []
+
+    downloaded_list = integrate.get_current_data(init=True)
+    assert [(r["hash_id"], r["company"]) for r in local_list] == [
+        (r["hash_id"], r["company"]) for r in downloaded_list
+    ]
+
+
+def test_integrate_report(tmp_path, monkeypatch):
+    """Test that integrate reports what it found in each source."""
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 1000)
+    _, _, expected = synthetic.generate_integrated(1000)
+    (tmp_path / "processed").mkdir()
+    integrated_path = integrate.run(
+        new_path, current_path=current_path, prometheus=True
+    )
+
+    report = json.loads((integrated_path.parent / "integrate-report.json").read_text())
+    assert list(report["stages"]) == ["read_current", "read_new", "compare", "write"]
+    source_list = report["sources"].values()
+    assert sum(m["current_rows"] for m in source_list) == 1000
+    assert sum(m.get("inserted_rows", 0) for m in source_list) == len(
+        expected["inserted"]
+    )
+    assert sum(m.get("amended_rows", 0) for m in source_list) == len(
+        expected["amended"]
+    )
+
+    # Every line in the Prometheus file should be a comment or a sample
+    prometheus_text = (integrated_path.parent / "integrate-report.prom").read_text()
+    for line in prometheus_text.splitlines():
+        assert re.fullmatch(r"# TYPE \w+ gauge|\w+\{[^}]*\} [\d.e+-]+", line), line
+
+
+class Clock(datetime):
+    """A clock that's stopped at a moment of our choosing."""
+
+    moment: typing.Optional[datetime] = None
+
+    @classmethod
+    def now(cls, tz=None):
+        """Get the moment the clock is stopped at."""
+        return cls.moment
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Stop the clock, so different ways of integrating stamp the same times."""
+    monkeypatch.setattr(integrate, "datetime", Clock)
+    Clock.moment = Clock(2030, 1, 1, tzinfo=timezone.utc)
+    return Clock
+
+
+def test_integrate_store_published(
+    tmp_path, monkeypatch, current_data_dir, current_data_server, clock
+):
+    """Test that the store is loaded again when a newer current dataset is published."""
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+    (tmp_path / "processed").mkdir()
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 200)
+    published_path = current_data_dir / "integrated.csv"
+    published_path.write_bytes(current_path.read_bytes())
+    load_list = []
+    load = store.load
+
+    def spy_load(conn, record_list, source=""):
+        load_list.append(source)
+        load(conn, record_list, source=source)
+
+    monkeypatch.setattr(store, "load", spy_load)
+
+    # The first run loads the store from the published file
+    integrate.run(new_path, use_store=True)
+    assert current_data_server == [("/integrated.csv", None)]
+    assert len(load_list) == 1
+
+    # The next only checks that it hasn't changed
+    integrate.run(new_path, use_store=True)
+    assert current_data_server[-1][1] is not None
+    assert len(load_list) == 1
+
+    # Once it has, the store is loaded again from the new version
+    with open(current_path) as fh:
+        line_list = fh.readlines()
+    published_path.write_text("".join(line_list[: len(line_list) // 2]))
+    integrated_path = integrate.run(new_path, use_store=True)
+    assert len(load_list) == 2
+    assert load_list[0] != load_list[1]
+    store_bytes = integrated_path.read_bytes()
+
+    # And integrates the same as the file itself would be
+    integrated_path = integrate.run(new_path, current_path=published_path)
+    assert store_bytes == integrated_path.read_bytes()
+
+
+def test_integrate_store(tmp_path, monkeypatch, clock):
+    """Test that integrating into the store writes the same files as integrating a list."""
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 1000)
+
+    # Amend a few of the new records and add a few more for a second run
+    with open(new_path) as fh:
+        row_list = list(csv.DictReader(fh))
+    for i, row in enumerate(row_list[:10]):
+        row["jobs"] = str(int(row["jobs"] or 0) + 7)
+        row["hash_id"] = f"amended{i}"
+    for i, row in enumerate(row_list[10:15]):
+        row_list.append(dict(row, company=f"Zyzzyva {i}", hash_id=f"inserted{i}"))
+    second_path = tmp_path / "synthetic" / "second.csv"
+    with open(second_path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, row_list[0].keys())
+        writer.writeheader()
+        writer.writerows(row_list)
+
+    output_dict = {}
+    for use_store in (False, True):
+        output_dir = tmp_path / str(use_store)
+        (output_dir / "processed").mkdir(parents=True)
+        monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", output_dir)
+        file_list = []
+        previous_path: typing.Optional[Path] = current_path
+        for i, path in enumerate([new_path, second_path]):
+            clock.moment = clock(2030, 1 + i, 1, tzinfo=timezone.utc)
+            integrated_path = integrate.run(
+                path, current_path=previous_path, use_store=use_store
+            )
+            for name in ("integrated.csv", "additions.csv", "amendments.csv"):
+                file_list.append((integrated_path.parent / name).read_bytes())
+
+            # The list has to be handed the last run's file, while the store keeps it
+            if use_store:
+                previous_path = None
+            else:
+                previous_path = output_dir / "previous.csv"
+                previous_path.write_bytes(integrated_path.read_bytes())
+        output_dict[use_store] = file_list
+
+    assert output_dict[True] == output_dict[False]
+
+    # The second run should have counted the records in the store
+    report = json.loads((integrated_path.parent / "integrate-report.json").read_text())
+    current_rows = sum(m["current_rows"] for m in report["sources"].values())
+    assert current_rows == len(output_dict[True][0].splitlines()) - 1
+
+
+def test_integrate_store_time_zones(tmp_path, monkeypatch, clock):
+    """Test that the store sorts timestamps by time, not text, the way a list does."""
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 500)
+
+    # Spread the timestamps out, and write them in a mix of time zones and precisions
+    with open(current_path) as fh:
+        row_list = list(csv.DictReader(fh))
+    for i, row in enumerate(row_list):
+        zone = timezone(timedelta(hours=i % 5 - 2))
+        for field in ("first_inserted_date", "last_updated_date"):
+            dt = datetime.fromisoformat(row[field]) + timedelta(hours=i % 7)
+            dt = dt.replace(microsecond=i % 2 * i)
+            row[field] = str(dt.astimezone(zone))
+    with open(current_path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, row_list[0].keys())
+        writer.writeheader()
+        writer.writerows(row_list)
+
+    output_list = []
+    for use_store in (False, True):
+        output_dir = tmp_path / str(use_store)
+        (output_dir / "processed").mkdir(parents=True)
+        monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", output_dir)
+        integrated_path = integrate.run(
+            new_path, current_path=current_path, use_store=use_store
+        )
+        output_list.append(integrated_path.read_bytes())
+    assert output_list[0] == output_list[1]
+
+
+def test_integrate_amendment_fields(tmp_path, monkeypatch):
+    """Test that amendments.csv lists a current record's fields in the order of the integrated dataset."""
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 1000)
+    (tmp_path / "processed").mkdir()
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+    integrated_path = integrate.run(new_path, current_path=current_path)
+
+    with open(current_path) as fh:
+        header = next(csv.reader(fh))
+    with open(integrated_path.parent / "amendments.csv") as fh:
+        amend_list = list(csv.DictReader(fh))
+    assert amend_list
+    for row in amend_list:
+        assert re.findall(r"'(\w+)': ", row["current"]) == header
+
+
+def test_get_store_candidates(tmp_path):
+    """Test that the store pulls a source's candidates in one go and finds the same ancestors as the index."""
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 1000)
+    current_list = integrate.get_current_data(current_path=current_path)
+    with open(new_path) as fh:
+        new_list = list(csv.DictReader(fh))
+    conn = store.connect(tmp_path / "integrated.db")
+    store.load(conn, current_list)
+
+    statement_list: typing.List[str] = []
+    conn.set_trace_callback(statement_list.append)
+    current_by_source = integrate.regroup_by_source(current_list)
+    for postal_code, row_list in integrate.regroup_by_source(new_list).items():
+        statement_list.clear()
+        candidate_list_list = integrate.get_store_candidates(
+            conn, postal_code, row_list
+        )
+
+        # The same few queries, no matter how many rows there are
+        select_list = [s for s in statement_list if s.lstrip().startswith("SELECT")]
+        assert len(select_list) <= 3
+
+        current_row_list = current_by_source[postal_code]
+        ancestor_index = integrate.get_ancestor_index(current_row_list)
+        for new_row, candidate_list in zip(row_list, candidate_list_list):
+            assert integrate.get_likely_ancestor(
+                new_row, candidate_list
+            ) == integrate.get_likely_ancestor(
+                new_row, current_row_list, ancestor_index
+            )
+    conn.close()
+
+
+@pytest.mark.parametrize("init", [False, True])
+def test_integrate_run_size(tmp_path, monkeypatch, clock, init):
+    """Test that merging sorted runs writes the same file as sorting in memory."""
+    current_path, new_path = synthetic.write_integrated(tmp_path / "synthetic", 1000)
+    # Starting from scratch, the current data isn't in order, so it's spilled too
+    if init:
+        current_path = new_path
+
+    output_list = []
+    for run_size in (None, 7):
+        output_dir = tmp_path / str(run_size)
+        (output_dir / "processed").mkdir(parents=True)
+        monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", output_dir)
+        integrated_path = integrate.run(
+            new_path,
+            init_current_data=init,
+            current_path=current_path,
+            run_size=run_size,
+        )
+        output_list.append(integrated_path.read_bytes())
+
+    assert output_list[0] == output_list[1]
+
+
+class CountedNotice(WarnNotice):
+    """A record that keeps count of how many of its kind are in memory at once."""
+
+    live_count = 0
+    peak_count = 0
+
+    def __init__(self, **kwargs):
+        """Count the new record."""
+        super().__init__(**kwargs)
+        CountedNotice.live_count += 1
+        CountedNotice.peak_count = max(
+            CountedNotice.peak_count, CountedNotice.live_count
+        )
+
+    def __del__(self):
+        """Count the record as gone."""
+        CountedNotice.live_count -= 1
+
+
+@pytest.mark.parametrize("run_size", [None, 10])
+def test_integrate_run_size_memory(tmp_path, monkeypatch, run_size):
+    """Test that merging sorted runs only holds a few current records in memory at once."""
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+    (tmp_path / "processed").mkdir()
+    current_path, new_path = synthetic.write_integrated(
+        tmp_path / "synthetic", 2000, insert_share=0.01, amend_share=0.01
+    )
+    with open(new_path) as fh:
+        new_data_list = [WarnNotice.from_dict(r) for r in csv.DictReader(fh)]
+
+    # Count the current records as they're read in
+    monkeypatch.setattr(integrate, "WarnNotice", CountedNotice)
+    monkeypatch.setattr(CountedNotice, "peak_count", 0)
+    integrate.run(
+        new_path,
+        current_path=current_path,
+        new_data_list=new_data_list,
+        run_size=run_size,
+    )
+
+    # Sorting in memory holds all of them. Merging runs holds no more than the one being
+    # spilled and the next one being read, plus an ancestor for each of the 40 changed records.
+    if run_size is None:
+        assert CountedNotice.peak_count == 2000
+    else:
+        assert CountedNotice.peak_count <= 2 * run_size + 40
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+from warn_transformer import consolidate, integrate, pipeline, utils
+
+
+class FrozenDatetime(datetime):
+    """Stop the clock so integrated files from different runs can be compared."""
+
+    @classmethod
+    def now(cls, tz=None):
+        """Return the same time, every time."""
+        return datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def test_pipeline(tmp_path, monkeypatch):
+    """Test that the pipeline matches running each stage on its own."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+    monkeypatch.setattr(integrate, "datetime", FrozenDatetime)
+
+    # Use one source as the current dataset
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "current")
+    current_path = consolidate.run(input_dir, "wa", use_cache=False)
+
+    # Run the stages one at a time
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "stages")
+    consolidated_path = consolidate.run(input_dir, "w", use_cache=False)
+    stages_path = integrate.run(
+        consolidated_path, init_current_data=True, current_path=current_path
+    )
+
+    # And all together
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path / "pipeline")
+    timing_dict = pipeline.run(
+        input_dir,
+        "w",
+        skip_download=True,
+        use_cache=False,
+        init_current_data=True,
+        current_path=current_path,
+    )
+    assert list(timing_dict) == ["consolidate", "integrate"]
+
+    # They should write out the same files
+    processed_dir = tmp_path / "pipeline" / "processed"
+    assert (processed_dir / "integrated.csv").read_bytes() == stages_path.read_bytes()
+    for name in ["consolidated.csv", "additions.csv", "amendments.csv"]:
+        assert (processed_dir / name).read_bytes() == (
+            stages_path.parent / name
+        ).read_bytes()
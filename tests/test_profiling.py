@@ -0,0 +1,43 @@
+import pstats
+import tracemalloc
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from warn_transformer import profiling, utils
+from warn_transformer.cli import cli
+
+
+def test_profile(tmp_path, monkeypatch):
+    """Test that the --profile option saves a profile of the command."""
+    this_dir = Path(__file__).parent
+    input_dir = this_dir / "data" / "raw"
+    profile_dir = tmp_path / "profile"
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "--profile-memory",
+            "--profile-dir",
+            str(profile_dir),
+            "--profile-top",
+            "5",
+            "consolidate",
+            "--input-dir",
+            str(input_dir),
+            "--source",
+            "ny",
+            "--no-cache",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # The profile and memory snapshot should have been saved
+    stats = pstats.Stats(str(profile_dir / "consolidate.prof"))
+    assert any(func[2] == "transform" for func in stats.stats)  # type: ignore
+    snapshot = tracemalloc.Snapshot.load(str(profile_dir / "consolidate.snapshot"))
+    assert snapshot.statistics("filename")
+
+    # And it should be turned back off when the command is done
+    assert not profiling.SETTINGS["enabled"]
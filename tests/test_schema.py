@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from pathlib import Path
+
+import pytest
+from marshmallow import ValidationError
+
+from warn_transformer.schema import (
+    FastSchemaLoader,
+    WarnNotice,
+    WarnNoticeSchema,
+    pack_records,
+    unpack_records,
+)
+
+RAW_DIR = Path(__file__).parent / "data" / "raw"
+
+
+@pytest.mark.parametrize("source", ["ca", "in", "oh"])
+def test_date_cache(source):
+    """Test that cached date parsing matches the uncached results."""
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformer = module.Transformer(RAW_DIR)
+    cached_list = transformer.transform()
+
+    # The cache should have been put to work
+    cache_info = transformer.get_date_cache_info()
+    assert cache_info.hits > 0
+    assert cache_info.currsize <= transformer.date_cache_size
+
+    # And it shouldn't change anything
+    uncached = module.Transformer(RAW_DIR)
+    uncached.cached_transform_date = uncached.transform_date
+    assert uncached.transform() == cached_list
+    assert uncached.get_date_cache_info() is None
+
+
+@pytest.mark.parametrize("source", ["ca", "wi"])
+def test_concurrent_transform(source):
+    """Test that instances of a transformer can run at the same time in threads."""
+    module = import_module(f"warn_transformer.transformers.{source}")
+    serial_list = module.Transformer(RAW_DIR).transform()
+
+    def transform(_):
+        transformer = module.Transformer(RAW_DIR)
+        return transformer.transform(), transformer.get_metrics()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        result_list = list(executor.map(transform, range(4)))
+    for row_list, metrics in result_list:
+        assert row_list == serial_list
+        assert metrics["output_rows"] == len(serial_list)
+
+
+def test_fast_schema_loader():
+    """Test that the fast loader matches marshmallow, errors included."""
+    transformer = import_module("warn_transformer.transformers.ca").Transformer(RAW_DIR)
+    row_list = [transformer.transform_row(r) for r in transformer.raw_data[:500]]
+    schema = WarnNoticeSchema()
+    loader = FastSchemaLoader(schema, many=True)
+    assert loader.field_list is not None
+    assert loader.load(row_list) == [schema.load(r) for r in row_list]
+
+    # Bad records should raise the same errors
+    for bad_row in [
+        dict(row_list[0], postal_code="CAL"),
+        dict(row_list[0], notice_date="2020-02-30"),
+        dict(row_list[0], jobs="many"),
+        dict(row_list[0], extra=True),
+        {k: v for k, v in row_list[0].items() if k != "company"},
+    ]:
+        with pytest.raises(ValidationError) as expected:
+            schema.load(bad_row)
+        with pytest.raises(ValidationError) as actual:
+            loader.load_one(bad_row)
+        assert actual.value.messages == expected.value.messages
+
+    # Values marshmallow can coerce should still be coerced
+    assert loader.load_one(dict(row_list[0], jobs="10"))["jobs"] == 10
+
+
+def test_warn_notice():
+    """Test that WarnNotice records behave like the dictionaries they replace."""
+    data = dict(hash_id="abc", postal_code="CA", company="Acme", jobs=10)
+    notice = WarnNotice(**data)
+    assert dict(notice) == data
+    assert notice == data
+    assert len(notice) == 4
+    assert notice.get("location") is None
+    assert "location" not in notice
+    with pytest.raises(KeyError):
+        notice["location"]
+
+    # Fields can be filled in and cleared
+    notice["location"] = "Sacramento"
+    assert list(notice) == ["hash_id", "postal_code", "company", "location", "jobs"]
+    del notice["location"]
+    assert dict(notice) == data
+
+    # Only our fields are allowed
+    with pytest.raises(KeyError):
+        notice["foo"] = "bar"
+    with pytest.raises(KeyError):
+        WarnNotice(foo="bar")
+    assert WarnNotice.from_dict({"foo": "bar", **data}) == data
+
+
+def test_pack_records():
+    """Test that records come back the same after being packed into tuples."""
+    transformer = import_module("warn_transformer.transformers.ca").Transformer(RAW_DIR)
+    record_list = transformer.transform()
+    field_tuple, value_list = pack_records(record_list)
+    assert all(type(v) is tuple for v in value_list)
+    unpacked_list = unpack_records((field_tuple, value_list))
+    assert unpacked_list == record_list
+    assert [list(r) for r in unpacked_list] == [list(r) for r in record_list]
+    assert unpack_records(pack_records([])) == []
@@ -0,0 +1,91 @@
+import csv
+from datetime import date
+from importlib import import_module
+from pathlib import Path
+
+import pytest
+
+from warn_transformer import consolidate, integrate, synthetic, utils
+
+RAW_DIR = Path(__file__).parent / "data" / "raw"
+
+
+@pytest.mark.parametrize("source", ["ca", "ia", "in", "ny"])
+def test_generate_raw(tmp_path, source):
+    """Test that fake raw data can be transformed, and made again from the same seed."""
+    path_list = synthetic.generate_raw(
+        tmp_path / "a", scale=0.5, seed=1, template_dir=RAW_DIR, source=source
+    )
+    synthetic.generate_raw(
+        tmp_path / "b", scale=0.5, seed=1, template_dir=RAW_DIR, source=source
+    )
+    synthetic.generate_raw(
+        tmp_path / "c", scale=0.5, seed=2, template_dir=RAW_DIR, source=source
+    )
+    name = path_list[0].name
+    assert (tmp_path / "a" / name).read_bytes() == (tmp_path / "b" / name).read_bytes()
+    assert (tmp_path / "a" / name).read_bytes() != (tmp_path / "c" / name).read_bytes()
+
+    # It should be about half the size
+    with open(RAW_DIR / name) as fh:
+        raw_count = len(list(csv.reader(fh)))
+    with open(tmp_path / "a" / name) as fh:
+        fake_count = len(list(csv.reader(fh)))
+    assert abs(fake_count - raw_count / 2) < 2
+
+    # And go through the transformer without complaint
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformed_list = module.Transformer(tmp_path / "a").transform()
+    assert len(transformed_list) > 0
+
+
+class FutureDate(date):
+    """A date class that thinks it's decades from now."""
+
+    @classmethod
+    def today(cls):
+        """Get a day long after the test data was collected."""
+        return cls(2100, 1, 1)
+
+
+@pytest.mark.parametrize("source", ["ca", "ia", "in", "ny"])
+def test_generate_raw_any_day(tmp_path, monkeypatch, source):
+    """Test that the same seed makes the same fake raw data no matter what day it is."""
+    path_list = synthetic.generate_raw(
+        tmp_path / "a", scale=0.5, seed=1, template_dir=RAW_DIR, source=source
+    )
+    monkeypatch.setattr(synthetic, "date", FutureDate)
+    synthetic.generate_raw(
+        tmp_path / "b", scale=0.5, seed=1, template_dir=RAW_DIR, source=source
+    )
+    name = path_list[0].name
+    assert (tmp_path / "a" / name).read_bytes() == (tmp_path / "b" / name).read_bytes()
+
+
+def test_get_hash_id():
+    """Test that fake records are hashed the same way as transformed ones."""
+    transformer = import_module("warn_transformer.transformers.ca").Transformer(RAW_DIR)
+    for row in transformer.transform()[:100]:
+        csv_row = consolidate.get_csv_record(row)
+        assert synthetic.get_hash_id(csv_row) == row["hash_id"]
+
+
+def test_generate_integrated(tmp_path, monkeypatch):
+    """Test that integrate finds the inserts and amendments we planted."""
+    monkeypatch.setattr(utils, "WARN_TRANSFORMER_OUTPUT_DIR", tmp_path)
+    current_path, new_path = synthetic.write_integrated(
+        tmp_path / "synthetic", 2000, seed=1, insert_share=0.02, amend_share=0.03
+    )
+    _, _, expected = synthetic.generate_integrated(
+        2000, seed=1, insert_share=0.02, amend_share=0.03
+    )
+    processed_dir = tmp_path / "processed"
+    processed_dir.mkdir()
+    integrate.run(new_path, current_path=current_path)
+
+    with open(processed_dir / "additions.csv") as fh:
+        assert sorted(r["hash_id"] for r in csv.DictReader(fh)) == sorted(
+            expected["inserted"]
+        )
+    with open(processed_dir / "amendments.csv") as fh:
+        assert len(list(csv.DictReader(fh))) == len(expected["amended"]) == 60
@@ -0,0 +1,409 @@
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from datetime import datetime, timezone
+from functools import partial
+from importlib import import_module
+from pathlib import Path
+
+from . import consolidate, hashing, integrate, synthetic, utils
+from .schema import FastSchemaLoader, WarnNotice
+
+logger = logging.getLogger(__name__)
+
+# The sources used for the microbenchmarks, picked for their mix of date formats and quirks
+MICRO_SOURCES = ("ca", "il", "in", "ny")
+
+# The sizes of the current dataset used to benchmark integrate
+INTEGRATE_COUNTS = (1_000, 10_000, 100_000)
+
+# The number of parallel jobs used to benchmark each kind of pool
+EXECUTOR_JOBS = 4
+
+
+def run(
+    output_path: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "benchmark.json",
+    input_dir: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
+    scale: typing.Optional[float] = None,
+    seed: int = 0,
+    source: typing.Optional[str] = None,
+    integrate_counts: typing.Sequence[int] = INTEGRATE_COUNTS,
+    repeat: int = 3,
+) -> Path:
+    """Benchmark every stage of our pipeline and save the results.
+
+    Args:
+        output_path (Path): Where to write the JSON results.
+        input_dir (Path): The directory where our raw data files are stored.
+        scale (float): Benchmark fake data modeled on the raw files at this scale, rather than the files themselves (optional)
+        seed (int): The seed for any fake data. Default 0.
+        source (str): Limit the per-source benchmarks to the sources that match this slug (optional)
+        integrate_counts (list): The sizes of the current dataset to benchmark integrate with.
+        repeat (int): How many times to run each microbenchmark. The best time is kept. Default 3.
+
+    Returns: The Path to the JSON results.
+    """
+    # Get the sources to benchmark
+    transformer_list = utils.get_all_transformers()
+    if source:
+        transformer_list = [t for t in transformer_list if source.lower() in t.lower()]
+    micro_list = [t for t in transformer_list if t in MICRO_SOURCES] or transformer_list
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Make fake data, if we've been asked to
+        if scale is not None:
+            logger.debug(f"Generating fake data at {scale}x scale")
+            synthetic.generate_raw(
+                Path(tmp_dir), scale=scale, seed=seed, template_dir=input_dir
+            )
+            input_dir = Path(tmp_dir)
+
+        # Run everything
+        result_list = []
+        for t in micro_list:
+            result_list.extend(benchmark_source_methods(t, input_dir, repeat))
+        transform_list = [benchmark_transform(t, input_dir) for t in transformer_list]
+        result_list.extend(transform_list)
+        result_list.extend(
+            benchmark_executors(
+                transformer_list, input_dir, sum(r["count"] for r in transform_list)
+            )
+        )
+        for count in integrate_counts:
+            result_list.extend(benchmark_integrate(count, seed))
+
+    # Write out the results
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as fh:
+        json.dump(dict(meta=get_meta(scale, seed), results=result_list), fh, indent=2)
+    logger.debug(f"Wrote {len(result_list)} results to {output_path}")
+    return output_path
+
+
+def measure(
+    name: str,
+    func: typing.Callable,
+    count: int,
+    repeat: int = 1,
+    **params,
+) -> dict:
+    """Time a function.
+
+    Args:
+        name (str): The name of the benchmark.
+        func (callable): A function that takes no arguments and does the work.
+        count (int): How many items the function handles, to calculate a rate.
+        repeat (int): How many times to run the function. The best time is kept. Default 1.
+        **params: Anything else worth recording about the benchmark, like the source.
+
+    Returns: A dictionary with the name, parameters, count, best time in seconds and items per second.
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+    result = dict(
+        name=name,
+        params=params,
+        count=count,
+        seconds=round(seconds, 6),
+        rate=round(count / seconds, 1) if seconds else None,
+    )
+    logger.debug(f"{name} {params}: {count:,} in {seconds:.4f}s")
+    return result
+
+
+def benchmark_source_methods(
+    source: str, input_dir: Path, repeat: int = 3
+) -> typing.List[dict]:
+    """Benchmark the methods a transformer calls for every row.
+
+    Args:
+        source (str): The slug of the source.
+        input_dir (Path): The directory where our raw data files are stored.
+        repeat (int): How many times to run each benchmark. Default 3.
+
+    Returns: A list of results.
+    """
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformer = module.Transformer(input_dir)
+    row_list = transformer.prep_row_list(transformer.raw_data)
+    getter_dict = transformer._field_getters
+    result_list = []
+
+    # transform_date, with and without the cache, on every raw date
+    date_list = [
+        getter(r) for getter in transformer._date_getters if getter for r in row_list
+    ]
+    result_list.append(
+        measure(
+            "transform_date",
+            lambda: [transformer.transform_date(v) for v in date_list],
+            len(date_list),
+            repeat,
+            source=source,
+            cached=False,
+        )
+    )
+
+    def cached():
+        # Start from an empty cache each time
+        if hasattr(transformer.cached_transform_date, "cache_clear"):
+            transformer.cached_transform_date.cache_clear()
+        return [transformer.cached_transform_date(v) for v in date_list]
+
+    result_list.append(
+        measure(
+            "transform_date", cached, len(date_list), repeat, source=source, cached=True
+        )
+    )
+
+    # transform_jobs on every raw jobs number
+    jobs_list = [getter_dict["jobs"](r) for r in row_list]
+    result_list.append(
+        measure(
+            "transform_jobs",
+            lambda: [transformer.transform_jobs(v) for v in jobs_list],
+            len(jobs_list),
+            repeat,
+            source=source,
+        )
+    )
+
+    # get_hash_id, in every version, on every transformed row
+    transformed_list = [transformer.transform_row(r) for r in row_list]
+    data_list = [
+        {k: v for k, v in r.items() if k != "hash_id"} for r in transformed_list
+    ]
+    for version in hashing.HASH_VERSIONS:
+        result_list.append(
+            measure(
+                "get_hash_id",
+                lambda: [hashing.get_hash_id(d, version) for d in data_list],
+                len(data_list),
+                repeat,
+                source=source,
+                version=version,
+            )
+        )
+
+    # Schema validation, with marshmallow and with our fast loader
+    for name, loader in [
+        ("marshmallow", transformer.schema(many=True)),
+        ("fast", FastSchemaLoader(transformer.schema(), many=True)),
+    ]:
+        result_list.append(
+            measure(
+                "schema_load",
+                lambda: loader.load(transformed_list),
+                len(transformed_list),
+                repeat,
+                source=source,
+                loader=name,
+            )
+        )
+
+    return result_list
+
+
+def benchmark_transform(source: str, input_dir: Path) -> dict:
+    """Benchmark transforming a source from start to finish.
+
+    Args:
+        source (str): The slug of the source.
+        input_dir (Path): The directory where our raw data files are stored.
+
+    Returns: A result with the rate in raw rows per second.
+    """
+    module = import_module(f"warn_transformer.transformers.{source}")
+    transformer = module.Transformer(input_dir)
+    return measure(
+        "transform", transformer.transform, len(transformer.raw_data), source=source
+    )
+
+
+def benchmark_executors(
+    source_list: typing.List[str],
+    input_dir: Path,
+    count: int,
+    jobs: int = EXECUTOR_JOBS,
+) -> typing.List[dict]:
+    """Benchmark transforming every source one at a time and in each kind of pool.
+
+    Run it on both the standard and free-threaded builds of Python,
+    then compare the two, to see what removing the GIL does for the thread pool.
+
+    Args:
+        source_list (list): The slugs of the sources.
+        input_dir (Path): The directory where our raw data files are stored.
+        count (int): The total number of raw rows in the sources.
+        jobs (int): The number of parallel jobs in each pool. Default 4.
+
+    Returns: A list of results with the rate in raw rows per second.
+    """
+    result_list = [
+        measure(
+            "transform_sources",
+            partial(consolidate.transform_sources, source_list, input_dir),
+            count,
+            executor="serial",
+            jobs=1,
+        )
+    ]
+    for executor in consolidate.EXECUTORS:
+        if executor == "interpreter" and consolidate.InterpreterPoolExecutor is None:
+            continue
+        result_list.append(
+            measure(
+                "transform_sources",
+                partial(
+                    consolidate.transform_sources,
+                    source_list,
+                    input_dir,
+                    jobs=jobs,
+                    executor=executor,
+                ),
+                count,
+                executor=executor,
+                jobs=jobs,
+            )
+        )
+    return result_list
+
+
+def benchmark_integrate(count: int, seed: int = 0) -> typing.List[dict]:
+    """Benchmark finding changes and their likely ancestors with fake datasets.
+
+    Args:
+        count (int): The number of records in the current dataset.
+        seed (int): The seed for the fake data. Default 0.
+
+    Returns: A list of results.
+    """
+    current_list, new_list, _ = synthetic.generate_integrated(count, seed)
+    current_by_source = integrate.regroup_by_source(
+        [WarnNotice.from_dict(r) for r in current_list]
+    )
+    new_by_source = integrate.regroup_by_source(
+        [WarnNotice.from_dict(r) for r in new_list]
+    )
+    result_list = []
+
+    # Find the records that changed
+    changed_by_source: dict = {}
+
+    def get_changed_data():
+        changed_by_source.update(
+            integrate.get_changed_data(new_by_source, current_by_source)
+        )
+
+    result_list.append(
+        measure(
+            "get_changed_data", get_changed_data, len(new_list), current_count=count
+        )
+    )
+
+    # Then look for their ancestors, the way integrate.run does
+    changed_count = sum(len(v) for v in changed_by_source.values())
+
+    def get_likely_ancestors():
+        for postal_code, change_list in changed_by_source.items():
+            current_row_list = current_by_source[postal_code]
+            ancestor_index = integrate.get_ancestor_index(current_row_list)
+            for new_row in change_list:
+                integrate.get_likely_ancestor(new_row, current_row_list, ancestor_index)
+
+    result_list.append(
+        measure(
+            "get_likely_ancestor",
+            get_likely_ancestors,
+            changed_count,
+            current_count=count,
+        )
+    )
+    return result_list
+
+
+def get_meta(scale: typing.Optional[float], seed: int) -> dict:
+    """Describe the circumstances of a benchmark run, so results can be compared fairly.
+
+    Args:
+        scale (float): The scale of any fake data.
+        seed (int): The seed for any fake data.
+
+    Returns: A dictionary of details.
+    """
+    try:
+        commit: typing.Optional[str] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        python=platform.python_version(),
+        # Only free-threaded builds can turn it off
+        gil_enabled=getattr(sys, "_is_gil_enabled", lambda: True)(),
+        platform=platform.platform(),
+        scale=scale,
+        seed=seed,
+        hash_version=utils.WARN_TRANSFORMER_HASH_VERSION,
+    )
+
+
+def compare(old_path: Path, new_path: Path) -> typing.List[dict]:
+    """Compare two sets of benchmark results.
+
+    Args:
+        old_path (Path): The JSON results to compare against.
+        new_path (Path): The JSON results to compare.
+
+    Returns: A list of the benchmarks found in both, with their old and new rates
+        and the speedup of the new over the old.
+    """
+    with open(old_path) as fh:
+        old_dict = {get_result_key(r): r for r in json.load(fh)["results"]}
+    with open(new_path) as fh:
+        new_list = json.load(fh)["results"]
+
+    comparison_list = []
+    for new in new_list:
+        old = old_dict.get(get_result_key(new))
+        if not old or not old["rate"] or not new["rate"]:
+            continue
+        comparison_list.append(
+            dict(
+                name=new["name"],
+                params=new["params"],
+                old_rate=old["rate"],
+                new_rate=new["rate"],
+                speedup=round(new["rate"] / old["rate"], 3),
+            )
+        )
+    return comparison_list
+
+
+def get_result_key(result: dict) -> str:
+    """Get a key that identifies a benchmark across runs.
+
+    Args:
+        result (dict): A benchmark result.
+
+    Returns: A string combining the name and parameters.
+    """
+    return f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,149 @@
+import typing
+from collections import Counter
+from itertools import combinations
+
+# How similar two company names must be to be considered variations of one another
+COMPANY_SIMILARITY = 0.95
+
+# The Jaro-Winkler similarity boosts the Jaro similarity of names
+# that start the same way, by 10% of the gap to a perfect score for each of up to four characters
+WINKLER_SCALE = 0.1
+WINKLER_PREFIX = 4
+
+
+def get_min_overlap(prefix_length: int) -> float:
+    """Get the share of its characters a company name must have matched in a similar one.
+
+    The Jaro similarity averages the share of each name that's matched with the share of matches
+    that aren't transposed. So it can't be higher than the share of either name that's matched,
+    with two perfect scores to make up the difference. The bonus for a shared prefix lowers the
+    Jaro similarity a pair needs, and with it the share of characters.
+
+    Args:
+        prefix_length (int): The number of characters the names share at the start, up to four.
+
+    Returns: The share of characters, which the matches must exceed.
+    """
+    boost = WINKLER_SCALE * prefix_length
+    min_jaro = (COMPANY_SIMILARITY - boost) / (1 - boost)
+    # Leave a little room for rounding error
+    return 3 * min_jaro - 2 - 1e-9
+
+
+# The shortest a name can be next to a similar one, as a share of its length
+MIN_LENGTH_RATIO = get_min_overlap(WINKLER_PREFIX)
+
+
+def get_tokens(company: str) -> typing.List[str]:
+    """Split a company name into tokens.
+
+    Every character is a token, numbered by how many times it has appeared so far,
+    so names that repeat a letter share it as many times as they both have it.
+    Case is kept, since it counts against similarity too.
+
+    Args:
+        company (str): The company name.
+
+    Returns: A list of tokens, like "a1", in the order they appear.
+    """
+    counter: typing.Counter[str] = Counter()
+    token_list = []
+    for char in company:
+        counter[char] += 1
+        token_list.append(f"{char}{counter[char]}")
+    return token_list
+
+
+def count_tokens(company_list: typing.Iterable[typing.Any]) -> typing.Dict[str, int]:
+    """Count how many company names each token appears in.
+
+    Args:
+        company_list (list): The company names.
+
+    Returns: A dictionary keyed by token.
+    """
+    counter: typing.Counter[str] = Counter()
+    for company in company_list:
+        if isinstance(company, str):
+            counter.update(get_tokens(company))
+    return dict(counter)
+
+
+def get_company_keys(
+    company: typing.Any, token_counts: typing.Mapping[str, int]
+) -> typing.List[str]:
+    """Get the blocking keys of a company name.
+
+    Two similar names must share one of their keys, so comparing only names
+    that share a key finds every similar name.
+
+    Names that start with the same four characters share a key for that prefix.
+    The rest must have most of their tokens in common. If two names must share
+    at least some number of tokens, the rarest of them can't be any further down either list
+    than the number that could go unshared. So it's among the few rarest tokens of both,
+    and the two rarest are among those few, plus one.
+
+    The fewer characters two names start with in common, the more tokens they must share,
+    so each length of shared start gets its own keys, made of the start and one of those rare tokens.
+    Names that don't start the same way at all are keyed by pairs of rare tokens instead,
+    since they're the bulk of the comparisons and pairs are shared by far fewer names.
+
+    Args:
+        company (str): The company name.
+        token_counts (dict): How many names each token appears in, from count_tokens. Any two names compared must be keyed with the same counts.
+
+    Returns: A list of keys. It's empty if there's no name to block on.
+    """
+    if not isinstance(company, str) or not company:
+        return []
+
+    # Sort the tokens from rarest to most common
+    token_list = get_tokens(company)
+    token_list.sort(key=lambda t: (token_counts.get(t, 0), t))
+
+    # Names that start the same way
+    key_list = []
+    if len(company) >= WINKLER_PREFIX:
+        key_list.append(f"{WINKLER_PREFIX}:{company[:WINKLER_PREFIX]}")
+
+    # Names that share fewer characters at the start
+    for prefix_length in range(min(WINKLER_PREFIX - 1, len(company)), 0, -1):
+        key_count = get_key_count(len(token_list), get_min_overlap(prefix_length))
+        key_list.extend(
+            f"{prefix_length}:{company[:prefix_length]}:{t}"
+            for t in token_list[:key_count]
+        )
+
+    # And names that share none. Only a single character can be similar to one.
+    key_count = get_key_count(len(token_list), get_min_overlap(0))
+    if len(token_list) > 1:
+        key_list.extend(
+            f"0:{t1}:{t2}" for t1, t2 in combinations(token_list[: key_count + 1], 2)
+        )
+    else:
+        key_list.extend(f"0:{t}" for t in token_list)
+    return key_list
+
+
+def get_key_count(token_count: int, overlap: float) -> int:
+    """Count how many of a name's rarest tokens must include one it shares with any similar name.
+
+    Args:
+        token_count (int): The number of tokens in the name.
+        overlap (float): The share of its tokens a similar name must share.
+
+    Returns: As many tokens as could go unshared, plus one.
+    """
+    return token_count - int(token_count * overlap)
+
+
+def is_similar_length(s1: str, s2: str) -> bool:
+    """Evaluate whether two company names are close enough in length to be similar.
+
+    Args:
+        s1 (str): The first name.
+        s2 (str): The second name.
+
+    Returns True or False.
+    """
+    return min(len(s1), len(s2)) > max(len(s1), len(s2)) * MIN_LENGTH_RATIO
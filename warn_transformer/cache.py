@@ -0,0 +1,188 @@
+import ast
+import hashlib
+import json
+import logging
+import typing
+from datetime import date
+from importlib import metadata, util
+from pathlib import Path
+
+from marshmallow import fields
+
+from . import schema, utils
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the layout of the cache files changes
+CACHE_VERSION = 2
+
+
+def get_cache_dir() -> Path:
+    """Get the directory where transformed sources are cached.
+
+    Returns: A Path to the cache directory.
+    """
+    return utils.WARN_TRANSFORMER_OUTPUT_DIR / "cache" / "consolidate"
+
+
+def get_key(source: str, input_dir: Path) -> str:
+    """Compute a key that changes whenever a source's output could change.
+
+    The key combines the raw data file with the source code of the transformer,
+    every module of ours it imports, directly or through another,
+    the version of marshmallow that validates it and the hash_id version in use.
+
+    Args:
+        source (str): The slug of the source.
+        input_dir (Path): The directory where our raw data files are stored.
+
+    Returns: A hexdigest string.
+    """
+    hash_obj = hashlib.sha256(
+        "-".join(
+            [
+                str(CACHE_VERSION),
+                str(utils.WARN_TRANSFORMER_HASH_VERSION),
+                metadata.version("marshmallow"),
+            ]
+        ).encode("utf-8")
+    )
+    path_list = [input_dir / f"{source}.csv"]
+    path_list.extend(get_import_paths(f"warn_transformer.transformers.{source}"))
+    for path in path_list:
+        hash_obj.update(path.read_bytes())
+    return hash_obj.hexdigest()
+
+
+def get_import_paths(module_name: str) -> typing.List[Path]:
+    """Find the source files of a module and every module from the same package it imports, directly or not.
+
+    Args:
+        module_name (str): The full name of the module, like warn_transformer.transformers.ca.
+
+    Returns: A list of Paths, sorted by module name.
+    """
+    package = module_name.partition(".")[0]
+    path_dict: typing.Dict[str, Path] = {}
+    todo_list = [module_name]
+    while todo_list:
+        name = todo_list.pop()
+        if name in path_dict:
+            continue
+        # Names pulled from a module, rather than modules themselves, aren't found
+        try:
+            spec = util.find_spec(name)
+        except ImportError:
+            continue
+        if spec is None or spec.origin is None:
+            continue
+        path_dict[name] = Path(spec.origin)
+
+        # Queue up the packages it sits in, which run when it's imported,
+        # and everything it imports from our package
+        parent = name if spec.submodule_search_locations else name.rpartition(".")[0]
+        if "." in name:
+            todo_list.append(name.rpartition(".")[0])
+        for node in ast.walk(ast.parse(path_dict[name].read_bytes())):
+            if isinstance(node, ast.Import):
+                import_list = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    base = util.resolve_name("." * node.level + base, parent)
+                import_list = [base] + [f"{base}.{a.name}" for a in node.names]
+            else:
+                continue
+            todo_list.extend(n for n in import_list if n.partition(".")[0] == package)
+    return [path_dict[n] for n in sorted(path_dict)]
+
+
+def get_path(source: str) -> Path:
+    """Get the path where a source's transformed data is cached.
+
+    Args:
+        source (str): The slug of the source.
+
+    Returns: A Path to the cache file.
+    """
+    return get_cache_dir() / f"{source}.jsonl"
+
+
+def read(source: str, key: str) -> typing.Optional[typing.Iterator[dict]]:
+    """Read a source's transformed data from the cache.
+
+    Args:
+        source (str): The slug of the source.
+        key (str): The key computed by get_key.
+
+    Returns: An iterator of validated records. Or, if there's no current cache entry, a None.
+    """
+    cache_path = get_path(source)
+    if not cache_path.exists():
+        return None
+
+    # Make sure the entry is still good
+    with open(cache_path) as fh:
+        if json.loads(fh.readline())["key"] != key:
+            logger.debug(f"{source.upper()} cache entry is stale")
+            return None
+
+    # Pass out the rows
+    return iter_rows(cache_path)
+
+
+def iter_rows(cache_path: Path) -> typing.Iterator[dict]:
+    """Read the rows from a cache file one at a time.
+
+    Args:
+        cache_path (Path): The path to the cache file.
+
+    Returns: An iterator of validated records.
+    """
+    # Figure out which fields JSON flattened from dates into strings
+    date_fields = [
+        name
+        for name, field in schema.WarnNoticeSchema._declared_fields.items()
+        if isinstance(field, fields.Date)
+    ]
+    with open(cache_path) as fh:
+        # Skip the key
+        next(fh)
+        for line in fh:
+            row = json.loads(line)
+            for name in date_fields:
+                if row[name]:
+                    row[name] = date.fromisoformat(row[name])
+            yield row
+
+
+def write_through(
+    source: str, key: str, row_list: typing.Iterable[typing.Mapping]
+) -> typing.Iterator[typing.Mapping]:
+    """Write a source's transformed data to the cache as it passes through.
+
+    The entry is only saved once every row has been read.
+
+    Args:
+        source (str): The slug of the source.
+        key (str): The key computed by get_key.
+        row_list (iterable): Validated records.
+
+    Returns: An iterator of the same validated records.
+    """
+    cache_path = get_path(source)
+    if not cache_path.parent.exists():
+        cache_path.parent.mkdir(parents=True)
+
+    # Write to a temporary file, so that a partial run doesn't leave a broken entry
+    tmp_path = cache_path.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "w") as fh:
+            fh.write(json.dumps(dict(key=key)) + "\n")
+            for row in row_list:
+                fh.write(json.dumps(dict(row), default=str) + "\n")
+                yield row
+        tmp_path.replace(cache_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
@@ -4,23 +4,56 @@ from pathlib import Path
 
 import click
 
-from . import consolidate as consolidate_runner
-from . import download as download_runner
-from . import integrate as integrate_runner
-from . import utils
+from . import profiling, utils
+
+# Each command imports its runner when it's called, so the heavy dependencies
+# like marshmallow, requests and jellyfish are only loaded by the commands that use them.
 
 
 @click.group()
-def cli():
+@click.option(
+    "--profile",
+    default=False,
+    is_flag=True,
+    help="Profile the command with cProfile and print its hottest functions.",
+)
+@click.option(
+    "--profile-memory",
+    default=False,
+    is_flag=True,
+    help="Also trace memory allocations with tracemalloc. Implies --profile.",
+)
+@click.option(
+    "--profile-dir",
+    default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "profile",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="The Path where profiles and memory snapshots will be saved",
+)
+@click.option(
+    "--profile-top",
+    default=20,
+    type=click.IntRange(min=1),
+    help="The number of hot functions and allocations to print. Default is 20.",
+)
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    profile: bool = False,
+    profile_memory: bool = False,
+    profile_dir: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "profile",
+    profile_top: int = 20,
+):
     """Consolidate, enrich and republish the data gathered by warn-scraper."""
-    pass
+    if profile or profile_memory:
+        profiling.enable(profile_dir, memory=profile_memory, top=profile_top)
+        ctx.call_on_close(profiling.disable)
 
 
 @cli.command()
 @click.option(
     "--download-dir",
     default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
-    type=click.Path(),
+    type=click.Path(path_type=Path),
     help="The Path were the results will be downloaded",
 )
 @click.option(
@@ -28,6 +61,18 @@ def cli():
     default=None,
     help="The source to download. Default is all sources.",
 )
+@click.option(
+    "--concurrency",
+    default=1,
+    type=click.IntRange(min=1),
+    help="The number of files to download at the same time. Default is 1.",
+)
+@click.option(
+    "--force",
+    default=False,
+    is_flag=True,
+    help="Download every file, even those that haven't changed.",
+)
 @click.option(
     "--log-level",
     "-l",
@@ -38,21 +83,34 @@ def cli():
     help="Set the logging level",
 )
 def download(
-    download_dir: Path, source: typing.Optional[str] = None, log_level: str = "INFO"
+    download_dir: Path,
+    source: typing.Optional[str] = None,
+    concurrency: int = 1,
+    force: bool = False,
+    log_level: str = "INFO",
 ):
     """Download all the CSVs in the WARN Notice project on biglocalnews.org."""
     logging.getLogger("urllib3").setLevel(logging.ERROR)
     logging.basicConfig(level=log_level, format="%(asctime)s - %(name)s - %(message)s")
     logger = logging.getLogger(__name__)
     logger.debug("Running download command")
-    download_runner.run(download_dir, source)
+    from . import download as download_runner
+
+    with profiling.stage("download"):
+        summary = download_runner.run(
+            download_dir, source, concurrency=concurrency, force=force
+        )
+    if summary["failure_list"]:
+        raise click.ClickException(
+            f"{len(summary['failure_list'])} of {summary['file_count']} downloads failed"
+        )
 
 
 @cli.command()
 @click.option(
     "--input-dir",
     default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
-    type=click.Path(),
+    type=click.Path(path_type=Path),
     help="The Path were the raw files results are located",
 )
 @click.option(
@@ -60,6 +118,55 @@ def download(
     default=None,
     help="The source to download. Default is all sources.",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="The number of sources to transform in parallel. Default is 1.",
+)
+@click.option(
+    "--executor",
+    default="process",
+    type=click.Choice(("process", "thread", "interpreter")),
+    help="The kind of pool to transform sources in parallel with. Interpreters require Python 3.14. Default is process.",
+)
+@click.option(
+    "--shards",
+    default=1,
+    type=click.IntRange(min=1),
+    help="The number of processes to split each large source across. Default is 1.",
+)
+@click.option(
+    "--no-cache",
+    default=False,
+    is_flag=True,
+    help="Do not read or write the cache of transformed sources.",
+)
+@click.option(
+    "--rebuild",
+    default=False,
+    is_flag=True,
+    help="Ignore the cache and transform every source again.",
+)
+@click.option(
+    "--stream",
+    default=False,
+    is_flag=True,
+    help="Transform each source a chunk at a time to limit memory use.",
+)
+@click.option(
+    "--fast-validation",
+    default=False,
+    is_flag=True,
+    help="Validate records with a fast loader compiled from the schema.",
+)
+@click.option(
+    "--prometheus",
+    default=False,
+    is_flag=True,
+    help="Also write the run report as a Prometheus textfile.",
+)
 @click.option(
     "--log-level",
     "-l",
@@ -70,20 +177,44 @@ def download(
     help="Set the logging level",
 )
 def consolidate(
-    input_dir: Path, source: typing.Optional[str] = None, log_level: str = "INFO"
+    input_dir: Path,
+    source: typing.Optional[str] = None,
+    jobs: int = 1,
+    executor: str = "process",
+    shards: int = 1,
+    no_cache: bool = False,
+    rebuild: bool = False,
+    stream: bool = False,
+    fast_validation: bool = False,
+    prometheus: bool = False,
+    log_level: str = "INFO",
 ):
     """Consolidate raw data using a common data schema."""
     logging.basicConfig(level=log_level, format="%(asctime)s - %(name)s - %(message)s")
     logger = logging.getLogger(__name__)
     logger.debug("Running consolidate command")
-    consolidate_runner.run(input_dir, source)
+    from . import consolidate as consolidate_runner
+
+    with profiling.stage("consolidate"):
+        consolidate_runner.run(
+            input_dir,
+            source,
+            jobs=jobs,
+            executor=executor,
+            shards=shards,
+            use_cache=not no_cache,
+            rebuild=rebuild,
+            stream=stream,
+            fast_validation=fast_validation,
+            prometheus=prometheus,
+        )
 
 
 @cli.command()
 @click.option(
     "--input-dir",
     default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "processed" / "consolidated.csv",
-    type=click.Path(),
+    type=click.Path(path_type=Path),
     help="The Path were the new results are located",
 )
 @click.option(
@@ -91,6 +222,36 @@ def consolidate(
     default=False,
     is_flag=True,
 )
+@click.option(
+    "--current-path",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="A local copy of the current dataset to use instead of downloading it.",
+)
+@click.option(
+    "--no-cache",
+    default=False,
+    is_flag=True,
+    help="Download the current dataset even if the cached copy is up to date.",
+)
+@click.option(
+    "--store",
+    default=False,
+    is_flag=True,
+    help="Keep the integrated dataset in a SQLite database and integrate changes into it in place.",
+)
+@click.option(
+    "--run-size",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Write integrated.csv by merging sorted runs of this many records, to bound memory.",
+)
+@click.option(
+    "--prometheus",
+    default=False,
+    is_flag=True,
+    help="Also write the run report as a Prometheus textfile.",
+)
 @click.option(
     "--log-level",
     "-l",
@@ -100,13 +261,291 @@ def consolidate(
     ),
     help="Set the logging level",
 )
-def integrate(input_dir: Path, init: bool = False, log_level: str = "INFO"):
+def integrate(
+    input_dir: Path,
+    init: bool = False,
+    current_path: typing.Optional[Path] = None,
+    no_cache: bool = False,
+    store: bool = False,
+    run_size: typing.Optional[int] = None,
+    prometheus: bool = False,
+    log_level: str = "INFO",
+):
     """Integrate the latest consolidated data with the current database."""
     logging.getLogger("urllib3").setLevel(logging.ERROR)
     logging.basicConfig(level=log_level, format="%(asctime)s - %(name)s - %(message)s")
     logger = logging.getLogger(__name__)
     logger.debug("Running integrate command")
-    integrate_runner.run(input_dir, init_current_data=init)
+    from . import integrate as integrate_runner
+
+    with profiling.stage("integrate"):
+        integrate_runner.run(
+            input_dir,
+            init_current_data=init,
+            current_path=current_path,
+            use_cache=not no_cache,
+            prometheus=prometheus,
+            use_store=store,
+            run_size=run_size,
+        )
+
+
+@cli.command()
+@click.option(
+    "--download-dir",
+    default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
+    type=click.Path(path_type=Path),
+    help="The Path were the results will be downloaded",
+)
+@click.option(
+    "--source",
+    default=None,
+    help="The source to run. Default is all sources.",
+)
+@click.option(
+    "--skip-download",
+    default=False,
+    is_flag=True,
+    help="Work from the files already in the download directory.",
+)
+@click.option(
+    "--concurrency",
+    default=1,
+    type=click.IntRange(min=1),
+    help="The number of files to download at the same time. Default is 1.",
+)
+@click.option(
+    "--force",
+    default=False,
+    is_flag=True,
+    help="Download every file, even those that haven't changed.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    help="The number of sources to transform in parallel. Default is 1.",
+)
+@click.option(
+    "--no-cache",
+    default=False,
+    is_flag=True,
+    help="Do not use the caches of transformed sources or the current dataset.",
+)
+@click.option(
+    "--init",
+    default=False,
+    is_flag=True,
+)
+@click.option(
+    "--current-path",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="A local copy of the current dataset to use instead of downloading it.",
+)
+@click.option(
+    "--store",
+    default=False,
+    is_flag=True,
+    help="Keep the integrated dataset in a SQLite database and integrate changes into it in place.",
+)
+@click.option(
+    "--run-size",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Write integrated.csv by merging sorted runs of this many records, to bound memory.",
+)
+@click.option(
+    "--prometheus",
+    default=False,
+    is_flag=True,
+    help="Also write the run report as a Prometheus textfile.",
+)
+@click.option(
+    "--log-level",
+    "-l",
+    default="INFO",
+    type=click.Choice(
+        ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"), case_sensitive=False
+    ),
+    help="Set the logging level",
+)
+def pipeline(
+    download_dir: Path,
+    source: typing.Optional[str] = None,
+    skip_download: bool = False,
+    concurrency: int = 1,
+    force: bool = False,
+    jobs: int = 1,
+    no_cache: bool = False,
+    init: bool = False,
+    current_path: typing.Optional[Path] = None,
+    store: bool = False,
+    run_size: typing.Optional[int] = None,
+    prometheus: bool = False,
+    log_level: str = "INFO",
+):
+    """Download, consolidate and integrate the data in a single run."""
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(name)s - %(message)s")
+    logger = logging.getLogger(__name__)
+    logger.debug("Running pipeline command")
+    from . import pipeline as pipeline_runner
+
+    # Each stage of the pipeline is profiled on its own, if profiling is on
+    timing_dict = pipeline_runner.run(
+        download_dir,
+        source,
+        skip_download=skip_download,
+        concurrency=concurrency,
+        force=force,
+        jobs=jobs,
+        use_cache=not no_cache,
+        init_current_data=init,
+        current_path=current_path,
+        prometheus=prometheus,
+        use_store=store,
+        run_size=run_size,
+    )
+    for stage, seconds in timing_dict.items():
+        click.echo(f"{stage}: {seconds:.2f}s")
+    click.echo(f"total: {sum(timing_dict.values()):.2f}s")
+
+
+@cli.command()
+@click.option(
+    "--output-dir",
+    default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "synthetic",
+    type=click.Path(path_type=Path),
+    help="The Path where the fake files will be written",
+)
+@click.option(
+    "--template-dir",
+    default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="The Path where the real raw files to model the fake ones on are located",
+)
+@click.option(
+    "--scale",
+    default=1.0,
+    type=click.FloatRange(min=0),
+    help="How many times larger than the real files the fake ones should be. Default is 1.",
+)
+@click.option(
+    "--seed",
+    default=0,
+    type=int,
+    help="The seed for the random number generator. Default is 0.",
+)
+@click.option(
+    "--integrated-count",
+    default=0,
+    type=click.IntRange(min=0),
+    help="The number of records in a fake current integrated dataset to write. Default is none.",
+)
+@click.option(
+    "--log-level",
+    "-l",
+    default="INFO",
+    type=click.Choice(
+        ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"), case_sensitive=False
+    ),
+    help="Set the logging level",
+)
+def synthesize(
+    output_dir: Path,
+    template_dir: Path,
+    scale: float = 1.0,
+    seed: int = 0,
+    integrated_count: int = 0,
+    log_level: str = "INFO",
+):
+    """Write out fake data for testing at scale."""
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(name)s - %(message)s")
+    logger = logging.getLogger(__name__)
+    logger.debug("Running synthesize command")
+    from . import synthetic as synthetic_runner
+
+    with profiling.stage("synthesize"):
+        synthetic_runner.generate_raw(
+            output_dir / "raw", scale=scale, seed=seed, template_dir=template_dir
+        )
+        if integrated_count:
+            synthetic_runner.write_integrated(
+                output_dir / "processed", integrated_count, seed=seed
+            )
+
+
+@cli.command()
+@click.option(
+    "--output-path",
+    default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "benchmark.json",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="The Path where the JSON results will be written",
+)
+@click.option(
+    "--input-dir",
+    default=utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="The Path were the raw files results are located",
+)
+@click.option(
+    "--scale",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Benchmark fake data modeled on the raw files at this scale.",
+)
+@click.option(
+    "--seed",
+    default=0,
+    type=int,
+    help="The seed for any fake data. Default is 0.",
+)
+@click.option(
+    "--source",
+    default=None,
+    help="The source to benchmark. Default is all sources.",
+)
+@click.option(
+    "--compare",
+    "compare_path",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Earlier JSON results to compare against.",
+)
+@click.option(
+    "--log-level",
+    "-l",
+    default="INFO",
+    type=click.Choice(
+        ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"), case_sensitive=False
+    ),
+    help="Set the logging level",
+)
+def benchmark(
+    output_path: Path,
+    input_dir: Path,
+    scale: typing.Optional[float] = None,
+    seed: int = 0,
+    source: typing.Optional[str] = None,
+    compare_path: typing.Optional[Path] = None,
+    log_level: str = "INFO",
+):
+    """Benchmark every stage of the pipeline and save the results as JSON."""
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(name)s - %(message)s")
+    logger = logging.getLogger(__name__)
+    logger.debug("Running benchmark command")
+    from . import benchmark as benchmark_runner
+
+    with profiling.stage("benchmark"):
+        benchmark_runner.run(
+            output_path, input_dir, scale=scale, seed=seed, source=source
+        )
+    if compare_path:
+        for c in benchmark_runner.compare(compare_path, output_path):
+            params = ", ".join(f"{k}={v}" for k, v in c["params"].items())
+            click.echo(f"{c['name']} ({params}): {c['speedup']:.2f}x")
 
 
 if __name__ == "__main__":
@@ -1,27 +1,58 @@
 import csv
 import logging
 import typing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from importlib import import_module
 from pathlib import Path
 
-from . import utils
+from . import cache, metrics, utils
+from .schema import WarnNotice, pack_records, unpack_records
+
+try:
+    from concurrent.futures import InterpreterPoolExecutor  # type: ignore
+except ImportError:
+    # It was added in Python 3.14
+    InterpreterPoolExecutor = None
 
 logger = logging.getLogger(__name__)
 
+# The kinds of pool that can transform sources in parallel
+EXECUTORS = ("process", "thread", "interpreter")
+
 
 def run(
     input_dir: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
     source: typing.Optional[str] = None,
+    jobs: int = 1,
+    executor: str = "process",
+    shards: int = 1,
+    use_cache: bool = True,
+    rebuild: bool = False,
+    stream: bool = False,
+    fast_validation: bool = False,
+    record_list: typing.Optional[typing.List[WarnNotice]] = None,
+    prometheus: bool = False,
 ) -> Path:
     """Consolidate raw data using a common data schema.
 
     Args:
         input_dir (Path): The directory where our raw data files are stored.
         source (string): The slug of a source you'd like to transform as a one-off (optional)
+        jobs (int): The number of sources to transform in parallel. Default 1.
+        executor (str): The kind of pool to transform sources in parallel with: process, thread or interpreter. Default process.
+        shards (int): The number of processes to split each large source across, in order. Doesn't apply when streaming. Default 1.
+        use_cache (bool): Set to False to skip reading and writing the cache of transformed sources. Default True.
+        rebuild (bool): Set to True to ignore the cache and transform every source again. Default False.
+        stream (bool): Set to True to transform each source a chunk at a time, rather than reading it all into memory. Only applies when jobs is 1. Default False.
+        fast_validation (bool): Set to True to validate records with a FastSchemaLoader rather than marshmallow. Default False.
+        record_list (list): A list to fill with each record as it's written out, so later steps can skip reading the file back in (optional)
+        prometheus (bool): Set to True to write a Prometheus textfile alongside our JSON report of the run. Default False.
 
     Returns: The path to our consolidated comma-delimited file.
     """
     logging.basicConfig(level="DEBUG", format="%(asctime)s - %(name)s - %(message)s")
+    report = metrics.RunReport("consolidate")
 
     # Get all of the transformers
     transformer_list = utils.get_all_transformers()
@@ -31,27 +62,45 @@ def run(
     if source:
         transformer_list = [t for t in transformer_list if source.lower() in t.lower()]
 
-    # Loop through them
-    obj_list = []
+    # Pull any sources that haven't changed from the cache
+    result_dict: typing.Dict[str, typing.Iterable[typing.Mapping]] = {}
+    key_dict = {}
+    if use_cache:
+        for t in transformer_list:
+            key_dict[t] = cache.get_key(t, input_dir)
+            if rebuild:
+                continue
+            cached_iter = cache.read(t, key_dict[t])
+            if cached_iter is not None:
+                logger.debug(f"{t.upper()} data loaded from cache")
+                result_dict[t] = cached_iter
+    todo_list = [t for t in transformer_list if t not in result_dict]
     for t in transformer_list:
-        # Get the module
-        module = import_module(f"warn_transformer.transformers.{t}")
-
-        # Transform the data
-        source_list = module.Transformer(input_dir).transform()
-        if len(source_list) <= 3:
-            logger.warning(
-                f"{t.upper()} data quality problem: {len(source_list):,} items found."
-            )
-        else:
-            logger.debug(f"{t.upper()} data {len(source_list):,} items found.")
+        report.add_source(t, dict(cached=t in result_dict))
+    report.end_stage("cache")
 
-        # Add it to the master list
-        obj_list += source_list
+    # Keep track of what the transformers report, once they're done
+    metrics_by_source: typing.Dict[str, dict] = {t: {} for t in todo_list}
 
-    # Drop duplicates by using the hash as a unique identifer
-    unique_list = list({d["hash_id"]: d for d in obj_list}.values())
-    logger.debug(f"Dropped {len(obj_list) - len(unique_list)} duplicates")
+    # Transform the rest
+    result_dict.update(
+        transform_sources(
+            todo_list,
+            input_dir,
+            jobs=jobs,
+            executor=executor,
+            stream=stream,
+            fast_validation=fast_validation,
+            shards=shards,
+            metrics_by_source=metrics_by_source,
+        )
+    )
+
+    # Save what we transform for next time
+    if use_cache:
+        for t in todo_list:
+            result_dict[t] = cache.write_through(t, key_dict[t], result_dict[t])
+    report.end_stage("transform")
 
     # Get the output directory
     processed_dir = utils.WARN_TRANSFORMER_OUTPUT_DIR / "processed"
@@ -60,15 +109,234 @@ def run(
 
     # Output a consolidated CSV
     consolidated_path = processed_dir / "consolidated.csv"
-    logger.debug(f"Writing {len(unique_list)} records to {consolidated_path}")
+    logger.debug(f"Writing records to {consolidated_path}")
+    hash_set = set()
+    row_count = 0
     with open(consolidated_path, "w") as fh:
-        writer = csv.DictWriter(fh, unique_list[0].keys())
-        writer.writeheader()
-        writer.writerows(unique_list)
+        writer = None
+        # Loop through the results in a consistent order
+        for t in transformer_list:
+            source_count = 0
+            written_count = 0
+            for row in result_dict[t]:
+                source_count += 1
+
+                # Drop duplicates by using the hash as a unique identifer
+                if row["hash_id"] in hash_set:
+                    continue
+                hash_set.add(row["hash_id"])
+                written_count += 1
+
+                # Write it out
+                if writer is None:
+                    writer = csv.DictWriter(fh, row.keys())
+                    writer.writeheader()
+                writer.writerow(row)
+                if record_list is not None:
+                    record_list.append(get_csv_record(row))
+
+            # Check the data
+            if source_count <= 3:
+                logger.warning(
+                    f"{t.upper()} data quality problem: {source_count:,} items found."
+                )
+            else:
+                logger.debug(f"{t.upper()} data {source_count:,} items found.")
+            row_count += source_count
+
+            # Report what happened to it
+            report.add_source(t, metrics_by_source.get(t, {}))
+            report.add_source(
+                t,
+                dict(
+                    transformed_rows=source_count,
+                    written_rows=written_count,
+                    duplicate_rows=source_count - written_count,
+                ),
+            )
+
+    logger.debug(f"Dropped {row_count - len(hash_set)} duplicates")
+    logger.debug(f"Wrote {len(hash_set)} records to {consolidated_path}")
+    report.end_stage("write")
+
+    # Write out a report on the run
+    report.write(processed_dir, prometheus=prometheus)
 
     # Return the path
     return consolidated_path
 
 
+def get_csv_record(row: typing.Mapping) -> WarnNotice:
+    """Convert a record to the strings it is written out as, as if it was read back from our CSV file.
+
+    Args:
+        row (dict): A transformed record.
+
+    Returns: A WarnNotice with every value converted to a string.
+    """
+    return WarnNotice(**{k: "" if v is None else str(v) for k, v in row.items()})
+
+
+def transform_sources(
+    source_list: typing.List[str],
+    input_dir: Path,
+    jobs: int = 1,
+    executor: str = "process",
+    stream: bool = False,
+    fast_validation: bool = False,
+    shards: int = 1,
+    metrics_by_source: typing.Optional[typing.Dict[str, dict]] = None,
+) -> typing.Dict[str, typing.Iterable[dict]]:
+    """Transform the raw data from a list of sources, spreading the work across a pool if requested.
+
+    Args:
+        source_list (list): The slugs of the sources to transform.
+        input_dir (Path): The directory where our raw data files are stored.
+        jobs (int): The number of sources to transform in parallel. Default 1.
+        executor (str): The kind of pool to transform sources in parallel with: process, thread or interpreter. Default process.
+        stream (bool): Set to True to return iterators that transform each source a chunk at a time. Only applies when jobs is 1. Default False.
+        fast_validation (bool): Set to True to validate records with a FastSchemaLoader. Default False.
+        shards (int): The number of processes to split each large source across. Default 1.
+        metrics_by_source (dict): A dictionary to fill with each source's metrics, keyed by slug (optional)
+
+    Returns: A dictionary with a validated list, or iterator, of records for each source.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor {executor}")
+    if executor == "interpreter" and InterpreterPoolExecutor is None:
+        raise ValueError("The interpreter executor requires Python 3.14 or later")
+    if metrics_by_source is None:
+        metrics_by_source = {}
+    for source in source_list:
+        metrics_by_source.setdefault(source, {})
+
+    # If there's only one job, transform each source in turn.
+    # If we're streaming, nothing is transformed until the records are read.
+    if jobs == 1:
+        return {
+            source: transform_source(
+                source,
+                input_dir,
+                stream=stream,
+                fast_validation=fast_validation,
+                shards=shards,
+                source_metrics=metrics_by_source[source],
+            )
+            for source in source_list
+        }
+
+    # Otherwise spread the sources across a pool.
+    # Threads skip the cost of pickling the results back from another process or interpreter,
+    # though they only run in parallel on a free-threaded build of Python.
+    # Processes and interpreters hand back their records packed into plain tuples,
+    # which are much quicker to pickle.
+    logger.debug(f"Transforming with {jobs} parallel {executor} jobs")
+    pool_class = dict(
+        process=ProcessPoolExecutor,
+        thread=ThreadPoolExecutor,
+        interpreter=InterpreterPoolExecutor,
+    )[executor]
+    packed = executor != "thread"
+    result_dict: typing.Dict[str, typing.Iterable[dict]] = {}
+    with pool_class(max_workers=jobs) as pool:
+        # Map returns results in the order they were submitted
+        # so we can match them back up to their source
+        worker = partial(
+            transform_source_job,
+            input_dir=input_dir,
+            fast_validation=fast_validation,
+            shards=shards,
+            packed=packed,
+        )
+        for source, (row_list, job_metrics) in zip(
+            source_list, pool.map(worker, source_list)
+        ):
+            result_dict[source] = unpack_records(row_list) if packed else row_list
+            metrics_by_source[source].update(job_metrics)
+    return result_dict
+
+
+def transform_source(
+    source: str,
+    input_dir: Path,
+    stream: bool = False,
+    fast_validation: bool = False,
+    shards: int = 1,
+    source_metrics: typing.Optional[dict] = None,
+) -> typing.Iterable[dict]:
+    """Transform the raw data from a single source.
+
+    Args:
+        source (str): The slug of the source to transform.
+        input_dir (Path): The directory where our raw data files are stored.
+        stream (bool): Set to True to return an iterator that transforms the data a chunk at a time. Default False.
+        fast_validation (bool): Set to True to validate records with a FastSchemaLoader. Default False.
+        shards (int): The number of processes to split the source's rows across. Default 1.
+        source_metrics (dict): A dictionary to fill with the transformer's metrics once every record has been transformed (optional)
+
+    Returns: A validated list, or iterator, of records that conform to our schema
+    """
+    # Get the module
+    module = import_module(f"warn_transformer.transformers.{source}")
+
+    # Transform the data
+    transformer = module.Transformer(
+        input_dir, stream=stream, fast_validation=fast_validation, shards=shards
+    )
+    if stream:
+        return iter_transform_source(transformer, source_metrics)
+    row_list = transformer.transform()
+    if source_metrics is not None:
+        source_metrics.update(transformer.get_metrics())
+    return row_list
+
+
+def iter_transform_source(
+    transformer: typing.Any, source_metrics: typing.Optional[dict] = None
+) -> typing.Iterator[dict]:
+    """Stream the records from a transformer, collecting its metrics at the end.
+
+    Args:
+        transformer (BaseTransformer): The transformer for a source.
+        source_metrics (dict): A dictionary to fill with the transformer's metrics (optional)
+
+    Returns: An iterator of validated records that conform to our schema
+    """
+    yield from transformer.iter_transform()
+    if source_metrics is not None:
+        source_metrics.update(transformer.get_metrics())
+
+
+def transform_source_job(
+    source: str,
+    input_dir: Path,
+    fast_validation: bool = False,
+    shards: int = 1,
+    packed: bool = False,
+) -> typing.Tuple[typing.Any, dict]:
+    """Transform the raw data from a single source in a worker process, thread or interpreter.
+
+    Args:
+        source (str): The slug of the source to transform.
+        input_dir (Path): The directory where our raw data files are stored.
+        fast_validation (bool): Set to True to validate records with a FastSchemaLoader. Default False.
+        shards (int): The number of processes to split the source's rows across. Default 1.
+        packed (bool): Set to True to return the records packed by pack_records. Default False.
+
+    Returns: A tuple with the validated records, packed if requested, and the transformer's metrics.
+    """
+    job_metrics: dict = {}
+    row_list = transform_source(
+        source,
+        input_dir,
+        fast_validation=fast_validation,
+        shards=shards,
+        source_metrics=job_metrics,
+    )
+    if packed:
+        return pack_records(list(row_list)), job_metrics
+    return list(row_list), job_metrics
+
+
 if __name__ == "__main__":
     run()
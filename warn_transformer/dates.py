@@ -0,0 +1,132 @@
+import re
+import typing
+from collections import Counter
+from datetime import datetime
+
+# Loose patterns for the strptime directives our sources use.
+# They only need to rule out strings that could never parse,
+# so they accept everything strptime would, and then some.
+DIRECTIVE_PATTERNS = {
+    "d": r"\s?\d{1,2}",
+    "m": r"\d{1,2}",
+    "y": r"\d{2}",
+    "Y": r"\d{4}",
+    "H": r"\d{1,2}",
+    "M": r"\d{1,2}",
+    "S": r"\d{1,2}",
+    "f": r"\d{1,6}",
+    "b": r"[^\W\d_]+",
+    "B": r"[^\W\d_]+",
+    "a": r"[^\W\d_]+",
+    "A": r"[^\W\d_]+",
+    "p": r"[^\W\d_]+",
+    "%": "%",
+}
+
+
+def compile_format(date_format: str) -> typing.Optional[re.Pattern]:
+    """Compile a strptime format into a regular expression that screens out strings it can't parse.
+
+    Args:
+        date_format (str): A format string accepted by datetime.strptime.
+
+    Returns: A compiled regular expression. Or, if the format uses a directive we don't know, a None.
+    """
+    pattern = ""
+    i = 0
+    while i < len(date_format):
+        char = date_format[i]
+        if char == "%":
+            directive = date_format[i + 1 : i + 2]
+            if directive not in DIRECTIVE_PATTERNS:
+                return None
+            pattern += DIRECTIVE_PATTERNS[directive]
+            i += 2
+            continue
+        # Like strptime, let any run of whitespace stand in for whitespace
+        if char.isspace():
+            pattern += r"\s+"
+            while i < len(date_format) and date_format[i].isspace():
+                i += 1
+            continue
+        pattern += re.escape(char)
+        i += 1
+    return re.compile(pattern, re.IGNORECASE)
+
+
+class DateParser:
+    """Parse date strings that could come in any of several formats.
+
+    Formats are tried in order of how often they've matched so far,
+    and strings are screened with a regular expression before strptime is attempted,
+    so misses don't have to raise and catch an error.
+
+    When a string fits more than one format, the one with the highest precedence wins,
+    no matter what order they were tried in. By default that's the last format in the list,
+    which is how BaseTransformer.transform_date has always worked.
+    """
+
+    def __init__(
+        self, date_format: typing.Union[str, typing.Sequence[str]], last_match_wins=True
+    ):
+        """Intialize a new instance.
+
+        Args:
+            date_format (str or list): One or more format strings accepted by datetime.strptime.
+            last_match_wins (bool): Set to False to let the first matching format in the list win. Default True.
+        """
+        format_list = [date_format] if isinstance(date_format, str) else date_format
+        self.precedence = (
+            list(reversed(format_list)) if last_match_wins else list(format_list)
+        )
+        self.patterns = {f: compile_format(f) for f in self.precedence}
+        self.order = list(self.precedence)
+        self.hits: typing.Counter[str] = Counter()
+        self.misses = 0
+
+    def parse(self, value: str) -> typing.Optional[datetime]:
+        """Parse a date string.
+
+        Args:
+            value (str): The date string.
+
+        Returns: A datetime object. Or, if no format fits, a None.
+        """
+        for f in self.order:
+            dt = self.strptime(value, f)
+            if dt is None:
+                continue
+
+            # Make sure no format with a higher precedence fits too
+            for higher_f in self.precedence[: self.precedence.index(f)]:
+                higher_dt = self.strptime(value, higher_f)
+                if higher_dt is not None:
+                    dt, f = higher_dt, higher_f
+                    break
+
+            # Keep score and move the most useful formats up front
+            self.hits[f] += 1
+            if f != self.order[0]:
+                self.order.sort(key=lambda x: -self.hits[x])
+            return dt
+
+        # If nothing fits, log a miss
+        self.misses += 1
+        return None
+
+    def strptime(self, value: str, date_format: str) -> typing.Optional[datetime]:
+        """Parse a date string with a single format, if it fits.
+
+        Args:
+            value (str): The date string.
+            date_format (str): A format string accepted by datetime.strptime.
+
+        Returns: A datetime object. Or, if the format doesn't fit, a None.
+        """
+        pattern = self.patterns[date_format]
+        if pattern is not None and not pattern.fullmatch(value):
+            return None
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            return None
@@ -1,27 +1,51 @@
+import json
 import logging
 import os
+import time
 import typing
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import requests
 from bln.client import Client
+from retry.api import retry_call
 
 from . import utils
 
 BLN_API_KEY = os.getenv("BLN_API_TOKEN")
 BLN_PROJECT_ID = "UHJvamVjdDpiZGM5NmU1MS1kMzBhLTRlYTctODY4Yi04ZGI4N2RjMzQ1ODI="
 
+# The file in the download directory where we keep track of what we've downloaded
+MANIFEST_NAME = "manifest.json"
+
+# The details from the project listing that tell us whether a file has changed
+MANIFEST_FIELDS = ("size", "updatedAt", "md5")
+
+# How long to wait before retrying a failed download, in seconds. It doubles with each try.
+RETRY_DELAY = 2
+
 logger = logging.getLogger(__name__)
 
 
 def run(
     download_dir: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
     source: typing.Optional[str] = None,
-):
+    concurrency: int = 1,
+    tries: int = 3,
+    force: bool = False,
+) -> dict:
     """Download all the CSVs in the WARN Notice project on biglocalnews.org.
 
+    Files that haven't changed since they were last downloaded are skipped.
+
     Args:
         download_dir (Path): The directory where files will be downloaded.
         source (str): The postal code of the source to download. Default is all sources.
+        concurrency (int): The number of files to download at the same time. Default 1.
+        tries (int): The number of times to try each file before giving up. Default 3.
+        force (bool): Set to True to download every file, changed or not. Default False.
+
+    Returns: A dictionary summarizing the bytes, durations, skips and failures of the downloads.
     """
     logging.basicConfig(level="DEBUG", format="%(asctime)s - %(name)s - %(message)s")
 
@@ -32,7 +56,8 @@ def run(
     p = c.get_project_by_name("WARN Act Notices")
 
     # Get all the files in the project.
-    file_list = [f["name"] for f in p["files"]]
+    file_dict = {f["name"]: f for f in p["files"]}
+    file_list = list(file_dict)
 
     # If a source is provided, limit the list
     if source:
@@ -44,12 +69,192 @@ def run(
     if not download_dir.exists():
         download_dir.mkdir(parents=True)
 
-    # Download all the files.
-    for i, f in enumerate(sorted(file_list)):
-        logger.debug(
-            f"Download {f} to {download_dir} as file {i+1:02d} of {len(file_list):02d}"
+    # Check which files have changed since our last download
+    manifest = read_manifest(download_dir)
+    file_list = sorted(file_list)
+    if force:
+        todo_list = file_list
+    else:
+        todo_list = [
+            f
+            for f in file_list
+            if not is_unchanged(file_dict[f], manifest.get(f), download_dir)
+        ]
+    logger.debug(f"Skipping {len(file_list) - len(todo_list)} unchanged files")
+
+    # Download the rest, spreading them across a pool of threads
+    logger.debug(f"Downloading {len(todo_list)} files with {concurrency} workers")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        future_dict = {
+            f: executor.submit(
+                download_file, c, f, download_dir, i, len(todo_list), tries=tries
+            )
+            for i, f in enumerate(todo_list)
+        }
+        result_list = []
+        for f in file_list:
+            if f in future_dict:
+                result = future_dict[f].result()
+            else:
+                result = dict(
+                    name=f,
+                    path=download_dir / f,
+                    byte_count=0,
+                    seconds=0,
+                    error=None,
+                    skipped=True,
+                )
+            result_list.append(result)
+
+    # Record what we downloaded for next time
+    for result in result_list:
+        if result["error"]:
+            manifest.pop(result["name"], None)
+        elif not result["skipped"]:
+            manifest[result["name"]] = get_manifest_entry(
+                file_dict[result["name"]], result["path"]
+            )
+    write_manifest(download_dir, manifest)
+
+    # Sum up the results
+    summary = dict(
+        file_count=len(result_list),
+        byte_count=sum(r["byte_count"] for r in result_list),
+        seconds=round(time.perf_counter() - start, 3),
+        skipped_list=[r["name"] for r in result_list if r["skipped"]],
+        failure_list=[r["name"] for r in result_list if r["error"]],
+        file_list=result_list,
+    )
+    logger.debug(
+        f"Downloaded {summary['byte_count']:,} bytes in {summary['file_count']} files "
+        f"in {summary['seconds']}s"
+    )
+    if summary["failure_list"]:
+        logger.error(
+            f"{len(summary['failure_list'])} downloads failed: {', '.join(summary['failure_list'])}"
         )
-        c.download_file(BLN_PROJECT_ID, f, output_dir=download_dir)
+    return summary
+
+
+def download_file(
+    client: Client,
+    file_name: str,
+    download_dir: Path,
+    index: int,
+    total: int,
+    tries: int = 3,
+) -> dict:
+    """Download a single file from the WARN Notice project, retrying if it fails.
+
+    Args:
+        client (Client): A logged in biglocalnews.org client.
+        file_name (str): The name of the file to download.
+        download_dir (Path): The directory where the file will be downloaded.
+        index (int): The position of this file in the list we're downloading.
+        total (int): The number of files in the list we're downloading.
+        tries (int): The number of times to try before giving up. Default 3.
+
+    Returns: A dictionary with the file's name, path, size, duration and any error.
+    """
+    logger.debug(
+        f"Download {file_name} to {download_dir} as file {index+1:02d} of {total:02d}"
+    )
+    start = time.perf_counter()
+    result: typing.Dict[str, typing.Any] = dict(
+        name=file_name,
+        path=None,
+        byte_count=0,
+        seconds=None,
+        error=None,
+        skipped=False,
+    )
+    try:
+        output_path = retry_call(
+            client.download_file,
+            fargs=[BLN_PROJECT_ID, file_name],
+            fkwargs=dict(output_dir=download_dir),
+            exceptions=requests.exceptions.RequestException,
+            tries=tries,
+            delay=RETRY_DELAY,
+            backoff=2,
+            logger=logger,
+        )
+        if not output_path:
+            raise ValueError(f"No download link found for {file_name}")
+        result["path"] = Path(output_path)
+        result["byte_count"] = result["path"].stat().st_size
+    except Exception as e:
+        logger.error(f"Download of {file_name} failed: {e}")
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def read_manifest(download_dir: Path) -> dict:
+    """Read the manifest of files we've downloaded.
+
+    Args:
+        download_dir (Path): The directory where files are downloaded.
+
+    Returns: A dictionary keyed by file name. Empty if there's no manifest yet.
+    """
+    manifest_path = download_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    try:
+        return json.loads(manifest_path.read_text())
+    except ValueError:
+        logger.warning(f"Ignoring unreadable manifest at {manifest_path}")
+        return {}
+
+
+def write_manifest(download_dir: Path, manifest: dict):
+    """Save the manifest of files we've downloaded.
+
+    Args:
+        download_dir (Path): The directory where files are downloaded.
+        manifest (dict): A dictionary keyed by file name.
+    """
+    manifest_path = download_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp_path.replace(manifest_path)
+
+
+def get_manifest_entry(file: dict, path: Path) -> dict:
+    """Describe a downloaded file for the manifest.
+
+    Args:
+        file (dict): The file's metadata from the project listing.
+        path (Path): Where the file was downloaded.
+
+    Returns: A dictionary with the listing's size, update timestamp and checksum, along with the size on disk.
+    """
+    entry = {k: file.get(k) for k in MANIFEST_FIELDS}
+    entry["local_size"] = path.stat().st_size
+    return entry
+
+
+def is_unchanged(file: dict, entry: typing.Optional[dict], download_dir: Path) -> bool:
+    """Determine whether a file is the same as the one we last downloaded.
+
+    Args:
+        file (dict): The file's metadata from the project listing.
+        entry (dict): The file's entry in our manifest, if it has one.
+        download_dir (Path): The directory where files are downloaded.
+
+    Returns: True if the listing matches the manifest and the downloaded file is still in place.
+    """
+    if not entry:
+        return False
+    # If the listing doesn't tell us anything, we can't be sure
+    if all(file.get(k) is None for k in MANIFEST_FIELDS):
+        return False
+    if any(file.get(k) != entry.get(k) for k in MANIFEST_FIELDS):
+        return False
+    path = download_dir / file["name"]
+    return path.exists() and path.stat().st_size == entry.get("local_size")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import typing
+from json.encoder import encode_basestring_ascii
+
+# The versions of hash_id we know how to compute.
+# 1: A sha224 hexdigest of the record serialized by json.dumps. Our original.
+# 2: A blake2b hexdigest of a compact serialization, with a "v2-" prefix.
+HASH_VERSIONS = (1, 2)
+
+# The JSON-encoded keys we've seen, so they only need to be escaped once.
+# It's shared by every thread, which is safe since a key always encodes the same way.
+KEY_CACHE: typing.Dict[str, str] = {}
+
+
+def get_hash_id(data: dict, version: int = 1) -> str:
+    """Convert a record into a unique hexdigest to use as a unique identifier.
+
+    Args:
+        data (dict): The record to hash.
+        version (int): Which hash version to compute. Default 1.
+
+    Returns: A unique hexdigest string computed from the record.
+    """
+    if version == 1:
+        return hashlib.sha224(encode_json(data)).hexdigest()
+    elif version == 2:
+        hash_obj = hashlib.blake2b(encode_compact(data), digest_size=28)
+        return f"v2-{hash_obj.hexdigest()}"
+    raise ValueError(f"Unknown hash version {version}")
+
+
+def encode_json(data: dict) -> bytes:
+    """Serialize a flat record exactly the way json.dumps does, only faster.
+
+    Args:
+        data (dict): The record to serialize.
+
+    Returns: The UTF-8 encoded JSON string.
+    """
+    part_list = []
+    for key, value in data.items():
+        value_type = type(value)
+        if value_type is str:
+            value_str = encode_basestring_ascii(value)
+        elif value is None:
+            value_str = "null"
+        elif value is True:
+            value_str = "true"
+        elif value is False:
+            value_str = "false"
+        elif value_type is int:
+            value_str = int.__repr__(value)
+        else:
+            # Leave anything out of the ordinary to the real thing
+            return json.dumps(data).encode("utf-8")
+
+        # Escape the key, if we haven't already
+        try:
+            key_str = KEY_CACHE[key]
+        except KeyError:
+            if type(key) is not str:
+                return json.dumps(data).encode("utf-8")
+            key_str = KEY_CACHE[key] = encode_basestring_ascii(key)
+
+        part_list.append(f"{key_str}: {value_str}")
+    return ("{" + ", ".join(part_list) + "}").encode("utf-8")
+
+
+def encode_compact(data: dict) -> bytes:
+    """Serialize a flat record into a compact, unambiguous string.
+
+    Every key and string value is prefixed by its length, and every value by a type code,
+    so no two different records can produce the same result.
+
+    Args:
+        data (dict): The record to serialize.
+
+    Returns: The UTF-8 encoded string.
+    """
+    part_list = []
+    for key, value in data.items():
+        value_type = type(value)
+        if value_type is str:
+            value_str = f"s{len(value)}:{value}"
+        elif value is None:
+            value_str = "n"
+        elif value is True:
+            value_str = "t"
+        elif value is False:
+            value_str = "f"
+        elif value_type is int:
+            value_str = f"i{value};"
+        else:
+            raise TypeError(f"Cannot hash {key} value of type {value_type.__name__}")
+        part_list.append(f"{len(key)}:{key}{value_str}")
+    return "".join(part_list).encode("utf-8")
@@ -1,9 +1,16 @@
 import csv
+import hashlib
+import heapq
 import json
 import logging
+import pickle
+import sqlite3
+import tempfile
 import typing
-from collections import defaultdict
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timezone
+from functools import partial
 from itertools import chain
 from operator import itemgetter
 from pathlib import Path
@@ -11,43 +18,152 @@ from pathlib import Path
 import jellyfish
 import requests
 
-from . import utils
+from . import blocking, metrics, store, utils
+from .schema import INTEGRATED_FIELDS, WarnNotice, WarnNoticeSchema, iter_chunks
 
 logger = logging.getLogger(__name__)
 
+# Where the most recent published version of our datasets can be found
+CURRENT_DATA_BASE_URL = "https://raw.githubusercontent.com/biglocalnews/warn-github-flow/transformer/data/warn-transformer/processed/"
+
+# How many records to sort in memory at once when writing integrated.csv with a merge
+RUN_SIZE = 100_000
+
+
+class AncestorIndex(typing.NamedTuple):
+    """An index of the current dataset for a quick search for likely ancestors."""
+
+    # How many company names each token appears in, which the keys are drawn from
+    token_counts: typing.Dict[str, int]
+    # Lists of (position, record) pairs, keyed by the blocking keys of their company names
+    key_dict: typing.Dict[
+        str, typing.List[typing.Tuple[int, typing.Dict[str, typing.Any]]]
+    ]
+
+
+class CurrentIndex(typing.NamedTuple):
+    """What we need to know about a current dataset that's left on disk rather than held in memory."""
+
+    # Reads the records of the current dataset again, one at a time
+    read_data: typing.Callable[[], typing.Iterator[WarnNotice]]
+    # The set of hash_id values from each source, keyed by postal code
+    hash_index: typing.Dict[str, typing.Set[str]]
+    # The number of records from each source, keyed by postal code
+    count_dict: typing.Dict[str, int]
+    # How many company names each token appears in, keyed by postal code
+    token_counts: typing.Dict[str, typing.Dict[str, int]]
+    # Whether the records are already in reverse chronological order
+    is_sorted: bool
+
 
 def run(
     new_path: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR
     / "processed"
     / "consolidated.csv",
     init_current_data: bool = False,
+    current_path: typing.Optional[Path] = None,
+    use_cache: bool = True,
+    new_data_list: typing.Optional[typing.List[WarnNotice]] = None,
+    prometheus: bool = False,
+    use_store: bool = False,
+    run_size: typing.Optional[int] = None,
 ) -> Path:
     """Integrate new consolidated data with the current database.
 
     Args:
         new_path (Path): The path to the latest consolidated file on the local file system
         init_current_data (bool): Set to True when you want to create a new integrated dataset from scratch. Default False.
+        current_path (Path): A local copy of the current dataset to read instead of downloading one (optional)
+        use_cache (bool): Set to False to download the current dataset even if our cached copy is up to date. Default True.
+        new_data_list (list): The records in the new consolidated file, if they're already in memory (optional)
+        prometheus (bool): Set to True to write a Prometheus textfile alongside our JSON report of the run. Default False.
+        use_store (bool): Set to True to keep the integrated dataset in a SQLite database and integrate changes into it in place. Once it's been loaded, the current dataset is only read again if init_current_data or current_path are set, or a newer version of the published dataset it was loaded from is out. Default False.
+        run_size (int): Write integrated.csv by merging sorted runs of this many records, spilled to temporary files, rather than sorting every record in memory. The current dataset is left on disk and read through as it's needed. Ignored when use_store is set. (optional)
 
     Returns a Path to the newly integrated file.
     """
-    # Get the most recently published integrated dataset
-    current_data_list = get_current_data(init_current_data)
-
-    # Read in new consolidated.csv file
-    with open(new_path) as fh:
-        new_data_reader = csv.DictReader(fh)
-        new_data_list = list(new_data_reader)
+    report = metrics.RunReport("integrate")
+
+    # Get the most recently published integrated dataset,
+    # unless our store already has it from an earlier run
+    conn = None
+    current_data_list: typing.List[WarnNotice] = []
+    db_path = store.get_path()
+    source = ""
+    if use_store and not init_current_data and not current_path:
+        if store.is_ready(db_path):
+            logger.debug(f"Integrating into the current data stored at {db_path}")
+            conn = store.connect(db_path)
+
+        # A store loaded from a local file is used as it is. One loaded from the published
+        # dataset is loaded again if a newer version has been published since.
+        if conn is None or store.get_meta(conn, "source"):
+            current_path = download_current_file(
+                f"{CURRENT_DATA_BASE_URL}integrated.csv", use_cache=use_cache
+            )
+            source = get_file_version(current_path)
+            if conn is not None and store.get_meta(conn, "source") != source:
+                logger.debug("A newer current dataset has been published")
+                conn.close()
+                conn = None
+    current_index = None
+    if conn is None and run_size and not use_store:
+        # Leave the current dataset on disk, and read it through a record at a time
+        current_path = get_current_path(
+            init_current_data, current_path=current_path, use_cache=use_cache
+        )
+        current_index = get_current_index(
+            partial(
+                iter_current_data,
+                current_path,
+                init=init_current_data,
+                now=datetime.now(timezone.utc),
+            )
+        )
+    elif conn is None:
+        current_data_list = get_current_data(
+            init_current_data, current_path=current_path, use_cache=use_cache
+        )
+        if use_store:
+            logger.debug(f"Loading the current data into {db_path}")
+            conn = store.connect(db_path)
+            store.load(conn, current_data_list, source=source)
+            # From here on, it's read from the store
+            current_data_list = []
+    report.end_stage("read_current")
+
+    # Read in new consolidated.csv file, unless we've been handed its records
+    if new_data_list is None:
+        with open(new_path) as fh:
+            new_data_reader = csv.DictReader(fh)
+            new_data_list = [WarnNotice.from_dict(r) for r in new_data_reader]
     logger.debug(f"{len(new_data_list)} records in new file at {new_path}")
+    report.end_stage("read_new")
 
     # Regroup each list by state
     current_data_by_source = regroup_by_source(current_data_list)
     new_data_by_source = regroup_by_source(new_data_list)
+    hash_index = None
+    if current_index is not None:
+        current_count_dict = current_index.count_dict
+        hash_index = current_index.hash_index
+    elif conn is None:
+        current_count_dict = {k: len(v) for k, v in current_data_by_source.items()}
+    else:
+        current_count_dict = store.count_by_source(conn)
+        hash_index = store.get_hash_index(conn, new_data_by_source)
 
     # Winnow down the new data to records that have changed
     changed_data_by_source = get_changed_data(
-        new_data_by_source, current_data_by_source
+        new_data_by_source, current_data_by_source, hash_index=hash_index
     )
 
+    # Look for the ancestors of every changed record in the current file in one pass
+    if current_index is not None:
+        current_ancestor_dict = get_current_ancestors(
+            current_index, changed_data_by_source
+        )
+
     # Loop through the changed data to determine which are new and which are amendements
     amend_by_source = {}
     insert_by_source = {}
@@ -55,12 +171,26 @@ def run(
         logger.debug(
             f"Inspecting {len(change_list)} changed records from {postal_code}"
         )
-        current_row_list = current_data_by_source[postal_code]
+        ancestor_index = None
+        if current_index is not None:
+            ancestor_list = current_ancestor_dict[postal_code]
+        elif conn is None:
+            current_row_list = current_data_by_source[postal_code]
+            ancestor_index = get_ancestor_index(current_row_list)
+        else:
+            candidate_list_list = get_store_candidates(conn, postal_code, change_list)
         amend_list = []
         insert_list = []
-        for new_row in change_list:
+        for i, new_row in enumerate(change_list):
             # See if we can find a likely parent that was amended
-            likely_ancestor = get_likely_ancestor(new_row, current_row_list)
+            if current_index is not None:
+                likely_ancestor = ancestor_list[i]
+            elif ancestor_index is not None:
+                likely_ancestor = get_likely_ancestor(
+                    new_row, current_row_list, ancestor_index
+                )
+            else:
+                likely_ancestor = get_likely_ancestor(new_row, candidate_list_list[i])
             # If there is one, we assume this is an amendment
             if likely_ancestor:
                 amend_list.append({"new": new_row, "current": likely_ancestor})
@@ -75,6 +205,24 @@ def run(
         # Add to master list for integration
         insert_by_source[postal_code] = insert_list
         amend_by_source[postal_code] = amend_list
+        report.add_source(
+            postal_code,
+            dict(
+                changed_rows=len(change_list),
+                inserted_rows=len(insert_list),
+                amended_rows=len(amend_list),
+            ),
+        )
+
+    for postal_code in sorted(set(current_count_dict) | set(new_data_by_source)):
+        report.add_source(
+            postal_code,
+            dict(
+                current_rows=current_count_dict.get(postal_code, 0),
+                new_rows=len(new_data_by_source.get(postal_code, [])),
+            ),
+        )
+    report.end_stage("compare")
 
     # Final report on what we'll do
     full_amend_list = flatten_grouped_data(amend_by_source)
@@ -97,10 +245,17 @@ def run(
             logger.debug(f"Writing {len(full_amend_list)} records to {amend_path}")
             writer = csv.DictWriter(fh, full_amend_list[0].keys())
             writer.writeheader()
-            writer.writerows(full_amend_list)
-
-    # Create a new list to store everything
-    integrated_list: typing.List[typing.Dict[str, typing.Any]] = []
+            # Write out each record with its fields in the order they were read in
+            current_fields = get_current_fields(init_current_data)
+            writer.writerows(
+                {
+                    "new": dict(d["new"]),
+                    "current": {
+                        f: d["current"][f] for f in current_fields if f in d["current"]
+                    },
+                }
+                for d in full_amend_list
+            )
 
     # Create a lookup of the current amended records that links them their likely replacements
     amend_lookup = {d["current"]["hash_id"]: d["new"] for d in full_amend_list}
@@ -108,10 +263,75 @@ def run(
     # Get the current timestamp to mark the updates we make in this run
     now = datetime.now(timezone.utc)
 
+    # Finally, write out what we got
+    integrated_path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "processed" / "integrated.csv"
+    if current_index is not None and run_size:
+        # Merge the records into the file in order, a run at a time
+        logger.debug(f"Merging records into {integrated_path}")
+        with open(integrated_path, "w") as fh:
+            value_writer = csv.writer(fh)
+            value_writer.writerow(INTEGRATED_FIELDS)
+            value_writer.writerows(
+                iter_integrated_values(
+                    current_index,
+                    amend_lookup,
+                    full_insert_list,
+                    now,
+                    run_size=run_size,
+                )
+            )
+    elif conn is None:
+        sorted_list = get_integrated_list(
+            current_data_list, amend_lookup, full_insert_list, now
+        )
+        logger.debug(f"Writing {len(sorted_list)} records to {integrated_path}")
+        with open(integrated_path, "w") as fh:
+            writer = csv.DictWriter(fh, INTEGRATED_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(sorted_list)
+    else:
+        # Make the changes in place, and export the result
+        store.apply_changes(conn, amend_lookup, full_insert_list, now)
+        row_count = store.export(conn, integrated_path)
+        conn.close()
+        logger.debug(f"Wrote {row_count} records to {integrated_path}")
+    report.end_stage("write")
+
+    # Write out a report on the run
+    report.write(integrated_path.parent, prometheus=prometheus)
+
+    # And return the path
+    return integrated_path
+
+
+def link_changes(
+    current_data: typing.Iterable[WarnNotice],
+    amend_lookup: typing.Dict[str, WarnNotice],
+    insert_list: typing.List[WarnNotice],
+    now: datetime,
+) -> typing.Iterator[typing.Tuple[int, WarnNotice]]:
+    """Link the amended and new records to the current dataset.
+
+    Every record is numbered by where it falls in the combined dataset before it's sorted.
+    The current record at index i is 2 * i + 1, an amendment to it is 2 * i, just ahead of it,
+    and the new records follow everything else.
+
+    Args:
+        current_data (iterable): The records in the current dataset.
+        amend_lookup (dict): The amended records, keyed by the hash_id of their likely ancestor.
+        insert_list (list): The new records.
+        now (datetime): The timestamp of this run.
+
+    Returns: An iterator of the amended and new records, each paired with its number.
+    """
+    current_count = 0
+
     # Loop through everything in the current database
-    for current_row in current_data_list:
+    for i, current_row in enumerate(current_data):
+        current_count += 1
+
         # If this is an amended row ...
-        if current_row["hash_id"] in amend_lookup:
+        if mark_superseded(current_row, amend_lookup):
             # Pull out the new record from the our lookup
             amended_row = amend_lookup[current_row["hash_id"]]
 
@@ -127,70 +347,378 @@ def run(
                 current_row["estimated_amendments"] + 1
             )
 
-            # Add it to the new integrated database
-            integrated_list.append(amended_row)
-
-            # Mark the current record as superseded
-            # This allows it to be excluded circumstances where we only want unique records
-            # But without deleting it entirely
-            current_row["is_superseded"] = True
-
-            # Add it to the integrated database
-            integrated_list.append(current_row)
-
-        # If the current row is not amended ...
-        else:
-            # If these field haven't already been filled in, nope 'em
-            if "is_superseded" not in current_row.keys():
-                current_row["is_superseded"] = False
-            if "is_amendment" not in current_row.keys():
-                current_row["is_amendment"] = False
-            # Then we just keep what we got
-            integrated_list.append(current_row)
+            # Add it just ahead of its ancestor
+            yield 2 * i, amended_row
 
     # Now insert the new records with today's timestamp
-    for new_row in full_insert_list:
+    for j, new_row in enumerate(insert_list):
         new_row["first_inserted_date"] = now
         new_row["last_updated_date"] = now
         new_row["estimated_amendments"] = 0
         new_row["is_superseded"] = False
         new_row["is_amendment"] = False
-        integrated_list.append(new_row)
+        yield 2 * current_count + j, new_row
+
+
+def mark_superseded(
+    current_row: WarnNotice, amend_lookup: typing.Dict[str, WarnNotice]
+) -> bool:
+    """Mark whether a current record has been superseded by an amendment.
+
+    Args:
+        current_row (WarnNotice): A record in the current dataset.
+        amend_lookup (dict): The amended records, keyed by the hash_id of their likely ancestor.
+
+    Returns: True if the record was amended.
+    """
+    # Mark an amended record as superseded
+    # This allows it to be excluded circumstances where we only want unique records
+    # But without deleting it entirely
+    if current_row["hash_id"] in amend_lookup:
+        current_row["is_superseded"] = True
+        return True
+
+    # If these field haven't already been filled in, nope 'em
+    if "is_superseded" not in current_row.keys():
+        current_row["is_superseded"] = False
+    if "is_amendment" not in current_row.keys():
+        current_row["is_amendment"] = False
+    return False
+
+
+def number_current_data(
+    current_data: typing.Iterable[WarnNotice],
+    amend_lookup: typing.Dict[str, WarnNotice],
+) -> typing.Iterator[typing.Tuple[int, WarnNotice]]:
+    """Pair the records in the current dataset with their numbers, marking those that were amended.
+
+    They're numbered the same way link_changes numbers them.
+
+    Args:
+        current_data (iterable): The records in the current dataset.
+        amend_lookup (dict): The amended records, keyed by the hash_id of their likely ancestor.
+
+    Returns: An iterator of the current records, each paired with its number.
+    """
+    for i, current_row in enumerate(current_data):
+        mark_superseded(current_row, amend_lookup)
+        yield 2 * i + 1, current_row
+
 
-    # And sort everything in reverse chronological order
-    sorted_list = sorted(
-        integrated_list,
-        key=itemgetter("last_updated_date", "first_inserted_date", "notice_date"),
-        reverse=True,
+def get_sort_key(number: int, row: WarnNotice) -> tuple:
+    """Get the key that puts integrated records in reverse chronological order.
+
+    Args:
+        number (int): The record's number from link_changes, which breaks ties in the order records were combined.
+        row (WarnNotice): The record.
+
+    Returns: A tuple to sort in reverse.
+    """
+    return (
+        row["last_updated_date"],
+        row["first_inserted_date"],
+        row["notice_date"],
+        -number,
     )
 
-    # Finally, write out what we got
-    integrated_path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "processed" / "integrated.csv"
-    logger.debug(f"Writing {len(integrated_list)} records to {integrated_path}")
-    with open(integrated_path, "w") as fh:
-        fieldnames = [
-            "hash_id",
-            "first_inserted_date",
-            "notice_date",
-            "effective_date",
-            "postal_code",
-            "company",
-            "location",
-            "jobs",
-            "is_closure",
-            "is_temporary",
-            "is_superseded",
-            "is_amendment",
-            "likely_ancestor",
-            "estimated_amendments",
-            "last_updated_date",
+
+def get_integrated_list(
+    current_data_list: typing.List[WarnNotice],
+    amend_lookup: typing.Dict[str, WarnNotice],
+    insert_list: typing.List[WarnNotice],
+    now: datetime,
+) -> typing.List[WarnNotice]:
+    """Combine the current dataset with the amended and new records.
+
+    Args:
+        current_data_list (list): The records in the current dataset.
+        amend_lookup (dict): The amended records, keyed by the hash_id of their likely ancestor.
+        insert_list (list): The new records.
+        now (datetime): The timestamp of this run.
+
+    Returns: A list of every record, sorted in reverse chronological order.
+    """
+    change_list = list(link_changes(current_data_list, amend_lookup, insert_list, now))
+    numbered_list = chain(
+        ((2 * i + 1, r) for i, r in enumerate(current_data_list)), change_list
+    )
+
+    # Sort everything in reverse chronological order
+    return [
+        r
+        for _, r in sorted(numbered_list, key=lambda p: get_sort_key(*p), reverse=True)
+    ]
+
+
+def iter_integrated_values(
+    current_index: CurrentIndex,
+    amend_lookup: typing.Dict[str, WarnNotice],
+    insert_list: typing.List[WarnNotice],
+    now: datetime,
+    run_size: int = RUN_SIZE,
+) -> typing.Iterator[tuple]:
+    """Combine the current dataset with the amended and new records without holding them all in memory.
+
+    The amended and new records are sorted in runs of run_size that are spilled to temporary files,
+    then merged with the current dataset as it's read from disk. If the current dataset
+    is out of order, it's spilled in sorted runs too.
+
+    Args:
+        current_index (CurrentIndex): The current dataset, indexed by get_current_index.
+        amend_lookup (dict): The amended records, keyed by the hash_id of their likely ancestor.
+        insert_list (list): The new records.
+        now (datetime): The timestamp of this run.
+        run_size (int): The most records to sort in memory at once. Default 100,000.
+
+    Returns: An iterator of tuples in the order of INTEGRATED_FIELDS, in the same reverse chronological order as get_integrated_list.
+    """
+    with ExitStack() as stack:
+        # Spill the changes to disk in sorted runs
+        change_iter = link_changes(
+            current_index.read_data(), amend_lookup, insert_list, now
+        )
+        run_list = [
+            stack.enter_context(write_run(chunk))
+            for chunk in iter_chunks(change_iter, run_size)
         ]
-        writer = csv.DictWriter(fh, fieldnames, extrasaction="ignore")
-        writer.writeheader()
-        writer.writerows(sorted_list)
 
-    # And return the path
-    return integrated_path
+        # Read the current dataset through again, marking what's been superseded
+        current_iter = number_current_data(current_index.read_data(), amend_lookup)
+
+        # Merge it in as it is if it's already in order, or spill it too
+        if current_index.is_sorted:
+            run_list.append((get_sort_key(*p), get_values(p[1])) for p in current_iter)
+        else:
+            logger.debug("The current data is out of order, so it will be sorted")
+            run_list.extend(
+                stack.enter_context(write_run(chunk))
+                for chunk in iter_chunks(current_iter, run_size)
+            )
+        logger.debug(f"Merging {len(run_list)} sorted runs")
+
+        for _, values in heapq.merge(*run_list, key=itemgetter(0), reverse=True):
+            yield values
+
+
+def get_values(row: WarnNotice) -> tuple:
+    """Get the values of a record that are written to integrated.csv.
+
+    Args:
+        row (WarnNotice): An integrated record.
+
+    Returns: A tuple in the order of INTEGRATED_FIELDS, with a None for any field the record doesn't have.
+    """
+    return tuple(row.get(f) for f in INTEGRATED_FIELDS)
+
+
+@contextmanager
+def write_run(
+    numbered_list: typing.List[typing.Tuple[int, WarnNotice]],
+) -> typing.Iterator[typing.Iterator[typing.Tuple[tuple, tuple]]]:
+    """Sort a batch of records and write them to a temporary file.
+
+    Args:
+        numbered_list (list): Records, each paired with its number from link_changes.
+
+    Returns: A context manager that provides an iterator over the sorted run,
+        yielding the sort key and values of each record. The file is deleted on exit.
+    """
+    with tempfile.TemporaryFile() as fh:
+        for item in sorted(
+            ((get_sort_key(*p), get_values(p[1])) for p in numbered_list),
+            key=itemgetter(0),
+            reverse=True,
+        ):
+            pickle.dump(item, fh)
+        fh.seek(0)
+
+        # Let go of the records, so only the file holds them while the run is merged
+        del numbered_list
+        yield read_run(fh)
+
+
+def read_run(fh: typing.BinaryIO) -> typing.Iterator[typing.Tuple[tuple, tuple]]:
+    """Read back a sorted run written by write_run.
+
+    Args:
+        fh (file): The temporary file, rewound to its start.
+
+    Returns: An iterator of sort keys and values.
+    """
+    while True:
+        try:
+            yield pickle.load(fh)
+        except EOFError:
+            return
+
+
+def get_store_candidates(
+    conn: sqlite3.Connection,
+    postal_code: str,
+    row_list: typing.List[typing.Dict[str, typing.Any]],
+) -> typing.List[typing.List[WarnNotice]]:
+    """Pull the records from our store that could be a match for each of a source's new rows.
+
+    The stored records are filed under the blocking keys of their company names,
+    so every new row's candidates are pulled in a single query.
+
+    Args:
+        conn (Connection): A connection to the store.
+        postal_code (str): The postal code of the source.
+        row_list (list): The records from the new dataset believed to contain a change to the current dataset.
+
+    Returns a list with the candidate records for each new row, in the same order they appear in the current dataset.
+    """
+    token_counts = store.get_token_counts(conn, postal_code)
+    key_list_list = [
+        blocking.get_company_keys(r["company"], token_counts) for r in row_list
+    ]
+    match_list_list = store.get_key_matches(conn, postal_code, key_list_list)
+
+    candidate_list_list = []
+    all_list = None
+    for new_row, key_list, match_list in zip(row_list, key_list_list, match_list_list):
+        # A row without a company name to look up has to be compared with everything
+        if not key_list:
+            if all_list is None:
+                all_list = [
+                    parse_integrated_record(r)
+                    for r in store.get_records(conn, postal_code)
+                ]
+            candidate_list_list.append(all_list)
+            continue
+
+        # Weed out what can't match, keeping everything we couldn't file
+        date_dict: typing.Dict[str, bool] = {}
+        candidate_list_list.append(
+            [
+                parse_integrated_record(r)
+                for is_keyed, r in match_list
+                if not is_keyed or is_plausible_candidate(new_row, r, date_dict)
+            ]
+        )
+    return candidate_list_list
+
+
+def get_current_index(
+    read_data: typing.Callable[[], typing.Iterator[WarnNotice]],
+) -> CurrentIndex:
+    """Read through a current dataset on disk, indexing what we need to compare against it.
+
+    Args:
+        read_data (callable): Reads the records of the current dataset, one at a time.
+
+    Returns: A CurrentIndex.
+    """
+    hash_index: typing.DefaultDict[str, typing.Set[str]] = defaultdict(set)
+    count_dict: typing.Counter[str] = Counter()
+    token_counter_dict: typing.DefaultDict[str, typing.Counter[str]] = defaultdict(
+        Counter
+    )
+    get_key = itemgetter("last_updated_date", "first_inserted_date", "notice_date")
+    is_sorted = True
+    last_key = None
+    for row in read_data():
+        postal_code = row["postal_code"]
+        hash_index[postal_code].add(row["hash_id"])
+        count_dict[postal_code] += 1
+        if isinstance(row["company"], str):
+            token_counter_dict[postal_code].update(blocking.get_tokens(row["company"]))
+
+        # Check that no record is newer than the one before it
+        key = get_key(row)
+        if last_key is not None and key > last_key:
+            is_sorted = False
+        last_key = key
+
+    return CurrentIndex(
+        read_data,
+        dict(hash_index),
+        dict(count_dict),
+        {k: dict(v) for k, v in token_counter_dict.items()},
+        is_sorted,
+    )
+
+
+def get_current_ancestors(
+    current_index: CurrentIndex,
+    changed_data: typing.Dict[str, typing.List[WarnNotice]],
+) -> typing.Dict[str, typing.List[typing.Optional[typing.Mapping[str, typing.Any]]]]:
+    """Read through a current dataset on disk, looking for the likely ancestor of each changed record.
+
+    Only the ancestors are kept, so the rest of the current dataset doesn't have to be held in memory.
+    Each changed record is compared with the same candidates get_ancestor_candidates pulls from an AncestorIndex,
+    and gets the same ancestor get_likely_ancestor finds among them.
+
+    Args:
+        current_index (CurrentIndex): The current dataset, indexed by get_current_index.
+        changed_data (dict): The changed records, keyed by postal code.
+
+    Returns: A dictionary keyed by postal code. Each value is a list with the likely ancestor of each changed record,
+        or a None if it's estimated to be new.
+    """
+    # File each changed record under its blocking keys,
+    # or set it aside to be compared with everything from its source if it doesn't have any
+    key_dict_by_source = {}
+    unkeyed_by_source = {}
+    for postal_code, change_list in changed_data.items():
+        token_counts = current_index.token_counts.get(postal_code, {})
+        key_dict = defaultdict(list)
+        unkeyed_list = []
+        for i, new_row in enumerate(change_list):
+            key_list = blocking.get_company_keys(new_row["company"], token_counts)
+            for key in key_list:
+                key_dict[key].append(i)
+            if not key_list:
+                unkeyed_list.append(i)
+        key_dict_by_source[postal_code] = key_dict
+        unkeyed_by_source[postal_code] = unkeyed_list
+
+    ancestor_dict: typing.Dict[
+        str, typing.List[typing.Optional[typing.Mapping[str, typing.Any]]]
+    ] = {k: [None] * len(v) for k, v in changed_data.items()}
+    match_count: typing.Counter[typing.Tuple[str, int]] = Counter()
+    date_dict_dict: typing.Dict[typing.Tuple[str, int], typing.Dict[str, bool]] = {}
+    for current_row in current_index.read_data():
+        postal_code = current_row["postal_code"]
+        if postal_code not in ancestor_dict:
+            continue
+        change_list = changed_data[postal_code]
+        key_dict = key_dict_by_source[postal_code]
+
+        # Pull the changed records this one could be a match for.
+        # A record we can't file could be a match for anything,
+        # and anything we can't look up has to be compared with everything.
+        key_list = blocking.get_company_keys(
+            current_row["company"], current_index.token_counts.get(postal_code, {})
+        )
+        if key_list:
+            match_set = {
+                i
+                for i in {i for key in key_list for i in key_dict.get(key, [])}
+                if is_plausible_candidate(
+                    change_list[i],
+                    current_row,
+                    date_dict_dict.setdefault((postal_code, i), {}),
+                )
+            }
+            match_set.update(unkeyed_by_source[postal_code])
+        else:
+            match_set = set(range(len(change_list)))
+
+        # Check our key fields, keeping the first likely match
+        for i in match_set:
+            if not is_likely_ancestor(change_list[i], current_row):
+                continue
+            match_count[postal_code, i] += 1
+            if match_count[postal_code, i] == 1:
+                ancestor_dict[postal_code][i] = current_row
+            elif match_count[postal_code, i] == 2:
+                logger.debug("New row has more than one likely match")
+                logger.debug(
+                    f"New row: {json.dumps(dict(change_list[i]), indent=2, default=str)}"
+                )
+    return ancestor_dict
 
 
 def is_similar_string(s1, s2):
@@ -202,7 +730,7 @@ def is_similar_string(s1, s2):
 
     Returns True or False.
     """
-    return jellyfish.jaro_winkler_similarity(s1, s2) > 0.95
+    return jellyfish.jaro_winkler_similarity(s1, s2) > blocking.COMPANY_SIMILARITY
 
 
 def is_similar_date(d1, d2):
@@ -218,43 +746,30 @@ def is_similar_date(d1, d2):
 
 
 def get_likely_ancestor(
-    new_row: typing.Dict[str, typing.Any], current_data: typing.List
+    new_row: typing.Dict[str, typing.Any],
+    current_data: typing.List,
+    ancestor_index: typing.Optional[AncestorIndex] = None,
 ) -> typing.Optional[typing.Dict[str, typing.Any]]:
     """Determine if the provided new row has a likely parent in the current dataset.
 
     Args:
         new_row (dict): A record from the new dataset believed to contain a change to the current dataset.
         current_data (list): All of the records in the current dataset for comparison
+        ancestor_index (AncestorIndex): An index of the current data created by get_ancestor_index. If provided, only plausible candidates are compared. Default None.
 
     Returns:
         The record in the current data judged most likely to be the ancestor of the new record.
         Returns None if the record is estimated to be new.
     """
-    # Check our key fields against everything in the dataset
-    likely_match_list = []
-    for current_row in current_data:
-        # Check the company names
-        if not is_similar_string(new_row["company"], current_row["company"]):
-            continue
-
-        # Check the notice date
-        if not is_similar_date(new_row["notice_date"], current_row["notice_date"]):
-            continue
-
-        # Check the effective date, if it exists
-        if new_row["effective_date"] and current_row["effective_date"]:
-            if not is_similar_date(
-                new_row["effective_date"], current_row["effective_date"]
-            ):
-                continue
-
-        # Check the location, if it exists
-        if new_row["location"] and current_row["location"]:
-            if not is_similar_string(new_row["location"], current_row["location"]):
-                continue
+    # Narrow down the current data to plausible candidates, if we can
+    candidate_list = None
+    if ancestor_index is not None:
+        candidate_list = get_ancestor_candidates(new_row, ancestor_index)
+    if candidate_list is None:
+        candidate_list = current_data
 
-        # Whatever is left we keep
-        likely_match_list.append(current_row)
+    # Check our key fields against everything that's left
+    likely_match_list = [r for r in candidate_list if is_likely_ancestor(new_row, r)]
 
     # If there's nothing, return None
     if not likely_match_list:
@@ -264,94 +779,356 @@ def get_likely_ancestor(
     if len(likely_match_list) > 1:
         # Log here. Might do more later.
         logger.debug("New row has more than one likely match")
-        logger.debug(f"New row: {json.dumps(new_row, indent=2, default=str)}")
+        logger.debug(f"New row: {json.dumps(dict(new_row), indent=2, default=str)}")
         logger.debug(
-            f"Likely matches: {json.dumps(likely_match_list, indent=2, default=str)}"
+            f"Likely matches: {json.dumps([dict(r) for r in likely_match_list], indent=2, default=str)}"
         )
 
     # For now we just return the first one
     return likely_match_list[0]
 
 
-def get_current_data(init: bool = False) -> typing.List[typing.Dict[str, typing.Any]]:
+def is_likely_ancestor(
+    new_row: typing.Mapping[str, typing.Any],
+    current_row: typing.Mapping[str, typing.Any],
+) -> bool:
+    """Evaluate whether a current record is a likely ancestor of a new record.
+
+    Args:
+        new_row (dict): A record from the new dataset believed to contain a change to the current dataset.
+        current_row (dict): A record from the current dataset.
+
+    Returns True or False.
+    """
+    # Check the company names
+    if not is_similar_string(new_row["company"], current_row["company"]):
+        return False
+
+    # Check the notice date
+    if not is_similar_date(new_row["notice_date"], current_row["notice_date"]):
+        return False
+
+    # Check the effective date, if it exists
+    if new_row["effective_date"] and current_row["effective_date"]:
+        if not is_similar_date(
+            new_row["effective_date"], current_row["effective_date"]
+        ):
+            return False
+
+    # Check the location, if it exists
+    if new_row["location"] and current_row["location"]:
+        if not is_similar_string(new_row["location"], current_row["location"]):
+            return False
+
+    # Whatever is left we keep
+    return True
+
+
+def get_ancestor_index(current_data: typing.List) -> AncestorIndex:
+    """Index the current dataset for a quick search for likely ancestors.
+
+    Records are filed under the blocking keys of their company name,
+    so we only need to compare those that share a key with the new record.
+    Records without a company name are filed under an empty key.
+
+    Args:
+        current_data (list): All of the records in the current dataset for comparison
+
+    Returns an AncestorIndex.
+    """
+    token_counts = blocking.count_tokens(r["company"] for r in current_data)
+    key_dict = defaultdict(list)
+    for i, row in enumerate(current_data):
+        for key in blocking.get_company_keys(row["company"], token_counts) or [""]:
+            key_dict[key].append((i, row))
+    return AncestorIndex(token_counts, key_dict)
+
+
+def get_ancestor_candidates(
+    new_row: typing.Dict[str, typing.Any],
+    ancestor_index: AncestorIndex,
+) -> typing.Optional[typing.List[typing.Dict[str, typing.Any]]]:
+    """Pull the records from an ancestor index that could be a match for the new row.
+
+    Args:
+        new_row (dict): A record from the new dataset believed to contain a change to the current dataset.
+        ancestor_index (AncestorIndex): An index of the current data created by get_ancestor_index.
+
+    Returns a list of candidate records in the same order they appear in the current dataset.
+    Returns None if the new row has no company name to look up.
+    """
+    key_list = blocking.get_company_keys(
+        new_row["company"], ancestor_index.token_counts
+    )
+    if not key_list:
+        return None
+
+    # Pull everything that shares a key, and everything we couldn't file
+    candidate_dict = {}
+    for key in key_list:
+        for i, row in ancestor_index.key_dict.get(key, []):
+            candidate_dict[i] = row
+    unkeyed_dict = dict(ancestor_index.key_dict.get("", []))
+
+    # Weed out what can't match
+    date_dict: typing.Dict[str, bool] = {}
+    candidate_list = [
+        (i, row)
+        for i, row in candidate_dict.items()
+        if is_plausible_candidate(new_row, row, date_dict)
+    ]
+    candidate_list.extend(unkeyed_dict.items())
+    return [row for i, row in sorted(candidate_list, key=itemgetter(0))]
+
+
+def is_plausible_candidate(
+    new_row: typing.Mapping[str, typing.Any],
+    current_row: typing.Mapping[str, typing.Any],
+    date_dict: typing.Dict[str, bool],
+) -> bool:
+    """Rule out a record that shares a blocking key with the new row, before comparing them in full.
+
+    Names that are too short or long, and dates that are too far off, can't match.
+
+    Args:
+        new_row (dict): A record from the new dataset believed to contain a change to the current dataset.
+        current_row (dict): A record from the current dataset.
+        date_dict (dict): Whether each notice date checked so far is similar to the new row's, so each distinct date is only checked once.
+
+    Returns True or False.
+    """
+    if not blocking.is_similar_length(new_row["company"], current_row["company"]):
+        return False
+    notice_date = current_row["notice_date"]
+    if notice_date not in date_dict:
+        date_dict[notice_date] = is_similar_date(new_row["notice_date"], notice_date)
+    return date_dict[notice_date]
+
+
+def get_current_data(
+    init: bool = False,
+    current_path: typing.Optional[Path] = None,
+    use_cache: bool = True,
+) -> typing.List[WarnNotice]:
     """Fetch the most recent published version of our integrated dataset.
 
     Args:
         init (bool): Set to True when you want to create a new integrated dataset from scratch. Default False.
+        current_path (Path): A local copy of the current dataset to read instead of downloading one (optional)
+        use_cache (bool): Set to False to download the current dataset even if our cached copy is up to date. Default True.
 
-    Returns a list of dictionaries ready for comparison against the new consolidated data file.
+    Returns a list of WarnNotice records ready for comparison against the new consolidated data file.
     """
-    # Set which file to pull
-    base_url = "https://raw.githubusercontent.com/biglocalnews/warn-github-flow/transformer/data/warn-transformer/processed/"
+    current_path = get_current_path(
+        init, current_path=current_path, use_cache=use_cache
+    )
+
+    # Read in the current database, marking the updates we make in this run with the current timestamp
+    current_data_list = list(
+        iter_current_data(current_path, init=init, now=datetime.now(timezone.utc))
+    )
+
+    # Return the list
+    logger.debug(f"{len(current_data_list)} records downloaded from current database")
+    return current_data_list
+
+
+def get_current_path(
+    init: bool = False,
+    current_path: typing.Optional[Path] = None,
+    use_cache: bool = True,
+) -> Path:
+    """Get a local copy of the most recent published version of our integrated dataset.
+
+    Args:
+        init (bool): Set to True when you want to create a new integrated dataset from scratch. Default False.
+        current_path (Path): A local copy of the current dataset to read instead of downloading one (optional)
+        use_cache (bool): Set to False to download the current dataset even if our cached copy is up to date. Default True.
+
+    Returns the Path to the current dataset.
+    """
+    # If we have a local file, use it
+    if current_path:
+        logger.debug(f"Reading current file from {current_path}")
+        return current_path
+
+    # Otherwise pull the published file
     if init:
-        current_url = f"{base_url}consolidated.csv"
+        current_url = f"{CURRENT_DATA_BASE_URL}consolidated.csv"
         logger.debug(f"Initializing new current file from {current_url}")
     else:
-        current_url = f"{base_url}integrated.csv"
+        current_url = f"{CURRENT_DATA_BASE_URL}integrated.csv"
         logger.debug(f"Downloading most recent current file from {current_url}")
+    return download_current_file(current_url, use_cache=use_cache)
 
-    # Download the current database
-    current_r = requests.get(current_url)
-    current_data_str = current_r.content.decode("utf-8")
 
-    # Read in the current database
-    current_data_reader = csv.DictReader(current_data_str.splitlines(), delimiter=",")
-    current_data_list: typing.List[typing.Dict[str, typing.Any]] = list(
-        current_data_reader
-    )
+def iter_current_data(
+    current_path: Path, init: bool = False, now: typing.Optional[datetime] = None
+) -> typing.Iterator[WarnNotice]:
+    """Read the current dataset a line at a time.
 
-    # Get the current timestamp to mark the updates we make in this run
-    now = datetime.now(timezone.utc)
+    Args:
+        current_path (Path): The current dataset.
+        init (bool): Set to True when the current dataset is being initialized from a consolidated file. Default False.
+        now (datetime): The timestamp of this run, which is filled in when initializing. Defaults to the current time.
 
-    # If we're initializing a new dataset, we'll need to fill in the extra
-    # fields custom to the integrated set.
-    if init:
-        for row in current_data_list:
-            row["first_inserted_date"] = now
-            row["last_updated_date"] = now
-            row["estimated_amendments"] = 0
-    else:
-        for row in current_data_list:
+    Returns an iterator of WarnNotice records ready for comparison against the new consolidated data file.
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    with open(current_path, newline="", encoding="utf-8") as fh:
+        current_data_reader = csv.DictReader(fh, delimiter=",")
+        for r in current_data_reader:
+            row = WarnNotice.from_dict(r)
+
+            # If we're initializing a new dataset, we'll need to fill in the extra
+            # fields custom to the integrated set.
+            if init:
+                row["first_inserted_date"] = now
+                row["last_updated_date"] = now
+                row["estimated_amendments"] = 0
             # Otherwise we'll want to parse a few data types for later use
-            row["last_updated_date"] = datetime.fromisoformat(row["last_updated_date"])
-            row["first_inserted_date"] = datetime.fromisoformat(
-                row["first_inserted_date"]
-            )
-            row["estimated_amendments"] = int(row["estimated_amendments"])
+            else:
+                parse_integrated_record(row)
+            yield row
 
-    # Return the list
-    logger.debug(f"{len(current_data_list)} records downloaded from current database")
-    return current_data_list
+
+def get_current_fields(init: bool = False) -> typing.Tuple[str, ...]:
+    """Get the fields of the current dataset, in the order they're read in.
+
+    Args:
+        init (bool): Set to True when the current dataset is being initialized from a consolidated file. Default False.
+
+    Returns: A tuple of field names.
+    """
+    if init:
+        # The consolidated fields, followed by the ones we fill in
+        return tuple(WarnNoticeSchema._declared_fields) + (
+            "first_inserted_date",
+            "last_updated_date",
+            "estimated_amendments",
+        )
+    return INTEGRATED_FIELDS
+
+
+def parse_integrated_record(row: WarnNotice) -> WarnNotice:
+    """Parse the fields of an integrated record that we compare and do math with.
+
+    Args:
+        row (WarnNotice): A record read from an integrated dataset, with every value a string.
+
+    Returns: The same record, with its timestamps and amendment count parsed.
+    """
+    row["last_updated_date"] = datetime.fromisoformat(row["last_updated_date"])
+    row["first_inserted_date"] = datetime.fromisoformat(row["first_inserted_date"])
+    row["estimated_amendments"] = int(row["estimated_amendments"])
+    return row
+
+
+def download_current_file(url: str, use_cache: bool = True) -> Path:
+    """Download a published data file, unless our cached copy is still up to date.
+
+    The cached copy is revalidated with the ETag and Last-Modified headers
+    from the last download, so an unchanged file isn't downloaded again.
+
+    Args:
+        url (str): The address of the file.
+        use_cache (bool): Set to False to download the file no matter what. Default True.
+
+    Returns: The Path to the local copy of the file.
+    """
+    # Figure out where the file is cached
+    cache_dir = utils.WARN_TRANSFORMER_OUTPUT_DIR / "cache" / "integrate"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    file_name = url.rsplit("/", 1)[-1]
+    cache_path = cache_dir / file_name
+    meta_path = cache_dir / f"{file_name}.json"
+
+    # If we have a copy, ask the server to only send the file if it has changed
+    headers = {}
+    if use_cache and cache_path.exists() and meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        if meta.get("url") == url:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+    # Download the file, streaming it to disk rather than holding it in memory
+    with requests.get(url, headers=headers, stream=True) as r:
+        if r.status_code == 304:
+            logger.debug(f"{file_name} is unchanged, using cached copy at {cache_path}")
+            return cache_path
+        r.raise_for_status()
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as fh:
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                fh.write(chunk)
+        tmp_path.replace(cache_path)
+
+        # Save what we need to revalidate it next time
+        meta = dict(
+            url=url,
+            etag=r.headers.get("ETag"),
+            last_modified=r.headers.get("Last-Modified"),
+        )
+        meta_path.write_text(json.dumps(meta))
+    logger.debug(f"Downloaded {file_name} to {cache_path}")
+    return cache_path
+
+
+def get_file_version(path: Path) -> str:
+    """Get a value that changes whenever a downloaded data file does.
+
+    Args:
+        path (Path): The local copy of a file fetched by download_current_file.
+
+    Returns: The file's ETag or Last-Modified header, or a hash of its contents if the server sent neither.
+    """
+    meta_path = path.with_name(f"{path.name}.json")
+    meta = json.loads(meta_path.read_text())
+    version = meta.get("etag") or meta.get("last_modified")
+    if version:
+        return version
+    hash_obj = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
 
 
 def get_changed_data(
     new_data: typing.DefaultDict[str, typing.List],
     current_data: typing.DefaultDict[str, typing.List],
+    hash_index: typing.Optional[typing.Dict[str, typing.Set[str]]] = None,
 ) -> typing.DefaultDict[str, typing.List]:
     """Determine which rows in a new data file are different from the current dataset.
 
     Args:
         new_data (dict): A dictionary keyed by postal code. Each value is a list of all records from that source.
         current_data (dict): A dictionary keyed by postal code. Each value is a list of all records from that source.
+        hash_index (dict): The identifiers in the current dataset, keyed by postal code, if they've already been looked up. Default None.
 
     Returns a dictionary keyed by postal code. Each value is a list of all records with that value deemed to have changed.
     """
+    # Index the unique identifiers in the current database once, up front
+    if hash_index is None:
+        hash_index = get_hash_index(current_data)
+
     changed_dict = defaultdict(list)
     for postal_code, new_row_list in new_data.items():
         logger.debug(f"Inspecting {len(new_row_list)} new records from {postal_code}")
 
-        # Pull the current rows from the source
-        current_row_list = current_data[postal_code]
+        # Pull the current identifiers from the source
+        current_hash_set = hash_index.get(postal_code, set())
         logger.debug(
-            f"Comparing against {len(current_row_list)} records from the current database"
+            f"Comparing against {len(current_hash_set)} identifiers from the current database"
         )
 
         # Loop through the rows in this source
         for new_row in new_row_list:
             # Identify new rows that are identical to a record in the current database
-            if not any(
-                r for r in current_row_list if r["hash_id"] == new_row["hash_id"]
-            ):
+            if new_row["hash_id"] not in current_hash_set:
                 # If not, it's either a new record or an amendment.
                 # So it goes in our change list
                 changed_dict[postal_code].append(new_row)
@@ -366,6 +1143,22 @@ def get_changed_data(
     return changed_dict
 
 
+def get_hash_index(
+    grouped_data: typing.Dict[str, typing.List],
+) -> typing.Dict[str, typing.Set[str]]:
+    """Index the unique identifiers in a dataset grouped by source.
+
+    Args:
+        grouped_data (dict): A dictionary keyed by postal code. Each value is a list of all records from that source.
+
+    Returns a dictionary keyed by postal code. Each value is the set of hash_id values from that source.
+    """
+    return {
+        postal_code: {r["hash_id"] for r in row_list}
+        for postal_code, row_list in grouped_data.items()
+    }
+
+
 def regroup_by_source(data_list: typing.List) -> typing.DefaultDict[str, typing.List]:
     """Regroup the provided list by its source field.
 
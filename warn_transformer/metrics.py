@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import sys
+import time
+import typing
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # It's not available on Windows
+    resource = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# The prefix on every Prometheus metric we write
+PROMETHEUS_PREFIX = "warn_transformer"
+
+
+class RunReport:
+    """Collect the metrics of a run, stage by stage and source by source.
+
+    Stages are timed one after the other. Each call to end_stage
+    closes out the stage that began when the last one ended,
+    noting how much memory was in use at either end of it.
+    """
+
+    def __init__(self, name: str):
+        """Intialize a new instance.
+
+        Args:
+            name (str): The name of the run, like consolidate or integrate.
+        """
+        self.name = name
+        self.started = datetime.now(timezone.utc)
+        self.start = self.stage_start = time.perf_counter()
+        self.stage_start_memory = get_current_memory()
+        self.stage_dict: typing.Dict[str, dict] = {}
+        self.source_dict: typing.Dict[str, dict] = {}
+
+    def end_stage(self, name: str):
+        """Record the time and memory used by the stage that just finished.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        now = time.perf_counter()
+        memory = get_current_memory()
+        self.stage_dict[name] = dict(
+            seconds=round(now - self.stage_start, 6),
+            start_rss_bytes=self.stage_start_memory,
+            end_rss_bytes=memory,
+        )
+        logger.debug(f"{self.name} {name} stage took {now - self.stage_start:.2f}s")
+        self.stage_start = now
+        self.stage_start_memory = memory
+
+    def add_source(self, source: str, metrics: typing.Mapping[str, typing.Any]):
+        """Add to the metrics recorded for a source.
+
+        Args:
+            source (str): The slug or postal code of the source.
+            metrics (dict): The metrics to record.
+        """
+        self.source_dict.setdefault(source, {}).update(metrics)
+
+    def to_dict(self) -> dict:
+        """Sum up the run.
+
+        Returns: A dictionary ready to be written out as JSON.
+        """
+        return dict(
+            name=self.name,
+            started=self.started.isoformat(),
+            seconds=round(time.perf_counter() - self.start, 6),
+            peak_memory_bytes=get_peak_memory(),
+            peak_child_memory_bytes=get_peak_memory(children=True),
+            stages=self.stage_dict,
+            sources=self.source_dict,
+        )
+
+    def write(self, output_dir: Path, prometheus: bool = False) -> Path:
+        """Write out the report.
+
+        Args:
+            output_dir (Path): The directory where the report will be written.
+            prometheus (bool): Set to True to also write a Prometheus textfile. Default False.
+
+        Returns: The Path to the JSON report.
+        """
+        report = self.to_dict()
+        json_path = output_dir / f"{self.name}-report.json"
+        with open(json_path, "w") as fh:
+            json.dump(report, fh, indent=2)
+        logger.debug(f"Wrote {self.name} report to {json_path}")
+
+        if prometheus:
+            prometheus_path = output_dir / f"{self.name}-report.prom"
+            prometheus_path.write_text(get_prometheus_text(report))
+            logger.debug(f"Wrote {self.name} Prometheus metrics to {prometheus_path}")
+        return json_path
+
+
+def get_peak_memory(children: bool = False) -> typing.Optional[int]:
+    """Get the most memory our process has used at any one time.
+
+    Args:
+        children (bool): Set to True to get the peak of any child processes instead, like a pool of workers. Default False.
+
+    Returns: The peak resident set size in bytes. Or, where it can't be measured, a None.
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, everybody else reports kilobytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def get_current_memory() -> typing.Optional[int]:
+    """Get how much memory our process is using right now.
+
+    Unlike the peak, which can only go up over the life of the process,
+    this shows how much a stage leaves behind.
+
+    Returns: The resident set size in bytes. Or, where it can't be measured, a None.
+    """
+    try:
+        with open("/proc/self/statm") as fh:
+            page_count = int(fh.read().split()[1])
+    except OSError:
+        # Only Linux has it
+        return None
+    return page_count * os.sysconf("SC_PAGE_SIZE")
+
+
+def get_prometheus_text(report: dict) -> str:
+    """Format a report in the Prometheus text exposition format.
+
+    Args:
+        report (dict): A report created by RunReport.to_dict.
+
+    Returns: The text of a file ready for the Prometheus node exporter's textfile collector.
+    """
+    run_label = f'run="{report["name"]}"'
+    metric_dict: typing.Dict[str, typing.List[str]] = {}
+
+    def add(name: str, labels: str, value: typing.Any):
+        # Only numbers can be exported
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            return
+        metric_dict.setdefault(f"{PROMETHEUS_PREFIX}_{name}", []).append(
+            f"{PROMETHEUS_PREFIX}_{name}{{{labels}}} {value}"
+        )
+
+    add("run_seconds", run_label, report["seconds"])
+    add("run_peak_memory_bytes", run_label, report["peak_memory_bytes"])
+    add("run_peak_child_memory_bytes", run_label, report["peak_child_memory_bytes"])
+    add(
+        "run_started_timestamp_seconds",
+        run_label,
+        datetime.fromisoformat(report["started"]).timestamp(),
+    )
+    for stage, stage_metrics in report["stages"].items():
+        labels = f'{run_label},stage="{stage}"'
+        for key, value in stage_metrics.items():
+            add(f"stage_{key}", labels, value)
+    for source, source_metrics in report["sources"].items():
+        labels = f'{run_label},source="{source}"'
+        for key, value in source_metrics.items():
+            add(f"source_{key}", labels, value)
+
+    line_list = []
+    for name, sample_list in metric_dict.items():
+        line_list.append(f"# TYPE {name} gauge")
+        line_list.extend(sample_list)
+    return "\n".join(line_list) + "\n"
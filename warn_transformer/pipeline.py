@@ -0,0 +1,100 @@
+import logging
+import time
+import typing
+from pathlib import Path
+
+from . import consolidate, download, integrate, profiling, utils
+from .schema import WarnNotice
+
+logger = logging.getLogger(__name__)
+
+
+def run(
+    download_dir: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
+    source: typing.Optional[str] = None,
+    skip_download: bool = False,
+    concurrency: int = 1,
+    force: bool = False,
+    jobs: int = 1,
+    use_cache: bool = True,
+    init_current_data: bool = False,
+    current_path: typing.Optional[Path] = None,
+    prometheus: bool = False,
+    use_store: bool = False,
+    run_size: typing.Optional[int] = None,
+) -> typing.Dict[str, float]:
+    """Download, consolidate and integrate our data in a single process.
+
+    Consolidated records are handed to integrate in memory, rather than read back
+    from the file, though every stage still writes out the same files as it does on its own.
+
+    Args:
+        download_dir (Path): The directory where raw data files are downloaded.
+        source (str): The slug of a source you'd like to run as a one-off (optional)
+        skip_download (bool): Set to True to work from the files already in the download directory. Default False.
+        concurrency (int): The number of files to download at the same time. Default 1.
+        force (bool): Set to True to download every file, changed or not. Default False.
+        jobs (int): The number of sources to transform in parallel. Default 1.
+        use_cache (bool): Set to False to skip the caches of transformed sources and the current dataset. Default True.
+        init_current_data (bool): Set to True when you want to create a new integrated dataset from scratch. Default False.
+        current_path (Path): A local copy of the current dataset to read instead of downloading one (optional)
+        prometheus (bool): Set to True to write Prometheus textfiles alongside the JSON reports of each stage. Default False.
+        use_store (bool): Set to True to integrate into the SQLite store of the integrated dataset in place. Default False.
+        run_size (int): Write integrated.csv by merging sorted runs of this many records, rather than sorting every record in memory. (optional)
+
+    Returns: A dictionary with the number of seconds each stage took.
+    """
+    timing_dict = {}
+
+    # Download the raw data
+    if skip_download:
+        logger.debug("Skipping download")
+    else:
+        start = time.perf_counter()
+        with profiling.stage("download"):
+            summary = download.run(
+                download_dir, source, concurrency=concurrency, force=force
+            )
+        timing_dict["download"] = time.perf_counter() - start
+        if summary["failure_list"]:
+            raise RuntimeError(
+                f"{len(summary['failure_list'])} of {summary['file_count']} downloads failed"
+            )
+
+    # Consolidate it, keeping the records in memory
+    start = time.perf_counter()
+    record_list: typing.List[WarnNotice] = []
+    with profiling.stage("consolidate"):
+        consolidated_path = consolidate.run(
+            download_dir,
+            source,
+            jobs=jobs,
+            use_cache=use_cache,
+            record_list=record_list,
+            prometheus=prometheus,
+        )
+    timing_dict["consolidate"] = time.perf_counter() - start
+
+    # And integrate them with the current dataset
+    start = time.perf_counter()
+    with profiling.stage("integrate"):
+        integrate.run(
+            consolidated_path,
+            init_current_data=init_current_data,
+            current_path=current_path,
+            use_cache=use_cache,
+            new_data_list=record_list,
+            prometheus=prometheus,
+            use_store=use_store,
+            run_size=run_size,
+        )
+    timing_dict["integrate"] = time.perf_counter() - start
+
+    # Log how long it all took
+    for stage, seconds in timing_dict.items():
+        logger.debug(f"{stage} took {seconds:.2f}s")
+    return timing_dict
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,87 @@
+import cProfile
+import logging
+import pstats
+import sys
+import tracemalloc
+import typing
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# How profiling has been set up. It's off until enable is called.
+SETTINGS: typing.Dict[str, typing.Any] = dict(
+    enabled=False, output_dir=None, memory=False, top=20
+)
+
+# The stages being profiled right now. Only the outermost is, since profilers can't be nested.
+ACTIVE_STAGES: typing.List[str] = []
+
+
+def enable(output_dir: Path, memory: bool = False, top: int = 20):
+    """Turn on profiling for every stage that runs from here on.
+
+    Args:
+        output_dir (Path): The directory where the profiles will be saved.
+        memory (bool): Set to True to trace memory allocations too. Default False.
+        top (int): How many of the hottest functions and biggest allocations to print. Default 20.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    SETTINGS.update(enabled=True, output_dir=output_dir, memory=memory, top=top)
+
+
+def disable():
+    """Turn profiling back off."""
+    SETTINGS.update(enabled=False, output_dir=None, memory=False)
+
+
+@contextmanager
+def stage(name: str) -> typing.Iterator[None]:
+    """Profile a stage of our work, if profiling is turned on.
+
+    The cProfile stats are saved to <name>.prof, and the memory snapshot, if requested,
+    to <name>.snapshot, both in the profiling directory. A summary is printed to stderr.
+
+    Work done in other processes, like consolidate's pool of jobs, isn't captured.
+
+    Args:
+        name (str): The name of the stage.
+    """
+    # If profiling is off, or another stage is already being profiled, do nothing
+    if not SETTINGS["enabled"] or ACTIVE_STAGES:
+        yield
+        return
+
+    ACTIVE_STAGES.append(name)
+    output_dir = SETTINGS["output_dir"]
+    if SETTINGS["memory"]:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        ACTIVE_STAGES.pop()
+
+        # Save the stats and print the hottest functions
+        prof_path = output_dir / f"{name}.prof"
+        profiler.dump_stats(prof_path)
+        print(f"\nProfile of {name} saved to {prof_path}", file=sys.stderr)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(SETTINGS["top"])
+
+        # Save the memory snapshot and print the biggest allocations
+        if SETTINGS["memory"]:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot_path = output_dir / f"{name}.snapshot"
+            snapshot.dump(str(snapshot_path))
+            print(
+                f"Memory snapshot of {name} saved to {snapshot_path}. "
+                f"Peak traced memory was {peak / 1024 / 1024:,.1f} MiB",
+                file=sys.stderr,
+            )
+            for statistic in snapshot.statistics("lineno")[: SETTINGS["top"]]:
+                print(f"  {statistic}", file=sys.stderr)
@@ -1,13 +1,22 @@
 import csv
-import hashlib
-import json
+import functools
 import logging
+import re
+import time
 import typing
-from datetime import datetime, timedelta
+from collections import Counter
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import islice
+from operator import itemgetter
 from pathlib import Path
 
 from marshmallow import Schema, fields, validate
 
+from . import hashing, utils
+from .dates import DateParser
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,6 +35,295 @@ class WarnNoticeSchema(Schema):
     is_amendment = fields.Boolean(required=True, dump_default=False)
 
 
+# The fields of our integrated dataset, in the order they're written out
+INTEGRATED_FIELDS = (
+    "hash_id",
+    "first_inserted_date",
+    "notice_date",
+    "effective_date",
+    "postal_code",
+    "company",
+    "location",
+    "jobs",
+    "is_closure",
+    "is_temporary",
+    "is_superseded",
+    "is_amendment",
+    "likely_ancestor",
+    "estimated_amendments",
+    "last_updated_date",
+)
+
+
+class WarnNotice(MutableMapping):
+    """A compact record of a WARN Act Notice.
+
+    It stores its values in slots, rather than a dictionary, to save memory
+    wherever a whole dataset is held at once, like the records consolidate hands to integrate
+    and the current and new data integrate compares. Records passing through our transformers
+    one at a time stay plain dictionaries, which are quicker to build and read.
+    It can still be read and edited like a dictionary.
+    Fields that haven't been filled in are left out, just as they would be from a dictionary.
+    """
+
+    __slots__ = (
+        # The fields in our WarnNoticeSchema
+        "hash_id",
+        "postal_code",
+        "company",
+        "location",
+        "notice_date",
+        "effective_date",
+        "jobs",
+        "is_temporary",
+        "is_closure",
+        "is_amendment",
+        # The fields added when records are integrated
+        "first_inserted_date",
+        "last_updated_date",
+        "estimated_amendments",
+        "is_superseded",
+        "likely_ancestor",
+    )
+    FIELD_SET = frozenset(__slots__)
+
+    def __init__(self, **kwargs):
+        """Intialize a new instance.
+
+        Args:
+            **kwargs: The values of the record's fields.
+        """
+        if not self.FIELD_SET.issuperset(kwargs):
+            unknown = ", ".join(k for k in kwargs if k not in self.FIELD_SET)
+            raise KeyError(f"{unknown} is not a WarnNotice field")
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def from_dict(cls, data: typing.Mapping) -> "WarnNotice":
+        """Create a record from a dictionary, dropping any keys that aren't one of our fields.
+
+        Args:
+            data (dict): The record's fields, like a row read from one of our CSV files.
+
+        Returns: A new WarnNotice.
+        """
+        obj = cls()
+        for key, value in data.items():
+            if key in cls.FIELD_SET:
+                setattr(obj, key, value)
+        return obj
+
+    def __getitem__(self, key: str) -> typing.Any:
+        """Get the value of a field."""
+        if key not in self.FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: typing.Any):
+        """Set the value of a field."""
+        if key not in self.FIELD_SET:
+            raise KeyError(f"{key} is not a WarnNotice field")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        """Clear the value of a field."""
+        if key not in self.FIELD_SET:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self) -> typing.Iterator[str]:
+        """Iterate over the fields that have been filled in."""
+        return (k for k in self.__slots__ if hasattr(self, k))
+
+    def __len__(self) -> int:
+        """Count the fields that have been filled in."""
+        return sum(1 for k in self.__slots__ if hasattr(self, k))
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        """Get the value of a field, or a default if it hasn't been filled in."""
+        if key not in self.FIELD_SET:
+            return default
+        return getattr(self, key, default)
+
+    def __repr__(self) -> str:
+        """Represent the record as a string."""
+        return f"WarnNotice({dict(self)!r})"
+
+
+def pack_records(
+    record_list: typing.Sequence[typing.Mapping],
+) -> typing.Tuple[typing.Tuple[str, ...], list[tuple]]:
+    """Pack records into plain tuples that are quick to pass between processes or interpreters.
+
+    Every record must have the same fields, as the output of a transformer does.
+
+    Args:
+        record_list (list): The records to pack.
+
+    Returns: A tuple with the names of the fields and a list of tuples of each record's values.
+    """
+    field_tuple = tuple(record_list[0]) if record_list else ()
+    return field_tuple, [tuple(r[f] for f in field_tuple) for r in record_list]
+
+
+def unpack_records(
+    packed: typing.Tuple[typing.Sequence[str], typing.Iterable[tuple]],
+) -> list[dict]:
+    """Unpack records packed by pack_records.
+
+    Args:
+        packed (tuple): The names of the fields and a list of tuples of each record's values.
+
+    Returns: A list of records.
+    """
+    field_tuple, value_list = packed
+    return [dict(zip(field_tuple, values)) for values in value_list]
+
+
+class FastSchemaLoader:
+    """Load records the way a marshmallow schema would, only faster.
+
+    Records made up of exactly the plain types the schema expects are checked
+    and converted directly. Anything else is handed to the schema itself,
+    so invalid records raise the same errors they always have.
+    """
+
+    # The strings we're sure any marshmallow Date field will read the same way
+    ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+    def __init__(self, schema: Schema, many: bool = False):
+        """Intialize a new instance.
+
+        Args:
+            schema (Schema): An instance of the marshmallow schema to mimic.
+            many (bool): Set to True to load lists of records. Default False.
+        """
+        self.schema = schema
+        self.many = many
+
+        # Keep count of how many records we hand off to the schema
+        self.fallbacks = 0
+
+        # Compile a converter for each field, if we know how
+        self.field_list: typing.Optional[list] = []
+        for name, field in schema.load_fields.items():
+            converter = self.get_converter(field)
+            if converter is None or field.data_key or field.attribute:
+                self.field_list = None
+                break
+            self.field_list.append(
+                (name, converter, field.allow_none, field.validators)
+            )
+
+        # If the schema has any hooks, we can't skip them
+        if any(schema._hooks.values()):
+            self.field_list = None
+
+    @classmethod
+    def get_converter(
+        cls, field: fields.Field
+    ) -> typing.Optional[typing.Callable[[typing.Any], typing.Any]]:
+        """Get a function that converts a plain value for the provided field.
+
+        The function raises a ValueError for anything it isn't sure about.
+
+        Args:
+            field (Field): A marshmallow field.
+
+        Returns: A function. Or, if the field isn't a type we know, a None.
+        """
+        if type(field) is fields.String:
+            return cls.convert_string
+        if type(field) is fields.Integer:
+            return cls.convert_integer
+        if type(field) is fields.Boolean:
+            return cls.convert_boolean
+        if type(field) is fields.Date and field.format in (None, "iso", "iso8601"):
+            return cls.convert_date
+        return None
+
+    @staticmethod
+    def convert_string(value: typing.Any) -> str:
+        """Pass through a string."""
+        if type(value) is not str:
+            raise ValueError()
+        return value
+
+    @staticmethod
+    def convert_integer(value: typing.Any) -> int:
+        """Pass through an integer."""
+        if type(value) is not int:
+            raise ValueError()
+        return value
+
+    @staticmethod
+    def convert_boolean(value: typing.Any) -> bool:
+        """Pass through a boolean."""
+        if value is not True and value is not False:
+            raise ValueError()
+        return value
+
+    @classmethod
+    def convert_date(cls, value: typing.Any) -> date:
+        """Convert an ISO date string into a date."""
+        if type(value) is not str or not cls.ISO_DATE_RE.fullmatch(value):
+            raise ValueError()
+        return date.fromisoformat(value)
+
+    def load(self, data: typing.Any) -> typing.Any:
+        """Deserialize and validate data.
+
+        Args:
+            data: A record, or a list of them if many is True.
+
+        Returns: The loaded record, or list of records.
+        """
+        if self.many:
+            return [self.load_one(d) for d in data]
+        return self.load_one(data)
+
+    def load_one(self, data: typing.Any) -> dict:
+        """Deserialize and validate a single record.
+
+        Args:
+            data: A record.
+
+        Returns: The loaded record.
+        """
+        # If we can't do it ourselves, let the schema do it
+        if (
+            self.field_list is None
+            or type(data) is not dict
+            or len(data) != len(self.field_list)
+        ):
+            self.fallbacks += 1
+            return self.schema.load(data)
+
+        try:
+            loaded: dict = {}
+            for name, converter, allow_none, validator_list in self.field_list:
+                value = data[name]
+                if value is None and allow_none:
+                    loaded[name] = None
+                    continue
+                value = converter(value)
+                for validator in validator_list:
+                    validator(value)
+                loaded[name] = value
+            return loaded
+        except Exception:
+            # Anything unexpected goes to the schema, which will raise the proper error
+            self.fallbacks += 1
+            return self.schema.load(data)
+
+
 class BaseTransformer:
     """Transform a state's raw data for consolidation."""
 
@@ -37,65 +335,243 @@ class BaseTransformer:
 
     # The default date format. It will need to be customized by source.
     date_format: typing.Any = "%m/%d/%Y"
+    # When a value fits more than one date format, the last one in the list wins.
+    # Set this to False to have the first one win instead.
+    date_format_last_match_wins: bool = True
     # Manual date corrections for malformed data
     date_corrections: dict = {}
     # How many days in the future are allowed
     max_future_days: int = 365
     # The minimum year allowed
     minimum_year: int = 1988
+    # How many distinct raw date strings to remember once parsed. Set to 0 to turn it off.
+    date_cache_size: int = 1024
+    # Subclasses that override transform_date can set this to True to use the cache,
+    # so long as their result depends only on the raw string.
+    cache_transform_date: bool = False
 
     # Manual jobs corrections for malformed data
     jobs_corrections: dict = {}
     # The max jobs we allow without throwing an error
     maximum_jobs: int = 10000
 
-    def __init__(self, input_dir: Path):
+    # How many raw rows to hold in memory at once when streaming
+    chunk_size: int = 1000
+
+    # The fewest prepped rows worth splitting into shards. Smaller sources aren't
+    # worth the cost of starting up worker processes and are transformed serially.
+    shard_min_rows: int = 2000
+
+    # The fields compiled into functions that pull each value from a raw row.
+    # They are filled in automatically when a subclass is created.
+    _field_getters: dict = dict()
+    # The optional notice_date and effective_date getters, which are None if missing
+    _date_getters: tuple = (None, None)
+
+    def __init_subclass__(cls, **kwargs):
+        """Compile the fields of a new subclass so they can be quickly pulled from each row."""
+        super().__init_subclass__(**kwargs)
+        cls._field_getters = {
+            name: get_field_getter(method) for name, method in cls.fields.items()
+        }
+        cls._date_getters = (
+            cls._field_getters.get("notice_date"),
+            cls._field_getters.get("effective_date"),
+        )
+
+    def __init__(
+        self,
+        input_dir: Path,
+        stream: bool = False,
+        fast_validation: bool = False,
+        shards: int = 1,
+    ):
         """Intialize a new instance.
 
         Args:
             input_dir (Path): A directory where our raw data is stored
+            stream (bool): Set to True to read the raw data lazily with iter_transform. Default False.
+            fast_validation (bool): Set to True to validate rows with a FastSchemaLoader. Default False.
+            shards (int): The number of worker processes to split the rows across in transform. Default 1.
         """
         self.input_dir = input_dir
-        self.raw_data = self.get_raw_data()
+        self.fast_validation = fast_validation
+        self.shards = shards
+
+        # Keep count of what happens to our rows, for reporting
+        self.metrics: typing.Counter[str] = Counter()
+        self.validation_seconds = 0.0
+        # Along with what our worker processes count, when we're sharded
+        self.shard_metrics: typing.Counter[str] = Counter()
+
+        # Build our validator once, so it can be reused for every row
+        if fast_validation:
+            self.validator: typing.Any = FastSchemaLoader(self.schema(), many=True)
+        else:
+            self.validator = self.schema(many=True)
+
+        # Capture a single reference date for checking dates throughout this run
+        self.today = datetime.today()
+
+        # Prepare to parse dates in whatever formats this source uses
+        self.date_parser = DateParser(
+            self.date_format, last_match_wins=self.date_format_last_match_wins
+        )
+
+        # Remember the dates we parse, if it's safe
+        self.cached_transform_date = self.transform_date
+        if self.date_cache_size and (
+            type(self).transform_date is BaseTransformer.transform_date
+            or self.cache_transform_date
+        ):
+            self.cached_transform_date = functools.lru_cache(
+                maxsize=self.date_cache_size
+            )(self.transform_date)
+
+        if not stream:
+            self.raw_data = self.get_raw_data()
 
     def get_raw_data(self) -> list[dict]:
         """Get the raw data from our scraper for this source.
 
         Returns: A list of raw rows of data from the source.
         """
+        return list(self.iter_raw_data())
+
+    def iter_raw_data(self) -> typing.Iterator[dict]:
+        """Read the raw data from our scraper for this source one row at a time.
+
+        Returns: An iterator of raw rows of data from the source.
+        """
         # Get downloaded file
         raw_path = self.input_dir / f"{self.postal_code.lower()}.csv"
         # Open the csv
         with open(raw_path) as fh:
-            reader = csv.DictReader(fh)
-            # Return it as a list
-            return list(reader)
+            yield from csv.DictReader(fh)
 
     def transform(self) -> list[dict]:
         """Transform prepared rows into a form that's ready for consolidation.
 
-        Returns: A validated list of dictionaries that conform to our schema
+        Returns: A validated list of records that conform to our schema
         """
         logger.debug(f"Transforming {self.postal_code}")
 
         # Prep the row list for transformation
         row_list = self.prep_row_list(self.raw_data)
+        self.metrics["raw_rows"] += len(self.raw_data)
+        self.metrics["prepped_rows"] += len(row_list)
 
-        # Transform the row list into dicts that are ready to be submitted for validation
-        transformed_list = [self.transform_row(r) for r in row_list]
+        if self.shards > 1 and len(row_list) >= self.shard_min_rows:
+            # Split the work across a pool of processes
+            validated_list = self.transform_shards(row_list)
+        else:
+            # Transform the row list into dicts that are ready to be submitted for validation
+            transformed_list = [self.transform_row(r) for r in row_list]
 
-        # Validate each row against our schema
-        validated_list = [self.schema().load(r) for r in transformed_list]
+            # Validate the rows against our schema
+            validated_list = self.validate_row_list(transformed_list)
 
         # Deal with amendments
         amended_list = self.handle_amendments(validated_list)
+        self.metrics["output_rows"] += len(amended_list)
 
         # Return the result, which should be ready for consolidation
         return amended_list
 
+    def iter_transform(self) -> typing.Iterator[dict]:
+        """Transform the raw data a chunk at a time, without holding it all in memory.
+
+        Sources with custom amendment handling need to see every record at once,
+        so their validated rows are gathered into a list before it's run.
+
+        Returns: An iterator of validated records that conform to our schema
+        """
+        logger.debug(f"Streaming {self.postal_code}")
+
+        # Prep, transform and validate the raw data a chunk at a time
+        validated_iter = (
+            r
+            for chunk in iter_chunks(self.iter_raw_data(), self.chunk_size)
+            for r in self.validate_row_list(
+                [self.transform_row(r) for r in self.prep_chunk(chunk)]
+            )
+        )
+
+        # Deal with amendments
+        if type(self).handle_amendments is BaseTransformer.handle_amendments:
+            # The default only checks each record, so it can go chunk by chunk
+            for chunk in iter_chunks(validated_iter, self.chunk_size):
+                amended_list = self.handle_amendments(chunk)
+                self.metrics["output_rows"] += len(amended_list)
+                yield from amended_list
+        else:
+            amended_list = self.handle_amendments(list(validated_iter))
+            self.metrics["output_rows"] += len(amended_list)
+            yield from amended_list
+
+    def transform_shards(self, row_list: list[dict]) -> list[dict]:
+        """Transform and validate prepped rows in a pool of worker processes.
+
+        The rows are split into one contiguous shard per process. The results are put back
+        together in their original order, so handle_amendments sees the same sequence of
+        records as it would if they were transformed serially.
+
+        Args:
+            row_list (list): A list of prepped rows.
+
+        Returns: A validated list of records that conform to our schema
+        """
+        logger.debug(f"Transforming {self.postal_code} in {self.shards} shards")
+        shard_size = -(-len(row_list) // self.shards)
+        worker = functools.partial(
+            transform_shard,
+            type(self),
+            self.input_dir,
+            fast_validation=self.fast_validation,
+            today=self.today,
+        )
+        validated_list = []
+        with ProcessPoolExecutor(max_workers=self.shards) as executor:
+            # Map returns results in the order they were submitted
+            for packed, shard_metrics in executor.map(
+                worker, iter_chunks(row_list, shard_size)
+            ):
+                validated_list.extend(unpack_records(packed))
+                self.validation_seconds += shard_metrics.pop("validation_seconds")
+                self.shard_metrics.update(shard_metrics)
+        return validated_list
+
+    def prep_chunk(self, chunk: list[dict]) -> list[dict]:
+        """Prep a chunk of raw rows while streaming, counting them as they go by.
+
+        Args:
+            chunk (list): A list of raw rows of data from the source.
+
+        Returns: The prepped rows.
+        """
+        row_list = self.prep_row_list(chunk)
+        self.metrics["raw_rows"] += len(chunk)
+        self.metrics["prepped_rows"] += len(row_list)
+        return row_list
+
+    def validate_row_list(self, row_list: list[dict]) -> list[dict]:
+        """Validate a batch of transformed rows against our schema.
+
+        Args:
+            row_list (list): A list of transformed rows.
+
+        Returns: A validated list of records that conform to our schema
+        """
+        start = time.perf_counter()
+        validated_list = self.validator.load(row_list)
+        self.validation_seconds += time.perf_counter() - start
+        return validated_list
+
     def prep_row_list(self, row_list: list[dict]) -> list[dict]:
         """Make necessary transformations to the raw row list prior to transformation.
 
+        When streaming, this is run on one chunk of the raw data at a time.
+
         Args:
             row_list (list): A list of raw rows of data from the source.
 
@@ -108,6 +584,7 @@ class BaseTransformer:
                 # A list with only empty cells will throw an error
                 next(v for v in row.values() if v.strip())
             except StopIteration:
+                self.metrics["empty_rows"] += 1
                 continue
             prepped_list.append(row)
         return prepped_list
@@ -121,31 +598,27 @@ class BaseTransformer:
         Returns: A transformed dict that's ready to be loaded into our consolidated schema.
         """
         # Parse the fields we expect in every transformer
+        getters = self._field_getters
         data = dict(
             postal_code=self.postal_code.upper(),
-            company=self.transform_company(
-                self.get_raw_value(row, self.fields["company"])
-            ),
-            location=self.transform_location(
-                self.get_raw_value(row, self.fields["location"])
-            ),
-            jobs=self.transform_jobs(self.get_raw_value(row, self.fields["jobs"])),
+            company=self.transform_company(getters["company"](row)),
+            location=self.transform_location(getters["location"](row)),
+            jobs=self.transform_jobs(getters["jobs"](row)),
             is_temporary=self.check_if_temporary(row),
             is_closure=self.check_if_closure(row),
             is_amendment=self.check_if_amendment(row),
         )
 
         # Add optional date fields
-        if "notice_date" in self.fields:
-            data["notice_date"] = self.transform_date(
-                self.get_raw_value(row, self.fields["notice_date"])
-            )
+        notice_date_getter, effective_date_getter = self._date_getters
+        if notice_date_getter:
+            data["notice_date"] = self.cached_transform_date(notice_date_getter(row))
         else:
             data["notice_date"] = None
 
-        if "effective_date" in self.fields:
-            data["effective_date"] = self.transform_date(
-                self.get_raw_value(row, self.fields["effective_date"])
+        if effective_date_getter:
+            data["effective_date"] = self.cached_transform_date(
+                effective_date_getter(row)
             )
         else:
             data["effective_date"] = None
@@ -167,14 +640,7 @@ class BaseTransformer:
 
         Returns: A value ready for transformation.
         """
-        # If a string is provided, pull it from the row dict.
-        if isinstance(method, str):
-            return row[method]
-        # If a function is provided, run the row through it.
-        elif isinstance(method, typing.Callable):
-            return method(row)
-        else:
-            raise ValueError("The field method you provided is not valid.")
+        return get_field_getter(method)(row)
 
     def get_hash_id(self, data: dict) -> str:
         """Convert the row into a unique hexdigest to use as a unique identifier.
@@ -184,9 +650,7 @@ class BaseTransformer:
 
         Returns: A unique hexdigest string computed from the source data.
         """
-        dict_string = json.dumps(data)
-        hash_obj = hashlib.sha224(dict_string.encode("utf-8"))
-        return hash_obj.hexdigest()
+        return hashing.get_hash_id(data, utils.WARN_TRANSFORMER_HASH_VERSION)
 
     def transform_company(self, value: str) -> str:
         """Transform a raw company name.
@@ -223,32 +687,16 @@ class BaseTransformer:
         if not value:
             return None
 
-        # The result, whene we find it
-        dt: typing.Any = None
+        # Parse it with whichever of our formats fits
+        dt: typing.Any = self.date_parser.parse(value)
 
-        # If there's only one date_format, try that
-        if isinstance(self.date_format, str):
-            try:
-                dt = datetime.strptime(value, self.date_format)
-            except ValueError:
-                logger.debug(
-                    f"{self.postal_code} - Could not parse '{value}'. Looking up correction"
-                )
-                dt = self.date_corrections[value]
-
-        # If it's a list, try them one by one
-        elif isinstance(self.date_format, (list, tuple)):
-            for f in self.date_format:
-                try:
-                    dt = datetime.strptime(value, f)
-                except ValueError:
-                    continue
-            # If there's nothing at the end of the loop, try the correction
-            if not dt:
-                logger.debug(
-                    f"{self.postal_code} - Could not parse '{value}'. Looking up correction"
-                )
-                dt = self.date_corrections[value]
+        # If nothing fits, try the correction
+        if dt is None:
+            logger.debug(
+                f"{self.postal_code} - Could not parse '{value}'. Looking up correction"
+            )
+            self.metrics["date_corrections"] += 1
+            dt = self.date_corrections[value]
 
         # If the date parses as None, return that
         if dt is None:
@@ -258,11 +706,11 @@ class BaseTransformer:
         assert dt is not None and isinstance(dt, datetime)
 
         # If the date is more than 365 days in future, fix it
-        today = datetime.today()
-        if dt > today + timedelta(days=self.max_future_days):
+        if dt > self.today + timedelta(days=self.max_future_days):
             logger.debug(
                 f"{self.postal_code} - Date '{dt}' is more than {self.max_future_days} days in the future. Looking up correction"
             )
+            self.metrics["date_corrections"] += 1
             dt = self.date_corrections[value]
 
         # If the date is below the minimum year, fix it
@@ -270,6 +718,7 @@ class BaseTransformer:
             logger.debug(
                 f"{self.postal_code} - Year {dt.year} below minimum of {self.minimum_year}. Looking up correction"
             )
+            self.metrics["date_corrections"] += 1
             dt = self.date_corrections[value]
 
         # If the date parses as None, return that
@@ -282,6 +731,46 @@ class BaseTransformer:
         # If we have a datetime, return the result as a string
         return str(dt.date())
 
+    def get_date_cache_info(self) -> typing.Optional[typing.NamedTuple]:
+        """Report how well the cache of parsed dates is working.
+
+        Returns: A named tuple with hits, misses, maxsize and currsize. Or, if the cache is off, a None.
+        """
+        if not hasattr(self.cached_transform_date, "cache_info"):
+            return None
+        return self.cached_transform_date.cache_info()
+
+    def get_metrics(self) -> dict:
+        """Report what happened to our rows.
+
+        Corrections are counted each time one is looked up. When transform_date is cached,
+        that's once for each distinct date string, rather than once for each row.
+
+        Returns: A dictionary of counts, along with the seconds spent validating.
+        """
+        metrics: dict = dict.fromkeys(
+            [
+                "raw_rows",
+                "empty_rows",
+                "prepped_rows",
+                "output_rows",
+                "date_corrections",
+                "jobs_corrections",
+            ],
+            0,
+        )
+        metrics.update(self.metrics)
+        metrics["validation_seconds"] = round(self.validation_seconds, 6)
+        metrics["date_parse_misses"] = self.date_parser.misses
+        if hasattr(self.cached_transform_date, "cache_info"):
+            metrics["date_cache_hits"] = self.cached_transform_date.cache_info().hits
+        if hasattr(self.validator, "fallbacks"):
+            metrics["validation_fallbacks"] = self.validator.fallbacks
+        # Add in what our worker processes counted, if we were sharded
+        for key, value in self.shard_metrics.items():
+            metrics[key] = metrics.get(key, 0) + value
+        return metrics
+
     def transform_jobs(self, value: str) -> int | None:
         """Transform a raw jobs number into an integer.
 
@@ -311,6 +800,7 @@ class BaseTransformer:
             logger.debug(
                 f"{self.postal_code} - Could not parse '{value}'. Looking up correction"
             )
+            self.metrics["jobs_corrections"] += 1
             clean_value = self.jobs_corrections[value]
 
         # If it's None, return it now
@@ -322,11 +812,13 @@ class BaseTransformer:
             logger.debug(
                 "{self.postal_code} - Jobs must be greater than 0. Looking up correction"
             )
+            self.metrics["jobs_corrections"] += 1
             clean_value = self.jobs_corrections[clean_value]
         if clean_value > self.maximum_jobs:
             logger.debug(
                 f"{self.postal_code} - Jobs greater than {self.maximum_jobs} are probably wrong. Looking up correction"
             )
+            self.metrics["jobs_corrections"] += 1
             clean_value = self.jobs_corrections[clean_value]
 
         # Pass it out
@@ -375,3 +867,67 @@ class BaseTransformer:
             logger.debug(f"No amendments in {self.postal_code}")
             return row_list
         raise NotImplementedError
+
+
+def transform_shard(
+    transformer_class: typing.Type[BaseTransformer],
+    input_dir: Path,
+    row_list: list[dict],
+    fast_validation: bool = False,
+    today: typing.Optional[datetime] = None,
+) -> typing.Tuple[tuple, dict]:
+    """Transform and validate a shard of a source's prepped rows in a worker process.
+
+    Args:
+        transformer_class (class): The transformer for the source.
+        input_dir (Path): The directory where our raw data files are stored.
+        row_list (list): The shard of prepped rows.
+        fast_validation (bool): Set to True to validate rows with a FastSchemaLoader. Default False.
+        today (datetime): The reference date used to check dates by the transformer that split up the rows (optional)
+
+    Returns: A tuple with the validated records, packed by pack_records, and the transformer's metrics.
+    """
+    # Don't read the raw data, since we've been handed the rows
+    transformer = transformer_class(
+        input_dir, stream=True, fast_validation=fast_validation
+    )
+    if today:
+        transformer.today = today
+    validated_list = transformer.validate_row_list(
+        [transformer.transform_row(r) for r in row_list]
+    )
+    return pack_records(validated_list), transformer.get_metrics()
+
+
+def get_field_getter(method: typing.Any) -> typing.Callable[[dict], typing.Any]:
+    """Compile a field method into a function that pulls its value from a row.
+
+    Args:
+        method: The technique to use to pull data.
+            If a string is provided, it is used to fetch a key of that name from the row.
+            If a callable function is provided, the row is run through it.
+
+    Returns: A function that accepts a raw row and returns a value ready for transformation.
+    """
+    # If a string is provided, pull it from the row dict.
+    if isinstance(method, str):
+        return itemgetter(method)
+    # If a function is provided, run the row through it.
+    elif callable(method):
+        return method
+    else:
+        raise ValueError("The field method you provided is not valid.")
+
+
+def iter_chunks(iterable: typing.Iterable, size: int) -> typing.Iterator[list]:
+    """Split an iterable into lists of a fixed size.
+
+    Args:
+        iterable: The items to split up.
+        size (int): The maximum length of each list.
+
+    Returns: An iterator of lists. The last one may be shorter than the rest.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -0,0 +1,522 @@
+import csv
+import logging
+import sqlite3
+import typing
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import blocking, utils
+from .schema import INTEGRATED_FIELDS, WarnNotice, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the layout of the database changes
+STORE_VERSION = 3
+
+# How many values to put in a single query
+BATCH_SIZE = 500
+
+# The columns that keep a copy of each timestamp in a form that sorts the way the times do,
+# keyed by the field they're copied from
+SORT_COLUMNS = {
+    "first_inserted_date": "first_inserted_sort",
+    "last_updated_date": "last_updated_sort",
+}
+
+# The order of integrated.csv, newest first. Ties keep the order records were added in.
+EXPORT_ORDER = "last_updated_sort DESC, first_inserted_sort DESC, notice_date DESC, seq"
+
+
+def get_path() -> Path:
+    """Get the path of the database where the integrated dataset is stored.
+
+    Returns: A Path to the SQLite database.
+    """
+    return utils.WARN_TRANSFORMER_OUTPUT_DIR / "processed" / "integrated.db"
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """Open the database, creating its tables and indexes if they don't exist yet.
+
+    Args:
+        db_path (Path): The path to the SQLite database.
+
+    Returns: A connection to the database.
+    """
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+
+    # A database laid out by another version has to be loaded again anyway, so start it over
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'meta'").fetchone():
+        if get_meta(conn, "version") != str(STORE_VERSION):
+            conn.executescript("""
+                DROP TABLE IF EXISTS notice;
+                DROP TABLE IF EXISTS notice_key;
+                DROP TABLE IF EXISTS token_count;
+                DROP TABLE meta;
+                """)
+
+    # Every field is stored as it's written to integrated.csv,
+    # so the file can be exported without converting anything.
+    # The timestamps are also copied into columns that sort in time order, which their text doesn't
+    # when they're in different time zones or some are missing the fraction of a second.
+    # Fields missing from the dataset the store was loaded from are left null.
+    # The seq column records the order records were added in.
+    # Each record is filed under the blocking keys of its company name, drawn from
+    # how many names in its source each token appeared in when the store was loaded.
+    column_list = [
+        "hash_id TEXT NOT NULL" if f == "hash_id" else f"{f} TEXT"
+        for f in INTEGRATED_FIELDS
+    ]
+    column_list.extend(f"{c} TEXT" for c in SORT_COLUMNS.values())
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS notice (
+            seq INTEGER PRIMARY KEY,
+            {", ".join(column_list)}
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS notice_hash_id ON notice (hash_id);
+        CREATE INDEX IF NOT EXISTS notice_postal_code ON notice (postal_code, notice_date);
+        CREATE INDEX IF NOT EXISTS notice_notice_date ON notice (notice_date);
+        CREATE INDEX IF NOT EXISTS notice_export ON notice ({EXPORT_ORDER});
+        CREATE TABLE IF NOT EXISTS notice_key (
+            postal_code TEXT,
+            key TEXT NOT NULL,
+            notice_seq INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS notice_key_key ON notice_key (postal_code, key);
+        CREATE TABLE IF NOT EXISTS token_count (
+            postal_code TEXT,
+            token TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (postal_code, token)
+        );
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+    return conn
+
+
+def is_ready(db_path: Path) -> bool:
+    """Check whether there's a database we can integrate new records into.
+
+    Args:
+        db_path (Path): The path to the SQLite database.
+
+    Returns: True if the database exists and was loaded with the current layout.
+    """
+    if not db_path.exists():
+        return False
+    conn = connect(db_path)
+    try:
+        return get_meta(conn, "version") == str(STORE_VERSION)
+    finally:
+        conn.close()
+
+
+def get_meta(conn: sqlite3.Connection, key: str) -> typing.Optional[str]:
+    """Get a value from the database's metadata.
+
+    Args:
+        conn (Connection): A connection to the database.
+        key (str): The name of the value.
+
+    Returns: The value, or a None if it hasn't been set.
+    """
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_meta(conn: sqlite3.Connection, key: str, value: str):
+    """Set a value in the database's metadata.
+
+    Args:
+        conn (Connection): A connection to the database.
+        key (str): The name of the value.
+        value (str): The value.
+    """
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def load(
+    conn: sqlite3.Connection,
+    record_list: typing.Iterable[typing.Mapping],
+    source: str = "",
+):
+    """Replace everything in the database with the records of a current dataset.
+
+    Args:
+        conn (Connection): A connection to the database.
+        record_list (list): The records, in the order they appear in the current dataset.
+        source (str): The version of the published dataset the records were downloaded from, or an empty string if they weren't. Default empty.
+    """
+    value_list = [get_values(r) for r in record_list]
+    with conn:
+        conn.execute("DELETE FROM notice")
+        conn.execute("DELETE FROM notice_key")
+        conn.execute("DELETE FROM token_count")
+        conn.executemany(get_insert_sql(or_ignore=True), value_list)
+
+        # Count the tokens in each source's company names and file every record under its keys
+        company_dict: typing.Dict[typing.Optional[str], list] = {}
+        for postal_code, company in conn.execute(
+            "SELECT postal_code, company FROM notice"
+        ):
+            company_dict.setdefault(postal_code, []).append(company)
+        conn.executemany(
+            "INSERT INTO token_count (postal_code, token, count) VALUES (?, ?, ?)",
+            (
+                (postal_code, token, count)
+                for postal_code, company_list in company_dict.items()
+                for token, count in blocking.count_tokens(company_list).items()
+            ),
+        )
+        add_keys(conn)
+
+        # The order of the current dataset stands until we integrate something into it
+        set_meta(conn, "version", str(STORE_VERSION))
+        set_meta(conn, "order", "loaded")
+        set_meta(conn, "source", source)
+    count = conn.execute("SELECT COUNT(*) FROM notice").fetchone()[0]
+    if len(value_list) > count:
+        logger.warning(f"Dropped {len(value_list) - count} duplicate hash_id values")
+    logger.debug(f"Loaded {count} records into the store")
+
+
+def get_insert_sql(or_ignore: bool = False) -> str:
+    """Get the statement that inserts a record.
+
+    Args:
+        or_ignore (bool): Set to True to skip records whose hash_id is already stored. Default False.
+
+    Returns: The SQL, which expects the values returned by get_values.
+    """
+    verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+    column_list = [*INTEGRATED_FIELDS, *SORT_COLUMNS.values()]
+    placeholders = ", ".join("?" for _ in column_list)
+    return f"{verb} INTO notice ({', '.join(column_list)}) VALUES ({placeholders})"
+
+
+def get_values(record: typing.Mapping) -> tuple:
+    """Convert a record into the values we store, which are the strings written to integrated.csv.
+
+    Args:
+        record (dict): An integrated record.
+
+    Returns: A tuple of values in the order of INTEGRATED_FIELDS, with a None for any field the record doesn't have,
+        followed by the sortable copies of its timestamps.
+    """
+    value_list = [
+        None if record.get(f) is None else str(record[f]) for f in INTEGRATED_FIELDS
+    ]
+    value_list.extend(get_sortable_timestamp(record.get(f)) for f in SORT_COLUMNS)
+    return tuple(value_list)
+
+
+def get_sortable_timestamp(value: typing.Any) -> typing.Optional[str]:
+    """Convert a timestamp into text that sorts in the same order as the time it marks.
+
+    Args:
+        value (datetime): A timestamp, or the string it's written out as.
+
+    Returns: A fixed-width ISO string, converted to UTC if the timestamp has a time zone. Or, if there's no timestamp, a None.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="microseconds")
+
+
+def get_record(row: typing.Sequence) -> WarnNotice:
+    """Convert a row from the database into a record, as it would be read back from integrated.csv.
+
+    Args:
+        row (tuple): The values in the order of INTEGRATED_FIELDS.
+
+    Returns: A WarnNotice, without the fields that are null.
+    """
+    return WarnNotice(**{k: v for k, v in zip(INTEGRATED_FIELDS, row) if v is not None})
+
+
+def get_order(conn: sqlite3.Connection) -> str:
+    """Get the order of the records in the current dataset.
+
+    Right after it's loaded, that's the order of the file it was loaded from.
+    After we've integrated records into it, it's the order of the exported integrated.csv.
+
+    Args:
+        conn (Connection): A connection to the database.
+
+    Returns: An SQL ORDER BY expression.
+    """
+    return "seq" if get_meta(conn, "order") == "loaded" else EXPORT_ORDER
+
+
+def count_by_source(conn: sqlite3.Connection) -> typing.Dict[str, int]:
+    """Count the stored records from each source.
+
+    Args:
+        conn (Connection): A connection to the database.
+
+    Returns: A dictionary keyed by postal code.
+    """
+    return dict(
+        conn.execute("SELECT postal_code, COUNT(*) FROM notice GROUP BY postal_code")
+    )
+
+
+def get_hash_index(
+    conn: sqlite3.Connection, new_data: typing.Dict[str, typing.List]
+) -> typing.Dict[str, typing.Set[str]]:
+    """Find which of the new records are already stored.
+
+    Args:
+        conn (Connection): A connection to the database.
+        new_data (dict): A dictionary keyed by postal code. Each value is a list of new records from that source.
+
+    Returns: A dictionary keyed by postal code. Each value is the set of hash_id values from that source that are stored.
+    """
+    hash_index = {}
+    for postal_code, row_list in new_data.items():
+        hash_set: typing.Set[str] = set()
+        for chunk in iter_chunks((r["hash_id"] for r in row_list), BATCH_SIZE):
+            placeholders = ", ".join("?" for _ in chunk)
+            hash_set.update(
+                r[0]
+                for r in conn.execute(
+                    f"SELECT hash_id FROM notice WHERE hash_id IN ({placeholders})",
+                    chunk,
+                )
+            )
+        hash_index[postal_code] = hash_set
+    return hash_index
+
+
+def get_token_counts(
+    conn: sqlite3.Connection, postal_code: str
+) -> typing.Dict[str, int]:
+    """Get how many of a source's company names each token appeared in when the store was loaded.
+
+    Args:
+        conn (Connection): A connection to the database.
+        postal_code (str): The source's postal code.
+
+    Returns: A dictionary keyed by token, ready for blocking.get_company_keys.
+    """
+    return dict(
+        conn.execute(
+            "SELECT token, count FROM token_count WHERE postal_code = ?",
+            (postal_code,),
+        )
+    )
+
+
+def add_keys(conn: sqlite3.Connection, after_seq: int = 0):
+    """File stored records under the blocking keys of their company names.
+
+    Records without a company name are filed under an empty key.
+
+    Args:
+        conn (Connection): A connection to the database.
+        after_seq (int): Only file the records added after this seq. Default 0, which files them all.
+    """
+    token_dict: typing.Dict[typing.Optional[str], typing.Dict[str, int]] = {}
+    key_list = []
+    for seq, postal_code, company in conn.execute(
+        "SELECT seq, postal_code, company FROM notice WHERE seq > ?", (after_seq,)
+    ).fetchall():
+        if postal_code not in token_dict:
+            token_dict[postal_code] = get_token_counts(conn, postal_code)
+        for key in blocking.get_company_keys(company, token_dict[postal_code]) or [""]:
+            key_list.append((postal_code, key, seq))
+    conn.executemany(
+        "INSERT INTO notice_key (postal_code, key, notice_seq) VALUES (?, ?, ?)",
+        key_list,
+    )
+
+
+def get_records(conn: sqlite3.Connection, postal_code: str) -> typing.List[WarnNotice]:
+    """Get every stored record from a source.
+
+    Args:
+        conn (Connection): A connection to the database.
+        postal_code (str): The source's postal code.
+
+    Returns: A list of WarnNotice records in the order they appear in the current dataset.
+    """
+    cursor = conn.execute(
+        f"SELECT {', '.join(INTEGRATED_FIELDS)} FROM notice "
+        f"WHERE postal_code = ? ORDER BY {get_order(conn)}",
+        (postal_code,),
+    )
+    return [get_record(r) for r in cursor]
+
+
+def get_key_matches(
+    conn: sqlite3.Connection,
+    postal_code: str,
+    key_list_list: typing.List[typing.List[str]],
+) -> typing.List[typing.List[typing.Tuple[bool, WarnNotice]]]:
+    """Get the stored records from a source that share a blocking key with each of a list of names.
+
+    Every name is looked up in a single query. The records filed under an empty key,
+    because they have no company name, are included with every name's matches.
+
+    Args:
+        conn (Connection): A connection to the database.
+        postal_code (str): The source's postal code.
+        key_list_list (list): The blocking keys of each name, from blocking.get_company_keys.
+
+    Returns: A list with the matches for each name, in the order they appear in the current dataset.
+        Each match is a tuple with whether the record was filed under a key and the WarnNotice record.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS query_key (query INTEGER, key TEXT)")
+    conn.execute("DELETE FROM query_key")
+    conn.executemany(
+        "INSERT INTO query_key (query, key) VALUES (?, ?)",
+        (
+            (i, key)
+            for i, key_list in enumerate(key_list_list)
+            for key in [*key_list, ""]
+        ),
+    )
+    # The cross join makes SQLite look up each key in the index,
+    # rather than scan the whole source and check each of its keys against the list
+    field_list = ", ".join(f"notice.{f}" for f in INTEGRATED_FIELDS)
+    cursor = conn.execute(
+        f"SELECT query_key.query, MIN(notice_key.key) != '', {field_list} "
+        "FROM query_key "
+        "CROSS JOIN notice_key ON notice_key.postal_code = ? AND notice_key.key = query_key.key "
+        "JOIN notice ON notice.seq = notice_key.notice_seq "
+        "GROUP BY query_key.query, notice.seq "
+        f"ORDER BY query_key.query, {get_order(conn)}",
+        (postal_code,),
+    )
+    match_list_list: typing.List[typing.List[typing.Tuple[bool, WarnNotice]]] = [
+        [] for _ in key_list_list
+    ]
+    for query, is_keyed, *values in cursor:
+        match_list_list[query].append((bool(is_keyed), get_record(values)))
+    conn.execute("DELETE FROM query_key")
+    return match_list_list
+
+
+def apply_changes(
+    conn: sqlite3.Connection,
+    amend_lookup: typing.Dict[str, typing.Mapping],
+    insert_list: typing.List[typing.Mapping],
+    now: datetime,
+):
+    """Integrate amended and new records into the database in place.
+
+    Args:
+        conn (Connection): A connection to the database.
+        amend_lookup (dict): The amended records, keyed by the hash_id of their likely ancestor.
+        insert_list (list): The new records.
+        now (datetime): The timestamp of this run.
+    """
+    with conn:
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM notice").fetchone()[
+            0
+        ]
+
+        # Pull the ancestors in the order they appear in the current dataset,
+        # so their replacements are added in the same order they'd be integrated from a file
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS ancestor (hash_id TEXT)")
+        conn.execute("DELETE FROM ancestor")
+        conn.executemany(
+            "INSERT INTO ancestor (hash_id) VALUES (?)", ((h,) for h in amend_lookup)
+        )
+        ancestor_list = conn.execute(
+            "SELECT hash_id, first_inserted_date, estimated_amendments FROM notice "
+            "WHERE hash_id IN (SELECT hash_id FROM ancestor) "
+            f"ORDER BY {get_order(conn)}"
+        ).fetchall()
+
+        # The first time we integrate into a freshly loaded dataset, fill in the flags
+        # it's missing, except on the ancestors, which are about to be superseded
+        if get_meta(conn, "order") == "loaded":
+            conn.execute(
+                "UPDATE notice SET "
+                "is_superseded = COALESCE(is_superseded, 'False'), "
+                "is_amendment = COALESCE(is_amendment, 'False') "
+                "WHERE (is_superseded IS NULL OR is_amendment IS NULL) "
+                "AND hash_id NOT IN (SELECT hash_id FROM ancestor)"
+            )
+        conn.execute("DELETE FROM ancestor")
+
+        insert_sql = get_insert_sql()
+        for hash_id, first_inserted_date, estimated_amendments in ancestor_list:
+            # Link the amended record to its likely ancestor
+            amended_row = dict(
+                amend_lookup[hash_id],
+                is_amendment=True,
+                is_superseded=False,
+                likely_ancestor=hash_id,
+                first_inserted_date=first_inserted_date,
+                last_updated_date=now,
+                estimated_amendments=int(estimated_amendments) + 1,
+            )
+            conn.execute(insert_sql, get_values(amended_row))
+
+            # And mark the ancestor as superseded
+            conn.execute(
+                "UPDATE notice SET is_superseded = 'True' WHERE hash_id = ?",
+                (hash_id,),
+            )
+
+        # Add the new records
+        conn.executemany(
+            insert_sql,
+            (
+                get_values(
+                    dict(
+                        r,
+                        first_inserted_date=now,
+                        last_updated_date=now,
+                        estimated_amendments=0,
+                        is_superseded=False,
+                        is_amendment=False,
+                    )
+                )
+                for r in insert_list
+            ),
+        )
+
+        # File what we added under its blocking keys, with the counts from when the store was loaded
+        add_keys(conn, last_seq)
+
+        # From now on, the current dataset is in the order we export it
+        set_meta(conn, "order", "exported")
+    logger.debug(
+        f"Amended {len(ancestor_list)} and inserted {len(insert_list)} records in the store"
+    )
+
+
+def export(conn: sqlite3.Connection, output_path: Path) -> int:
+    """Write the stored records out to integrated.csv, newest first.
+
+    Args:
+        conn (Connection): A connection to the database.
+        output_path (Path): Where to write the file.
+
+    Returns: The number of records written.
+    """
+    # Fields that were never set are written out blank
+    column_list = [f"COALESCE({f}, '')" for f in INTEGRATED_FIELDS]
+    cursor = conn.execute(
+        f"SELECT {', '.join(column_list)} FROM notice ORDER BY {EXPORT_ORDER}"
+    )
+    count = 0
+    with open(output_path, "w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(INTEGRATED_FIELDS)
+        for row in cursor:
+            writer.writerow(row)
+            count += 1
+    return count
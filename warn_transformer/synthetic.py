@@ -0,0 +1,430 @@
+import csv
+import logging
+import random
+import typing
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from pathlib import Path
+
+from . import hashing, utils
+from .dates import DateParser
+from .schema import INTEGRATED_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# The fields in our consolidated file, in the order they're written out
+CONSOLIDATED_FIELDS = (
+    "hash_id",
+    "postal_code",
+    "company",
+    "location",
+    "notice_date",
+    "effective_date",
+    "jobs",
+    "is_temporary",
+    "is_closure",
+    "is_amendment",
+)
+
+# The booleans, and nulls, behind the strings our CSV files write out
+BOOLEAN_VALUES = {"": None, "True": True, "False": False}
+
+# Words to build fake companies and places from when we don't have real ones to borrow
+COMPANY_WORDS = (
+    "Acme Allied American Atlas Blue Cascade Central Coastal Continental Delta "
+    "Eagle Empire First Frontier General Global Golden Great Harbor Heritage "
+    "Horizon Independent Keystone Liberty Lincoln Metro Midwest Mountain National "
+    "Northern Pacific Pioneer Premier Prairie Quality Regional River Southern "
+    "Summit Superior Union United Valley Western"
+).split()
+COMPANY_SUFFIXES = (
+    "Inc.",
+    "LLC",
+    "Corp.",
+    "Co.",
+    "Holdings",
+    "Manufacturing",
+    "Health",
+    "Logistics",
+    "Foods",
+    "Services",
+)
+CITY_WORDS = (
+    "Springfield Franklin Greenville Bristol Clinton Fairview Salem Madison "
+    "Georgetown Arlington Ashland Dover Oxford Jackson Burlington Manchester "
+    "Milton Newport Auburn Dayton Lexington Milford Riverside Winchester"
+).split()
+
+
+def generate_raw(
+    output_dir: Path,
+    scale: float = 1.0,
+    seed: int = 0,
+    template_dir: Path = utils.WARN_TRANSFORMER_OUTPUT_DIR / "raw",
+    source: typing.Optional[str] = None,
+) -> typing.List[Path]:
+    """Write out fake raw data files for every source, modeled on a set of real ones.
+
+    Each fake row starts as a copy of a randomly chosen real row.
+    The columns our transformers pull the company, location, dates and jobs from
+    are then refilled with new values, with dates written in the formats the source uses.
+
+    Args:
+        output_dir (Path): The directory where the fake files will be written.
+        scale (float): How many times larger than the real files the fake ones should be. Default 1.
+        seed (int): The seed for the random number generator, so runs can be repeated. Default 0.
+        template_dir (Path): The directory where the real raw data files are stored.
+        source (str): The slug of a source you'd like to generate as a one-off (optional)
+
+    Returns: A list of Paths to the files that were written.
+    """
+    # Get all of the transformers
+    transformer_list = utils.get_all_transformers()
+    if source:
+        transformer_list = [t for t in transformer_list if source.lower() in t.lower()]
+
+    # Make the output directory, if it doesn't already exist
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Generate each source, with a random generator of its own so they don't affect each other
+    path_list = []
+    for t in transformer_list:
+        rng = random.Random(f"{seed}-{t}")
+        path_list.append(generate_raw_source(t, output_dir, scale, rng, template_dir))
+    return path_list
+
+
+def generate_raw_source(
+    source: str,
+    output_dir: Path,
+    scale: float,
+    rng: random.Random,
+    template_dir: Path,
+) -> Path:
+    """Write out a fake raw data file for a single source.
+
+    Args:
+        source (str): The slug of the source.
+        output_dir (Path): The directory where the fake file will be written.
+        scale (float): How many times larger than the real file the fake one should be.
+        rng (Random): The random number generator to use.
+        template_dir (Path): The directory where the real raw data files are stored.
+
+    Returns: The Path to the file that was written.
+    """
+    # Get the transformer and the real data it reads
+    transformer = import_module(f"warn_transformer.transformers.{source}").Transformer
+    file_name = f"{transformer.postal_code.lower()}.csv"
+    with open(template_dir / file_name) as fh:
+        reader = csv.reader(fh)
+        header = next(reader)
+        template_list = list(reader)
+
+    # Figure out which columns we can refill.
+    # Rows are kept as lists, so any ragged ones come out the way they went in.
+    column_dict = {
+        name: header.index(column)
+        for name, column in transformer.fields.items()
+        if isinstance(column, str) and column in header
+    }
+
+    # Gather up the real values to sample from
+    pool_dict = {
+        i: [r[i] for r in template_list if len(r) > i and r[i]]
+        for i in column_dict.values()
+    }
+    word_list = sorted(
+        {
+            w
+            for v in pool_dict.get(column_dict.get("company", -1), [])
+            for w in v.split()
+        }
+    ) or list(COMPANY_WORDS)
+
+    # Learn which date formats each date column uses, and the range of dates it covers
+    parser = DateParser(transformer.date_format)
+    date_dict = {}
+    for name in ["notice_date", "effective_date"]:
+        if name in column_dict:
+            date_dict[column_dict[name]] = get_date_range(
+                transformer, parser, pool_dict[column_dict[name]]
+            )
+
+    # Make the fake rows
+    count = round(len(template_list) * scale)
+    logger.debug(f"Generating {count:,} fake rows for {source.upper()}")
+    output_path = output_dir / file_name
+    with open(output_path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(header)
+        for _ in range(count):
+            row = list(rng.choice(template_list))
+            for name, i in column_dict.items():
+                # Leave blanks blank, so the share of missing values stays realistic
+                if len(row) <= i or not row[i]:
+                    continue
+                if name == "company":
+                    row[i] = get_company(rng, word_list)
+                elif i in date_dict:
+                    row[i] = get_date_string(rng, *date_dict[i])
+                else:
+                    row[i] = rng.choice(pool_dict[i])
+            writer.writerow(row)
+    return output_path
+
+
+def get_date_range(
+    transformer: typing.Any, parser: DateParser, value_list: typing.List[str]
+) -> typing.Tuple[typing.List[str], date, date]:
+    """Learn the formats and range of a column of real date strings.
+
+    The range comes from the real dates alone, never the clock, so the same seed
+    makes the same file on any day. Dates the transformer has to correct are left out of it,
+    and every other real date is one it already accepts.
+
+    Args:
+        transformer (type): The Transformer class of the source.
+        parser (DateParser): A parser for the source's date formats.
+        value_list (list): The date strings found in the column.
+
+    Returns: A tuple with a list of the format of each date that could be parsed, the earliest date and the latest.
+    """
+    format_list = []
+    dt_list = []
+    for value in value_list:
+        for f in parser.precedence:
+            dt = parser.strptime(value.strip(), f)
+            if dt is not None:
+                format_list.append(f)
+                if (
+                    value not in transformer.date_corrections
+                    and value.strip() not in transformer.date_corrections
+                ):
+                    dt_list.append(dt.date())
+                break
+
+    # Keep the dates inside the range the transformer will accept
+    first_date = date(transformer.minimum_year, 1, 1)
+    last_date = first_date
+    if dt_list:
+        first_date = max(min(dt_list), first_date)
+        last_date = max(max(dt_list), first_date)
+    return format_list or [parser.precedence[-1]], first_date, last_date
+
+
+def get_date_string(
+    rng: random.Random, format_list: typing.List[str], first_date: date, last_date: date
+) -> str:
+    """Make up a date string.
+
+    Args:
+        rng (Random): The random number generator to use.
+        format_list (list): The formats to pick from, weighted by how often each occurs.
+        first_date (date): The earliest date allowed.
+        last_date (date): The latest date allowed.
+
+    Returns: A date string in one of the formats.
+    """
+    days = rng.randint(0, (last_date - first_date).days)
+    dt = datetime.combine(first_date + timedelta(days=days), datetime.min.time())
+    return dt.strftime(rng.choice(format_list))
+
+
+def get_company(rng: random.Random, word_list: typing.Sequence[str]) -> str:
+    """Make up a company name.
+
+    Args:
+        rng (Random): The random number generator to use.
+        word_list (list): The words to build the name from.
+
+    Returns: A company name.
+    """
+    word_count = rng.choice([1, 2, 2, 3])
+    return " ".join(rng.choice(word_list) for _ in range(word_count))
+
+
+def generate_integrated(
+    count: int,
+    seed: int = 0,
+    insert_share: float = 0.05,
+    amend_share: float = 0.05,
+) -> typing.Tuple[typing.List[dict], typing.List[dict], typing.Dict[str, typing.List]]:
+    """Make up a current integrated dataset and a new consolidated dataset to integrate with it.
+
+    The new dataset has every current record, except for a share that have been amended,
+    plus a share of brand new records. Amendments change the number of jobs, and nothing else,
+    so integrate should find their ancestors. Inserts are drawn from a separate list of names.
+
+    Args:
+        count (int): The number of records in the current dataset.
+        seed (int): The seed for the random number generator, so runs can be repeated. Default 0.
+        insert_share (float): The number of new records to add, as a share of the current count. Default 0.05.
+        amend_share (float): The share of current records to amend. Default 0.05.
+
+    Returns: A tuple with the current records, the new records and a dictionary
+        with lists of the hash_ids inserted and the (ancestor, amendment) hash_id pairs amended.
+        All values are strings, as if they'd been read in from our CSV files.
+    """
+    rng = random.Random(seed)
+    postal_code_list = [t.upper() for t in utils.get_all_transformers()]
+    timestamp = "2022-01-01 00:00:00+00:00"
+
+    # Make the current dataset
+    hash_set: typing.Set[str] = set()
+    current_list = []
+    for _ in range(count):
+        row = get_fake_record(rng, postal_code_list, COMPANY_WORDS, hash_set)
+        row.update(
+            first_inserted_date=timestamp,
+            last_updated_date=timestamp,
+            estimated_amendments="0",
+            is_superseded="False",
+            likely_ancestor="",
+        )
+        current_list.append(row)
+
+    # Pick which records to amend
+    amend_set = set(rng.sample(range(count), round(count * amend_share)))
+
+    # Build the new dataset from the current one
+    expected: typing.Dict[str, typing.List] = dict(inserted=[], amended=[])
+    new_list = []
+    for i, current_row in enumerate(current_list):
+        new_row = {k: current_row[k] for k in CONSOLIDATED_FIELDS}
+        if i in amend_set:
+            new_row["jobs"] = str(int(new_row["jobs"]) + rng.randint(1, 50))
+            new_row["is_amendment"] = "True"
+            new_row["hash_id"] = get_hash_id(new_row)
+            expected["amended"].append((current_row["hash_id"], new_row["hash_id"]))
+        new_list.append(new_row)
+
+    # Add the brand new records
+    insert_words = [w.upper()[::-1] for w in COMPANY_WORDS]
+    for _ in range(round(count * insert_share)):
+        row = get_fake_record(rng, postal_code_list, insert_words, hash_set)
+        expected["inserted"].append(row["hash_id"])
+        new_list.append(row)
+
+    return current_list, new_list, expected
+
+
+def get_fake_record(
+    rng: random.Random,
+    postal_code_list: typing.List[str],
+    word_list: typing.Sequence[str],
+    hash_set: typing.Set[str],
+) -> dict:
+    """Make up a consolidated record unlike any made so far.
+
+    Args:
+        rng (Random): The random number generator to use.
+        postal_code_list (list): The postal codes to pick from.
+        word_list (list): The words to build the company name from.
+        hash_set (set): The hash_ids of the records made so far. The new one is added to it.
+
+    Returns: A dictionary with string values for every consolidated field.
+    """
+    while True:
+        row = get_fake_values(rng, postal_code_list, word_list)
+        if row["hash_id"] not in hash_set:
+            hash_set.add(row["hash_id"])
+            return row
+
+
+def get_fake_values(
+    rng: random.Random,
+    postal_code_list: typing.List[str],
+    word_list: typing.Sequence[str],
+) -> dict:
+    """Make up the values of a consolidated record.
+
+    Args:
+        rng (Random): The random number generator to use.
+        postal_code_list (list): The postal codes to pick from.
+        word_list (list): The words to build the company name from.
+
+    Returns: A dictionary with string values for every consolidated field.
+    """
+    notice_date = date(2015, 1, 1) + timedelta(days=rng.randint(0, 365 * 7))
+    effective_date = notice_date + timedelta(days=rng.choice([0, 30, 60, 60, 90]))
+    row = dict(
+        hash_id="",
+        postal_code=rng.choice(postal_code_list),
+        company=f"{get_company(rng, word_list)} {rng.choice(COMPANY_SUFFIXES)}",
+        location=rng.choice(CITY_WORDS),
+        notice_date=str(notice_date),
+        effective_date=str(effective_date),
+        jobs=str(rng.choice([rng.randint(1, 100), rng.randint(50, 500)])),
+        is_temporary=rng.choice(["", "", "True"]),
+        is_closure=rng.choice(["", "True", "False"]),
+        is_amendment="False",
+    )
+    row["hash_id"] = get_hash_id(row)
+    return row
+
+
+def get_hash_id(row: dict) -> str:
+    """Compute the hash_id of a fake record the way a transformer would.
+
+    The string values are converted back to the types a transformer hashes,
+    in the order it hashes them.
+
+    Args:
+        row (dict): A record with string values, as they're written out to our CSV files.
+
+    Returns: A hexdigest string.
+    """
+    data = dict(
+        postal_code=row["postal_code"],
+        company=row["company"],
+        location=row["location"],
+        jobs=int(row["jobs"]) if row["jobs"] else None,
+        is_temporary=BOOLEAN_VALUES[row["is_temporary"]],
+        is_closure=BOOLEAN_VALUES[row["is_closure"]],
+        is_amendment=BOOLEAN_VALUES[row["is_amendment"]],
+        notice_date=row["notice_date"] or None,
+        effective_date=row["effective_date"] or None,
+    )
+    return hashing.get_hash_id(data, utils.WARN_TRANSFORMER_HASH_VERSION)
+
+
+def write_integrated(
+    output_dir: Path,
+    count: int,
+    seed: int = 0,
+    insert_share: float = 0.05,
+    amend_share: float = 0.05,
+) -> typing.Tuple[Path, Path]:
+    """Write out a fake current integrated dataset and a new consolidated dataset.
+
+    Args:
+        output_dir (Path): The directory where the fake files will be written.
+        count (int): The number of records in the current dataset.
+        seed (int): The seed for the random number generator, so runs can be repeated. Default 0.
+        insert_share (float): The number of new records to add, as a share of the current count. Default 0.05.
+        amend_share (float): The share of current records to amend. Default 0.05.
+
+    Returns: A tuple with the Paths to the current integrated file and the new consolidated file.
+    """
+    current_list, new_list, expected = generate_integrated(
+        count, seed, insert_share=insert_share, amend_share=amend_share
+    )
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    current_path = output_dir / "integrated.csv"
+    with open(current_path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, INTEGRATED_FIELDS)
+        writer.writeheader()
+        writer.writerows(current_list)
+
+    new_path = output_dir / "consolidated.csv"
+    with open(new_path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, CONSOLIDATED_FIELDS)
+        writer.writeheader()
+        writer.writerows(new_list)
+
+    logger.debug(
+        f"Wrote {len(current_list):,} current records to {current_path} "
+        f"and {len(new_list):,} new records to {new_path}"
+    )
+    return current_path, new_path
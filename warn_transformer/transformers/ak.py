@@ -36,6 +36,7 @@ class Transformer(BaseTransformer):
         "TBA": None,
         "1 Alaska Worker": 1,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
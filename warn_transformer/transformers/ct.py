@@ -157,6 +157,7 @@ class Transformer(BaseTransformer):
         "113,": 113,
         "Greenwich": None,  # Not my circus, not my monkeys
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
@@ -20,6 +20,7 @@ class Transformer(BaseTransformer):
         # https://www.usatoday.com/story/travel/2020/10/30/disney-world-live-entertainment-shows-dark-covid-19-pandemic/6088586002/
         10903: 10903,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
@@ -52,6 +52,7 @@ class Transformer(BaseTransformer):
         "(1 in ID)": 1,
         "106 (1 in ID)": 1,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
@@ -69,6 +69,7 @@ class Transformer(BaseTransformer):
         "3/27/2026": datetime(2026, 3, 27),
         "3/27/2025": datetime(2025, 3, 27),
     }
+    cache_transform_date = True
 
     def prep_row_list(
         self, row_list: typing.List[typing.Dict]
@@ -82,6 +82,7 @@ class Transformer(BaseTransformer):
         "12/14/26": 121,
         "4/1/26": 45,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
@@ -26,6 +26,7 @@ class Transformer(BaseTransformer):
         "330 remote workers (18 located in Missouri)": 18,
         "Unknown": None,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
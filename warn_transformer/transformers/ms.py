@@ -71,6 +71,7 @@ class Transformer(BaseTransformer):
         "1,000": 1000,
         "TBA": None,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
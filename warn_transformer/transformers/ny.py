@@ -32,6 +32,7 @@ class Transformer(BaseTransformer):
             2026, 12, 31
         ),  # Everything on the state web site begins 2026 and ends 2026.
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
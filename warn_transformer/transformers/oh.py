@@ -90,6 +90,7 @@ class Transformer(BaseTransformer):
         "484 Perm Layoffs/850 Temp Layoffs": 1334,
         "1 remote": 1,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
@@ -225,6 +225,7 @@ class Transformer(BaseTransformer):
         "5 (within PA)": 5,
         "7 -- PA Remote Employees": 7,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
@@ -35,6 +35,7 @@ class Transformer(BaseTransformer):
         "9891 Remote Workers (2 from RI)": 2,
         "1 (Remote worker)": 1,
     }
+    cache_transform_date = True
 
     def transform_company(self, value: str) -> str:
         """Transform a raw company name.
@@ -85,6 +85,7 @@ class Transformer(BaseTransformer):
         "8-28-2026/ 10-30-2026/\n12/31-2026": datetime(2026, 8, 28),
         "Company did not disclose": None,
     }
+    cache_transform_date = True
 
     def transform_date(self, value: str) -> typing.Optional[str]:
         """Transform a raw date string into a date object.
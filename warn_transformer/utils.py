@@ -9,6 +9,9 @@ WARN_TRANSFORMER_OUTPUT_DIR = Path(
     os.environ.get("WARN_TRANSFORMER_OUTPUT_DIR", DEFAULT_WARN_TRANSFORMER_OUTPUT_DIR)
 )
 
+# The version of hash_id to stamp on records. See warn_transformer.hashing for the options.
+WARN_TRANSFORMER_HASH_VERSION = int(os.environ.get("WARN_TRANSFORMER_HASH_VERSION", 1))
+
 
 def get_all_transformers() -> typing.List[str]:
     """Get all the states and territories that have scrapers.